@@ -0,0 +1,143 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import shlex
+import time
+from concurrent.futures import ProcessPoolExecutor
+from emulator import emu_loop
+from cpu import RISCV_CPU
+from memory import Memory, DEFAULT_RESET_ADDR
+from peripherals import Peripherals
+from snapshot import load_snapshot
+
+DEFAULT_MEM_SIZE = 512 * 1024
+BINARY_EXTENSIONS = (".bin", ".elf")
+
+def job_parser():
+    """Options acceptées pour chaque binaire d'un manifeste."""
+    parser = argparse.ArgumentParser(prog="manifest", add_help=False)
+    parser.add_argument("binary_file", type=str)
+    parser.add_argument("--reset-addr", type=lambda x: int(x,0), default=None)
+    parser.add_argument("--mem-size", type=lambda x: int(x,0), default=None)
+    parser.add_argument("--snapshot", type=str, default=None)
+    return parser
+
+def load_jobs(source, reset_addr, mem_size, snapshot=None):
+    """
+    Construit la liste des exécutions à partir d'un répertoire (tous les .bin
+    et .elf), d'un fichier .bin ou .elf seul ou d'un manifeste : une ligne par binaire, par exemple
+        tests/crc.bin --reset-addr 0x100 --mem-size 0x80000
+    Les lignes vides et celles commençant par # sont ignorées. reset_addr None :
+    point d'entrée des exécutables ELF, DEFAULT_RESET_ADDR sinon. Avec snapshot
+    (ou --snapshot sur une ligne), l'exécution démarre depuis l'instantané.
+    """
+    if os.path.isdir(source):
+        return [
+            {"binary_file": os.path.join(source, name), "reset_addr": reset_addr, "mem_size": mem_size, "snapshot": snapshot}
+            for name in sorted(os.listdir(source)) if name.endswith(BINARY_EXTENSIONS)
+        ]
+    if source.endswith(BINARY_EXTENSIONS):
+        return [{"binary_file": source, "reset_addr": reset_addr, "mem_size": mem_size, "snapshot": snapshot}]
+    parser = job_parser()
+    base = os.path.dirname(source)
+    jobs = []
+    with open(source, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            args = parser.parse_args(shlex.split(line))
+            jobs.append({
+                "binary_file": os.path.join(base, args.binary_file),
+                "reset_addr": reset_addr if args.reset_addr is None else args.reset_addr,
+                "mem_size": mem_size if args.mem_size is None else args.mem_size,
+                "snapshot": snapshot if args.snapshot is None else os.path.join(base, args.snapshot),
+            })
+    return jobs
+
+def run_job(job, livrable=3, max_steps=None, machine=None, output=None):
+    """
+    Exécute un binaire ; appelé dans un processus du pool. machine : triplet
+    (cpu, memory, peripherals) remis à zéro à réutiliser (voir server.py),
+    sinon une nouvelle machine est créée. output : flux recevant stdout et
+    stderr au fil de l'exécution (voir server.py) ; par défaut la sortie est
+    rendue dans le résultat.
+    """
+    if machine is None:
+        machine = RISCV_CPU(), Memory(job["mem_size"]), Peripherals()
+    cpu, memory, peripherals = machine
+    stream = io.StringIO() if output is None else output
+    result_stack = []
+    exit_reason = "EBREAK"
+    start = time.perf_counter()
+    reset_addr = job["reset_addr"]
+    try:
+        if job["snapshot"]:
+            load_snapshot(job["snapshot"], cpu, memory, peripherals)
+        else:
+            elf = memory.load_program(job["binary_file"])
+            if reset_addr is None:
+                reset_addr = elf.entry if elf is not None else DEFAULT_RESET_ADDR
+            cpu.set_pc(reset_addr)
+        with contextlib.redirect_stdout(stream), contextlib.redirect_stderr(stream):
+            enable_io = livrable == 4
+            emu_loop(cpu, memory, peripherals, enable_peripherals=enable_io, enable_semihosting=enable_io, max_steps=max_steps, halt_on_error=True, result_stack=result_stack)
+        if max_steps is not None and len(result_stack) >= max_steps:
+            exit_reason = "limit"
+    except MemoryError as e:
+        exit_reason = f"MemoryError: {e}"
+    except Exception as e:
+        exit_reason = f"{type(e).__name__}: {e}"
+    wall_time = time.perf_counter() - start
+    return {
+        "binary_file": job["binary_file"],
+        "reset_addr": reset_addr,
+        "mem_size": job["mem_size"],
+        "exit_reason": exit_reason,
+        "instructions": len(result_stack) + (exit_reason == "EBREAK"),
+        "wall_time": wall_time,
+        "pc": cpu.get_pc(),
+        "output": stream.getvalue() if output is None else "",
+        "result_stack": result_stack,
+    }
+
+def run_batch(jobs, workers=None, livrable=3, max_steps=None):
+    """Répartit les exécutions sur un pool de processus ; les résultats gardent l'ordre des jobs."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, job, livrable, max_steps) for job in jobs]
+        return [future.result() for future in futures]
+
+def write_report(results, report):
+    if report.endswith(".csv"):
+        with open(report, "w", newline='') as csvfile:
+            csvwriter = csv.writer(csvfile)
+            csvwriter.writerow(["binary_file", "reset_addr", "mem_size", "exit_reason", "instructions", "wall_time", "result_stack"])
+            for r in results:
+                csvwriter.writerow([r["binary_file"], f"{r['reset_addr']:#x}" if r["reset_addr"] is not None else "", r["mem_size"], r["exit_reason"], r["instructions"], f"{r['wall_time']:.6f}", " ".join(str(v) for v in r["result_stack"])])
+    else:
+        with open(report, "w") as f:
+            json.dump(results, f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Exécution en lot de binaires RISC-V")
+    parser.add_argument("source", type=str, help="Répertoire de fichiers .bin/.elf ou manifeste (une ligne par binaire)")
+    parser.add_argument("--reset-addr", type=lambda x: int(x,0), default=None, help="Adresse de reset par défaut (défaut : point d'entrée ELF, 0x100 pour un binaire brut)")
+    parser.add_argument("--mem-size", type=lambda x: int(x,0), default=DEFAULT_MEM_SIZE, help="Taille de la mémoire par défaut en octets (défaut : 512KB)")
+    parser.add_argument("--snapshot", type=str, default=None, help="Instantané de départ commun (voir main.py --save-snapshot)")
+    parser.add_argument("--livrable", type=int, choices=[3, 4], default=3, help="Livrable émulé (défaut : 3)")
+    parser.add_argument("--max-steps", type=int, default=None, help="Nombre maximal d'instructions par binaire")
+    parser.add_argument("--jobs", type=int, default=None, help="Nombre de processus (défaut : nombre de cœurs)")
+    parser.add_argument("--report", type=str, default="report.json", help="Fichier de rapport .json ou .csv (défaut : report.json)")
+    args = parser.parse_args()
+
+    jobs = load_jobs(args.source, args.reset_addr, args.mem_size, args.snapshot)
+    results = run_batch(jobs, workers=args.jobs, livrable=args.livrable, max_steps=args.max_steps)
+    write_report(results, args.report)
+    for r in results:
+        print(f"{r['binary_file']}: {r['exit_reason']}, {r['instructions']} instructions, {r['wall_time']:.3f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from emulator import emu_loop
+from cpu import RISCV_CPU
+from decoder import encode_r, encode_i, encode_s, encode_b, encode_j, encode_lui
+from memory import Memory
+from peripherals import Peripherals
+from translator import BlockTranslator
+
+RESET_ADDR = 0x100
+MEM_SIZE = 512 * 1024
+DATA_ADDR = 0x10000  # Zone de données des micro-noyaux
+SAMPLE_BINARIES = ("crc", "md5", "hello", "hello_world")
+KERNELS = ("alu", "loadstore", "branch", "muldiv")
+MODES = ("interp", "translate")
+DEFAULT_ITERATIONS = 16384  # Itérations de la boucle des micro-noyaux (multiple de 4096, chargé par LUI)
+
+# Sauts des micro-noyaux (les autres instructions sont encodées par decoder.py).
+# Les sauts suivent la sémantique de l'émulateur : emu_loop ajoute 4 au PC
+# fixé par BRANCH/JAL, la cible d'un saut en pc est donc pc + imm + 4, et un
+# BRANCH non pris reprend en pc + 8 (l'instruction suivante est sautée).
+# Les BRANCH ne sont utilisés que vers l'avant et JAL pour revenir en arrière.
+def encode_beq(pc, target, rs1, rs2):
+    return encode_b(target - pc - 4, rs2, rs1, 0b000)
+
+def encode_jal(pc, target, rd=0):
+    return encode_j(target - pc - 4, rd)
+
+EBREAK = 0x00100073
+NOP = 0x00000013  # addi x0, x0, 0
+
+def assemble(words):
+    """
+    Assemble une liste d'instructions placées à partir de RESET_ADDR.
+    Chaque élément est un mot ou une fonction (pc, labels) -> mot pour les
+    sauts ; les chaînes définissent une étiquette à la position courante.
+    """
+    labels = {}
+    pc = RESET_ADDR
+    for word in words:
+        if isinstance(word, str):
+            labels[word] = pc
+        else:
+            pc += 4
+    code = []
+    pc = RESET_ADDR
+    for word in words:
+        if isinstance(word, str):
+            continue
+        code.append(word(pc, labels) if callable(word) else word)
+        pc += 4
+    return struct.pack(f"<{len(code)}I", *code)
+
+def beq(rs1, rs2, label):
+    return lambda pc, labels: encode_beq(pc, labels[label], rs1, rs2)
+
+def jal(label):
+    return lambda pc, labels: encode_jal(pc, labels[label])
+
+def kernel_alu(iterations):
+    """Boucle d'opérations arithmétiques et logiques sur registres."""
+    return assemble([
+        encode_lui(2, iterations >> 12),
+        "loop",
+        encode_i(1, 1, 0b000, 1),  # addi x1, x1, 1
+        encode_i(7, 1, 0b100, 5),  # xori x5, x1, 7
+        encode_r(0, 1, 5, 0b110, 6),  # or x6, x5, x1
+        encode_r(0, 5, 6, 0b111, 7),  # and x7, x6, x5
+        encode_r(0, 1, 7, 0b000, 8),  # add x8, x7, x1
+        encode_r(0b0100000, 5, 8, 0b000, 9),  # sub x9, x8, x5
+        encode_i(3, 1, 0b001, 10),  # slli x10, x1, 3
+        beq(1, 2, "exit"),
+        NOP,  # Sautée quand le branchement n'est pas pris
+        jal("loop"),
+        "exit",
+        EBREAK,
+    ])
+
+def kernel_loadstore(iterations):
+    """Parcours séquentiel d'un tableau : écritures et relectures de mots."""
+    return assemble([
+        encode_lui(2, iterations >> 12),
+        encode_lui(3, DATA_ADDR >> 12),
+        "loop",
+        encode_i(1, 1, 0b000, 1),  # addi x1, x1, 1
+        encode_s(0, 1, 3),  # sw x1, 0(x3)
+        encode_i(0, 3, 0b010, 4, 0b0000011),  # lw x4, 0(x3)
+        encode_s(4, 4, 3),  # sw x4, 4(x3)
+        encode_i(4, 3, 0b010, 5, 0b0000011),  # lw x5, 4(x3)
+        encode_i(8, 3, 0b000, 3),  # addi x3, x3, 8
+        beq(1, 2, "exit"),
+        NOP,  # Sautée quand le branchement n'est pas pris
+        jal("loop"),
+        "exit",
+        EBREAK,
+    ])
+
+def kernel_branch(iterations):
+    """Branchements conditionnels pris une fois sur deux et une fois sur quatre."""
+    return assemble([
+        encode_lui(2, iterations >> 12),
+        "loop",
+        encode_i(1, 1, 0b000, 1),  # addi x1, x1, 1
+        encode_i(1, 1, 0b111, 6),  # andi x6, x1, 1
+        beq(6, 0, "even"),
+        NOP,
+        encode_i(1, 7, 0b000, 7),  # addi x7, x7, 1
+        jal("quarter"),
+        "even",
+        encode_i(1, 9, 0b000, 9),  # addi x9, x9, 1
+        "quarter",
+        encode_i(2, 1, 0b111, 8),  # andi x8, x1, 2
+        beq(8, 0, "next"),
+        NOP,
+        encode_i(1, 10, 0b000, 10),  # addi x10, x10, 1
+        "next",
+        beq(1, 2, "exit"),
+        NOP,
+        jal("loop"),
+        "exit",
+        EBREAK,
+    ])
+
+def kernel_muldiv(iterations):
+    """Multiplications et divisions de l'extension M."""
+    return assemble([
+        encode_lui(2, iterations >> 12),
+        encode_lui(3, 0x9E377),
+        "loop",
+        encode_i(1, 1, 0b000, 1),  # addi x1, x1, 1
+        encode_r(1, 3, 1, 0b000, 5),  # mul x5, x1, x3
+        encode_r(1, 5, 3, 0b001, 6),  # mulh x6, x3, x5
+        encode_r(1, 1, 5, 0b101, 7),  # divu x7, x5, x1
+        encode_r(1, 1, 6, 0b110, 8),  # rem x8, x6, x1
+        encode_r(1, 8, 7, 0b100, 9),  # div x9, x7, x8
+        beq(1, 2, "exit"),
+        NOP,
+        jal("loop"),
+        "exit",
+        EBREAK,
+    ])
+
+def kernel_mem_size(name, iterations):
+    if name == "loadstore":
+        return max(MEM_SIZE, DATA_ADDR + 8 * iterations + 8)
+    return MEM_SIZE
+
+class CountingResults:
+    """Collecteur qui ne fait que compter les résultats (voir results.py)."""
+    def __init__(self):
+        self.count = 0
+
+    def append(self, value):
+        self.count += 1
+
+    def extend(self, values):
+        self.count += len(values)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(())
+
+def setup_machine(name, iterations):
+    """Crée une machine prête à exécuter le binaire d'exemple ou le micro-noyau name."""
+    cpu = RISCV_CPU()
+    if name in KERNELS:
+        memory = Memory(kernel_mem_size(name, iterations))
+        memory.write_bytes(RESET_ADDR, globals()[f"kernel_{name}"](iterations))
+    else:
+        memory = Memory(MEM_SIZE)
+        memory.load_program(os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", f"{name}.bin"))
+    cpu.set_pc(RESET_ADDR)
+    return cpu, memory
+
+def run_once(name, mode, iterations, max_steps):
+    """Une exécution chronométrée ; retourne (instructions, secondes, raison de l'arrêt)."""
+    cpu, memory = setup_machine(name, iterations)
+    peripherals = Peripherals(flush_policy="size")
+    translator = BlockTranslator(memory) if mode == "translate" else None
+    results = CountingResults()
+    exit_reason = "EBREAK"
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        start = time.perf_counter()
+        try:
+            emu_loop(cpu, memory, peripherals, translator=translator, max_steps=max_steps, halt_on_error=True, result_stack=results)
+        except MemoryError as e:
+            exit_reason = f"MemoryError: {e}"
+        elapsed = time.perf_counter() - start
+    if translator is not None:
+        translator.close()
+    if max_steps is not None and len(results) >= max_steps:
+        exit_reason = "limit"
+    return len(results) + (exit_reason == "EBREAK"), elapsed, exit_reason
+
+def run_benchmark(name, mode, iterations=DEFAULT_ITERATIONS, max_steps=None, repeat=3, min_time=0.2):
+    """
+    Exécute name au moins repeat fois et jusqu'à min_time secondes cumulées ;
+    appelé dans un processus neuf pour que le pic de mémoire lui soit propre.
+    """
+    times = []
+    instructions = 0
+    exit_reason = None
+    while len(times) < repeat or sum(times) < min_time:
+        instructions, elapsed, exit_reason = run_once(name, mode, iterations, max_steps)
+        times.append(elapsed)
+    best = min(times)
+    return {
+        "name": name,
+        "mode": mode,
+        "instructions": instructions,
+        "exit_reason": exit_reason,
+        "runs": len(times),
+        "best_s": best,
+        "mean_s": sum(times) / len(times),
+        "mips": instructions / best / 1e6 if best else None,
+        "ns_per_instruction": best * 1e9 / instructions if instructions else None,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+def run_suite(names, modes, iterations=DEFAULT_ITERATIONS, max_steps=None, repeat=3, min_time=0.2):
+    """Exécute chaque (benchmark, mode) l'un après l'autre, chacun dans un processus dédié."""
+    results = []
+    for name in names:
+        for mode in modes:
+            with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+                results.append(pool.submit(run_benchmark, name, mode, iterations, max_steps, repeat, min_time).result())
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "iterations": iterations,
+        "results": results,
+    }
+
+def compare(baseline, current, threshold=0.05):
+    """
+    Compare deux rapports ; retourne la liste des régressions : MIPS en baisse
+    ou pic de mémoire en hausse de plus de threshold (fraction).
+    """
+    previous = {(r["name"], r["mode"]): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        old = previous.get((r["name"], r["mode"]))
+        if old is None:
+            continue
+        if old["mips"] and r["mips"] is not None and r["mips"] < old["mips"] * (1 - threshold):
+            regressions.append({"name": r["name"], "mode": r["mode"], "metric": "mips", "before": old["mips"], "after": r["mips"]})
+        if r["peak_rss_kb"] > old["peak_rss_kb"] * (1 + threshold):
+            regressions.append({"name": r["name"], "mode": r["mode"], "metric": "peak_rss_kb", "before": old["peak_rss_kb"], "after": r["peak_rss_kb"]})
+    return regressions
+
+def print_report(report, baseline=None):
+    previous = {(r["name"], r["mode"]): r for r in baseline["results"]} if baseline else {}
+    print(f"{'benchmark':<12} {'mode':<10} {'instructions':>12} {'MIPS':>8} {'ns/inst':>9} {'RSS (Ko)':>9}  arrêt")
+    for r in report["results"]:
+        line = f"{r['name']:<12} {r['mode']:<10} {r['instructions']:>12} {r['mips']:>8.3f} {r['ns_per_instruction']:>9.0f} {r['peak_rss_kb']:>9}  {r['exit_reason']}"
+        old = previous.get((r["name"], r["mode"]))
+        if old is not None and old["mips"]:
+            line += f"  ({100 * (r['mips'] / old['mips'] - 1):+.1f}% MIPS)"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesure des performances de l'émulateur (MIPS, ns par instruction, pic de mémoire)")
+    parser.add_argument("benchmarks", nargs="*", default=list(SAMPLE_BINARIES + KERNELS), help=f"Benchmarks à exécuter (défaut : {' '.join(SAMPLE_BINARIES + KERNELS)})")
+    parser.add_argument("--mode", choices=MODES + ("all",), default="all", help="Interpréteur, traduction par blocs ou les deux (défaut : all)")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help=f"Itérations des micro-noyaux, multiple de 4096 (défaut : {DEFAULT_ITERATIONS})")
+    parser.add_argument("--max-steps", type=int, default=None, help="Nombre maximal d'instructions par exécution")
+    parser.add_argument("--repeat", type=int, default=3, help="Nombre minimal d'exécutions par benchmark (défaut : 3)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Durée cumulée minimale par benchmark en secondes (défaut : 0.2)")
+    parser.add_argument("--output", type=str, default="benchmark.json", help="Fichier JSON des résultats (défaut : benchmark.json)")
+    parser.add_argument("--compare", type=str, default=None, metavar="FICHIER", help="Rapport JSON de référence à comparer")
+    parser.add_argument("--threshold", type=float, default=0.05, help="Écart signalé comme régression (défaut : 0.05, soit 5%%)")
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in SAMPLE_BINARIES + KERNELS:
+            parser.error(f"benchmark inconnu : {name}")
+    if args.iterations <= 0 or args.iterations % 4096:
+        parser.error("--iterations doit être un multiple de 4096")
+    modes = MODES if args.mode == "all" else (args.mode,)
+
+    report = run_suite(args.benchmarks, modes, args.iterations, args.max_steps, args.repeat, args.min_time)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if baseline is not None:
+        regressions = compare(baseline, report, args.threshold)
+        for r in regressions:
+            print(f"RÉGRESSION {r['name']} ({r['mode']}) : {r['metric']} {r['before']:.6g} -> {r['after']:.6g}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
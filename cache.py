@@ -0,0 +1,259 @@
+import json
+from array import array
+from emulator import Hook, exec_load, exec_store
+
+REPLACEMENT_POLICIES = ("lru", "plru")
+WRITE_POLICIES = ("write-back", "write-through")
+ACCESS_SIZE = 4  # LOAD et STORE accèdent toujours à 4 octets
+
+class Cache:
+    """
+    Cache associatif par ensembles.
+    Les étiquettes (numéro de ligne, -1 si invalide), les bits dirty et l'état
+    de remplacement sont rangés dans des tableaux plats indexés par
+    ensemble * assoc + voie : une recherche est un array.index sur la tranche
+    de l'ensemble.
+    - lru : horodatage du dernier accès à chaque voie ;
+    - plru : arbre binaire de assoc - 1 bits par ensemble (assoc puissance de 2).
+    write-back : écriture allouée dans le cache, ligne écrite au niveau suivant
+    quand elle est évincée. write-through : chaque écriture est transmise au
+    niveau suivant (sans allocation en cas d'échec), hors du chemin critique.
+    next_level : cache suivant ou None pour la mémoire principale.
+    """
+    def __init__(self, name, size, assoc, line_size=64, replacement="lru", write_policy="write-back", latency=1, next_level=None, memory_latency=100):
+        if replacement not in REPLACEMENT_POLICIES:
+            raise ValueError(f"Politique de remplacement inconnue : {replacement}")
+        if write_policy not in WRITE_POLICIES:
+            raise ValueError(f"Politique d'écriture inconnue : {write_policy}")
+        sets = size // (assoc * line_size)
+        if sets <= 0 or sets & (sets - 1) or line_size & (line_size - 1):
+            raise ValueError(f"{name} : le nombre d'ensembles et la taille de ligne doivent être des puissances de 2")
+        if replacement == "plru" and (assoc & (assoc - 1) or assoc > 32):
+            raise ValueError(f"{name} : plru demande une associativité puissance de 2 (32 au plus)")
+        self.name = name
+        self.size = size
+        self.assoc = assoc
+        self.line_size = line_size
+        self.line_shift = line_size.bit_length() - 1
+        self.sets = sets
+        self.set_mask = sets - 1
+        self.replacement = replacement
+        self.lru = replacement == "lru"
+        self.write_back = write_policy == "write-back"
+        self.latency = latency
+        self.next_level = next_level
+        self.memory_latency = memory_latency
+        self.tags = array('q', [-1]) * (sets * assoc)
+        self.dirty = bytearray(sets * assoc)
+        if self.lru:
+            self.stamps = array('Q', bytes(8 * sets * assoc))
+            self.clock = 0
+        else:
+            self.tree = array('I', bytes(4 * sets))
+        self.hits = 0
+        self.misses = 0
+        self.writebacks = 0
+        self.total_latency = 0
+        self.miss_pcs = {}  # PC -> nombre d'échecs provoqués
+
+    def next_access(self, address, is_write, pc):
+        if self.next_level is None:
+            return self.memory_latency
+        return self.next_level.access(address, is_write, pc)
+
+    def access(self, address, is_write, pc):
+        """Accès à la ligne contenant address ; retourne la latence en cycles."""
+        line = address >> self.line_shift
+        base = (line & self.set_mask) * self.assoc
+        try:
+            slot = self.tags.index(line, base, base + self.assoc)
+        except ValueError:
+            slot = -1
+        latency = self.latency
+        if slot >= 0:
+            self.hits += 1
+            if self.lru:
+                self.clock += 1
+                self.stamps[slot] = self.clock
+            else:
+                self.touch(base, slot)
+            if is_write:
+                if self.write_back:
+                    self.dirty[slot] = 1
+                else:
+                    self.next_access(address, True, pc)  # Transmise via le tampon d'écriture
+        else:
+            self.misses += 1
+            self.miss_pcs[pc] = self.miss_pcs.get(pc, 0) + 1
+            if is_write and not self.write_back:
+                self.next_access(address, True, pc)
+            else:
+                latency += self.next_access(address, False, pc)
+                slot = self.victim(base)
+                if self.dirty[slot]:
+                    self.writebacks += 1
+                    self.next_access(self.tags[slot] << self.line_shift, True, pc)
+                self.tags[slot] = line
+                self.dirty[slot] = is_write
+                self.touch(base, slot)
+        self.total_latency += latency
+        return latency
+
+    def touch(self, base, slot):
+        if self.lru:
+            self.clock += 1
+            self.stamps[slot] = self.clock
+        else:
+            # Chaque nœud traversé désigne la moitié opposée à la voie utilisée
+            way = slot - base
+            set_index = base // self.assoc
+            bits = self.tree[set_index]
+            node = 0
+            span = self.assoc >> 1
+            while span:
+                right = way & span
+                if right:
+                    bits &= ~(1 << node)
+                    node = 2 * node + 2
+                else:
+                    bits |= 1 << node
+                    node = 2 * node + 1
+                span >>= 1
+            self.tree[set_index] = bits
+
+    def victim(self, base):
+        """Voie à remplacer dans l'ensemble commençant en base (une voie invalide en priorité)."""
+        try:
+            return self.tags.index(-1, base, base + self.assoc)
+        except ValueError:
+            pass
+        if self.lru:
+            stamps = self.stamps[base:base + self.assoc]
+            return base + stamps.index(min(stamps))
+        bits = self.tree[base // self.assoc]
+        node = 0
+        way = 0
+        span = self.assoc >> 1
+        while span:
+            if bits & (1 << node):
+                way |= span
+                node = 2 * node + 2
+            else:
+                node = 2 * node + 1
+            span >>= 1
+        return base + way
+
+    def report(self, top=20):
+        accesses = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": self.size,
+            "assoc": self.assoc,
+            "line_size": self.line_size,
+            "replacement": self.replacement,
+            "write_policy": "write-back" if self.write_back else "write-through",
+            "accesses": accesses,
+            "hits": self.hits,
+            "misses": self.misses,
+            "miss_rate": self.misses / accesses if accesses else 0.0,
+            "writebacks": self.writebacks,
+            "amat": self.total_latency / accesses if accesses else 0.0,
+            "miss_pcs": [
+                {"pc": pc, "misses": count}
+                for pc, count in sorted(self.miss_pcs.items(), key=lambda item: item[1], reverse=True)[:top]
+            ],
+        }
+
+DEFAULT_CONFIG = {
+    "l1i": {"size": 16384, "assoc": 4, "line_size": 64, "replacement": "lru", "latency": 1},
+    "l1d": {"size": 16384, "assoc": 4, "line_size": 64, "replacement": "lru", "write_policy": "write-back", "latency": 1},
+    "l2": {"size": 262144, "assoc": 8, "line_size": 64, "replacement": "plru", "write_policy": "write-back", "latency": 10},
+    "memory_latency": 100,
+}
+
+class CacheHierarchy(Hook):
+    """
+    Caches L1I et L1D séparés, L2 commun facultatif, puis la mémoire principale.
+    Hook de l'interpréteur : chaque instruction exécutée est chargée depuis L1I et
+    chaque LOAD/STORE accède à L1D ; les valeurs lues et écrites restent
+    celles de Memory, les caches ne modélisent que le temps d'accès.
+    """
+    def __init__(self, config=None):
+        config = dict(DEFAULT_CONFIG if config is None else config)
+        self.config = config
+        memory_latency = config.get("memory_latency", DEFAULT_CONFIG["memory_latency"])
+        self.l2 = Cache("L2", memory_latency=memory_latency, **config["l2"]) if config.get("l2") else None
+        self.l1i = Cache("L1I", next_level=self.l2, memory_latency=memory_latency, **config["l1i"])
+        self.l1d = Cache("L1D", next_level=self.l2, memory_latency=memory_latency, **config["l1d"])
+        self.levels = [cache for cache in (self.l1i, self.l1d, self.l2) if cache is not None]
+
+    @classmethod
+    def load(cls, path):
+        """Configuration JSON de la forme DEFAULT_CONFIG ; les clés absentes gardent leur valeur par défaut."""
+        with open(path, "r") as f:
+            values = json.load(f)
+        config = {key: (dict(value) if isinstance(value, dict) else value) for key, value in DEFAULT_CONFIG.items()}
+        for key, value in values.items():
+            if isinstance(value, dict) and isinstance(config.get(key), dict):
+                config[key].update(value)
+            else:
+                config[key] = value
+        return cls(config)
+
+    def data_access(self, address, is_write, pc):
+        l1d = self.l1d
+        latency = l1d.access(address, is_write, pc)
+        if (address & (l1d.line_size - 1)) + ACCESS_SIZE > l1d.line_size:  # Accès à cheval sur deux lignes
+            latency = max(latency, l1d.access(address + ACCESS_SIZE - 1, is_write, pc))
+        return latency
+
+    def begin(self, cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks):
+        self.regs = cpu.regs
+        self.last_line = -1
+        self.repeated = 0  # Chargements dans la même ligne que le précédent : succès sans recherche
+
+    def before(self, pc, entry):
+        l1i = self.l1i
+        line = pc >> l1i.line_shift
+        if line == self.last_line:
+            self.repeated += 1
+        else:
+            l1i.access(pc, False, pc)
+            self.last_line = line
+        handler = entry[1]
+        if handler is exec_load:
+            operands = entry[2]
+            self.data_access(self.regs[operands[1]] + operands[2], False, pc)
+        elif handler is exec_store:
+            operands = entry[2]
+            self.data_access(self.regs[operands[0]] + operands[2], True, pc)
+
+    def finish(self):
+        l1i = self.l1i
+        l1i.hits += self.repeated
+        l1i.total_latency += self.repeated * l1i.latency
+        self.repeated = 0
+
+    def report(self, top=20):
+        levels = [cache.report(top) for cache in self.levels]
+        instructions = self.l1i.hits + self.l1i.misses
+        data = self.l1d.hits + self.l1d.misses
+        return {
+            "config": self.config,
+            "levels": levels,
+            "amat": (self.l1i.total_latency + self.l1d.total_latency) / (instructions + data) if instructions + data else 0.0,
+        }
+
+    def print_report(self, top=10):
+        report = self.report(top)
+        print("---CACHES---")
+        for level in report["levels"]:
+            print(f"{level['name']} ({level['size'] // 1024} Ko, {level['assoc']} voies, lignes de {level['line_size']} o, {level['replacement']}, {level['write_policy']}) :")
+            print(f"  accès {level['accesses']}, succès {level['hits']}, échecs {level['misses']} ({100 * level['miss_rate']:.2f}%), réécritures {level['writebacks']}, temps moyen {level['amat']:.2f} cycles")
+            if level["miss_pcs"]:
+                print("  PC provoquant le plus d'échecs : " + ", ".join(f"{spot['pc']:08x} ({spot['misses']})" for spot in level["miss_pcs"]))
+        print(f"Temps moyen d'accès mémoire : {report['amat']:.2f} cycles")
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(100), f, indent=2)
@@ -0,0 +1,170 @@
+import json
+from emulator import Hook, exec_branch, exec_jalr
+
+MAX_DEPTH = 1024  # Au-delà, les appels ne sont plus suivis (récursion non bornée, retours par un autre registre)
+
+class CallGraph(Hook):
+    """
+    Profil par chemin d'appels du programme émulé.
+    Une pile d'appels fantôme suit JAL/JALR : un saut qui écrit x1 (ra) est
+    un appel, JALR x0, 0(x1) (ret) un retour. Les chemins d'appels forment un
+    arbre dont chaque nœud est créé au premier passage ; la pile n'est que
+    l'indice du nœud courant, un appel descend vers un fils (un accès au
+    dictionnaire des fils), un retour remonte au parent. Les instructions
+    exécutées depuis le dernier appel ou retour sont ajoutées au compteur
+    exclusif du nœud courant à chaque changement de nœud ; les compteurs
+    inclusifs et par fonction sont calculés au moment du rapport.
+    """
+    def __init__(self, entry=0, symbols=None, max_depth=MAX_DEPTH):
+        self.symbols = symbols
+        self.max_depth = max_depth
+        self.functions = [entry]  # nœud -> adresse de la fonction appelée
+        self.parents = [-1]
+        self.children = [{}]  # nœud -> {adresse appelée: nœud}
+        self.depths = [0]
+        self.calls = [1]  # nœud -> nombre d'entrées
+        self.exclusive = [0]  # nœud -> instructions exécutées dans la fonction elle-même
+        self.node = 0
+        self.overflow = 0  # Appels non suivis au-delà de max_depth, en attente de leur retour
+        self.executed = 0  # Instructions exécutées depuis le dernier changement de nœud
+
+    def add_node(self, parent, function):
+        node = len(self.functions)
+        self.functions.append(function)
+        self.parents.append(parent)
+        self.children.append({})
+        self.depths.append(self.depths[parent] + 1)
+        self.calls.append(0)
+        self.exclusive.append(0)
+        self.children[parent][function] = node
+        return node
+
+    def begin(self, cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks):
+        self.cpu = cpu
+
+    def before(self, pc, entry):
+        self.executed += 1
+
+    def transfer(self, pc, entry):
+        inst, handler, operands, size = entry
+        if handler is exec_branch:
+            return
+        rd = operands[0]
+        if rd == 1:
+            node = self.node
+            self.exclusive[node] += self.executed
+            self.executed = 0
+            target = self.cpu.pc
+            child = self.children[node].get(target)
+            if child is None:
+                if self.depths[node] >= self.max_depth:
+                    self.overflow += 1
+                    child = node
+                else:
+                    child = self.add_node(node, target)
+            if child != node:
+                self.calls[child] += 1
+                self.node = child
+        elif rd == 0 and handler is exec_jalr and operands[1] == 1 and not operands[2]:
+            self.exclusive[self.node] += self.executed
+            self.executed = 0
+            if self.overflow:
+                self.overflow -= 1
+            elif self.node:
+                self.node = self.parents[self.node]
+
+    def finish(self):
+        self.exclusive[self.node] += self.executed
+        self.executed = 0
+
+    def name(self, address):
+        if self.symbols is not None:
+            return self.symbols.format(address)
+        return f"{address:08x}"
+
+    def inclusive(self):
+        """Compteurs inclusifs par nœud (un fils est toujours créé après son parent)."""
+        inclusive = list(self.exclusive)
+        for node in range(len(inclusive) - 1, 0, -1):
+            inclusive[self.parents[node]] += inclusive[node]
+        return inclusive
+
+    def paths(self):
+        """Nom du chemin d'appels de chaque nœud (fonctions séparées par ';')."""
+        memo = {}
+        names = []
+        for node, function in enumerate(self.functions):
+            name = memo.get(function)
+            if name is None:
+                name = memo[function] = self.name(function)
+            names.append(f"{names[self.parents[node]]};{name}" if node else name)
+        return names
+
+    def function_totals(self, inclusive):
+        """
+        Compteurs par fonction : le compteur inclusif d'une fonction récursive
+        n'ajoute que ses appels les plus externes (pas de double comptage).
+        """
+        totals = {}
+        active = {}  # adresse -> nombre d'occurrences sur le chemin courant
+        stack = [(0, True)]
+        while stack:
+            node, entering = stack.pop()
+            function = self.functions[node]
+            if not entering:
+                active[function] -= 1
+                continue
+            stats = totals.setdefault(function, {"calls": 0, "inclusive": 0, "exclusive": 0})
+            stats["calls"] += self.calls[node]
+            stats["exclusive"] += self.exclusive[node]
+            if not active.get(function):
+                stats["inclusive"] += inclusive[node]
+            active[function] = active.get(function, 0) + 1
+            stack.append((node, False))
+            stack.extend((child, True) for child in self.children[node].values())
+        return totals
+
+    def report(self, top=20):
+        inclusive = self.inclusive()
+        paths = self.paths()
+        total = inclusive[0]
+        functions = self.function_totals(inclusive)
+        hot = sorted(range(len(paths)), key=lambda node: inclusive[node], reverse=True)[:top]
+        return {
+            "instructions": total,
+            "paths_count": len(paths),
+            "max_depth": max(self.depths),
+            "untracked_calls": self.overflow,
+            "functions": [
+                {"address": address, "name": self.name(address), **stats}
+                for address, stats in sorted(functions.items(), key=lambda item: item[1]["inclusive"], reverse=True)
+            ],
+            "paths": [
+                {"path": paths[node], "calls": self.calls[node], "inclusive": inclusive[node], "exclusive": self.exclusive[node]}
+                for node in hot
+            ],
+        }
+
+    def print_report(self, top=20):
+        report = self.report(top)
+        total = max(report["instructions"], 1)
+        print("---GRAPHE-APPELS---")
+        print(f"Instructions exécutées : {report['instructions']}, {report['paths_count']} chemins d'appels, profondeur maximale {report['max_depth']}")
+        print("Par fonction (inclusif / exclusif) :")
+        for function in report["functions"][:top]:
+            print(f"  {function['name']:<24} {function['calls']:>10} appels {function['inclusive']:>12} {100 * function['inclusive'] / total:6.2f}% {function['exclusive']:>12} {100 * function['exclusive'] / total:6.2f}%")
+        print("Chemins les plus coûteux (inclusif) :")
+        for path in report["paths"]:
+            print(f"  {path['inclusive']:>12} {100 * path['inclusive'] / total:6.2f}%  {path['path']}")
+
+    def write_folded(self, path):
+        """Piles repliées (une ligne "f1;f2;f3 compteur_exclusif" par chemin), lues par flamegraph.pl, speedscope ou inferno."""
+        paths = self.paths()
+        with open(path, "w") as f:
+            for node, count in enumerate(self.exclusive):
+                if count:
+                    f.write(f"{paths[node]} {count}\n")
+
+    def write_json(self, path, top=100):
+        with open(path, "w") as f:
+            json.dump(self.report(top), f, indent=2)
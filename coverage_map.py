@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+from multiprocessing import shared_memory, resource_tracker
+from decoder import decode_instruction
+from emulator import Hook, exec_branch
+
+DEFAULT_MAP_SIZE = 1 << 16
+LINK_REGISTERS = (1, 5)  # ra et t0 : un saut qui les écrit est un appel
+
+# Classement des compteurs par tranches, comme AFL : 1, 2, 3, 4-7, 8-15,
+# 16-31, 32-127, 128+ deviennent chacun un bit. Appliqué avec bytes.translate.
+BUCKETS = bytes(
+    0 if n == 0 else 1 if n == 1 else 2 if n == 2 else 4 if n == 3 else 8 if n < 8 else 16 if n < 16 else 32 if n < 32 else 64 if n < 128 else 128
+    for n in range(256)
+)
+
+def classify(bitmap):
+    return bytes(bitmap).translate(BUCKETS)
+
+def merge(total, bitmap, classified=False):
+    """
+    Ajoute à total (bytearray, carte classée) la carte classée de bitmap par
+    un ou bit à bit sur des entiers : le coût ne dépend que de la taille de la carte.
+    classified : bitmap est déjà classée (carte écrite par --coverage) et
+    n'est pas classée une seconde fois, BUCKETS n'étant pas idempotent.
+    Retourne le nombre d'octets qui ont gagné au moins un bit (nouvelle couverture).
+    """
+    if len(total) != len(bitmap):
+        raise ValueError("Les cartes de couverture n'ont pas la même taille")
+    old = int.from_bytes(total, "little")
+    new = int.from_bytes(bitmap if classified else classify(bitmap), "little")
+    gained = new & ~old
+    if not gained:
+        return 0
+    total[:] = (old | new).to_bytes(len(total), "little")
+    return sum(1 for byte in gained.to_bytes(len(total), "little") if byte)
+
+class Coverage(Hook):
+    """
+    Couverture des arêtes à la manière d'AFL : chaque transfert de contrôle
+    (BRANCH pris ou non, JAL, JALR) vers target incrémente l'octet
+    h(target) ^ (h(cible précédente) >> 1) d'une carte de taille fixe, h étant
+    un hachage multiplicatif du PC (compteurs saturés à 255). La carte est un
+    bytearray, ou un segment multiprocessing.shared_memory nommé que d'autres
+    processus lisent sans copie et qui n'est pas supprimé à la fin du processus.
+    track_edges : garder aussi les arêtes exactes (PC d'origine, cible) pour le rapport.
+    symbols : SymbolIndex (voir elf.py) nommant les fonctions du rapport.
+    """
+    def __init__(self, size=DEFAULT_MAP_SIZE, shm_name=None, track_edges=False, symbols=None):
+        if size & (size - 1):
+            raise ValueError("La taille de la carte doit être une puissance de 2")
+        self.size = size
+        self.mask = size - 1
+        self.segment = None
+        if shm_name is None:
+            self.bitmap = bytearray(size)
+        else:
+            try:
+                self.segment = shared_memory.SharedMemory(name=shm_name)
+            except FileNotFoundError:
+                self.segment = shared_memory.SharedMemory(name=shm_name, create=True, size=size)
+            # Le segment survit au processus : c'est le pilote qui le supprime
+            resource_tracker.unregister(self.segment._name, "shared_memory")
+            if self.segment.size < size:
+                raise ValueError(f"Le segment {shm_name} fait moins de {size} octets")
+            self.bitmap = self.segment.buf[:size]
+        self.prev = 0
+        self.edges = {} if track_edges else None  # (origine, cible) -> nombre de passages
+        self.calls = set()  # Cibles des appels : débuts de fonctions
+        self.instructions = {}  # PC d'origine -> mot d'instruction
+        self.symbols = symbols
+
+    def clear(self):
+        """Remet la carte à zéro entre deux exécutions (pilote de fuzzing)."""
+        self.bitmap[:] = bytes(self.size)
+        self.prev = 0
+
+    def close(self):
+        if self.segment is not None:
+            self.bitmap.release()
+            self.segment.close()
+            self.segment = None
+
+    def begin(self, cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks):
+        self.cpu = cpu
+
+    def transfer(self, pc, entry):
+        target = self.cpu.pc
+        current = ((target >> 1) * 0x9E3779B1 >> 15) & self.mask
+        index = current ^ self.prev
+        count = self.bitmap[index]
+        if count < 255:
+            self.bitmap[index] = count + 1
+        self.prev = current >> 1
+        edges = self.edges
+        if edges is not None:
+            key = (pc, target)
+            if key in edges:
+                edges[key] += 1
+            else:
+                edges[key] = 1
+                inst = entry[0]
+                self.instructions[pc] = inst
+                if entry[1] is not exec_branch and (inst >> 7) & 0x1F in LINK_REGISTERS:
+                    self.calls.add(target)
+
+    def density(self):
+        return sum(1 for byte in self.bitmap if byte) / self.size
+
+    def write_map(self, path):
+        """Écrit la carte classée de cette exécution ; si path existe, l'y ajoute (voir merge)."""
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                total = bytearray(f.read())
+            gained = merge(total, self.bitmap)
+        else:
+            total = bytearray(classify(self.bitmap))
+            gained = sum(1 for byte in total if byte)
+        with open(path, "wb") as f:
+            f.write(total)
+        return gained
+
+    def report(self, entry=None):
+        """Arêtes exactes groupées par fonction (plus grand début de fonction connu inférieur ou égal à l'origine)."""
+        starts = sorted(self.calls | ({entry} if entry is not None else set()))
+        functions = {}
+        for (source, target), count in sorted((self.edges or {}).items()):
+            start = None
+            for candidate in starts:
+                if candidate > source:
+                    break
+                start = candidate
+            functions.setdefault(start, []).append({
+                "pc": source,
+                "instruction": decode_instruction(self.instructions[source], mode=2),
+                "target": target,
+                "count": count,
+            })
+        return {
+            "map_size": self.size,
+            "density": self.density(),
+            "edges": len(self.edges or {}),
+            "functions": [
+                {"start": start, "name": self.symbols.format(start) if self.symbols is not None and start is not None else None, "edges": edges}
+                for start, edges in sorted(functions.items(), key=lambda item: -1 if item[0] is None else item[0])
+            ],
+        }
+
+    def print_report(self, entry=None):
+        report = self.report(entry)
+        print("---COVERAGE---")
+        print(f"Carte de {report['map_size']} octets, densité {100 * report['density']:.2f}%, {report['edges']} arêtes distinctes")
+        for function in report["functions"]:
+            name = function["name"] or ("?" if function["start"] is None else f"{function['start']:08x}")
+            print(f"  fonction {name} : {len(function['edges'])} arêtes")
+            for edge in function["edges"]:
+                print(f"    {edge['pc']:08x} -> {edge['target']:08x} {edge['count']:>10}  {edge['instruction']}")
+
+    def write_json(self, path, entry=None):
+        with open(path, "w") as f:
+            json.dump(self.report(entry), f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Fusion de cartes de couverture (--coverage)")
+    parser.add_argument("output", type=str, help="Carte cumulée (créée si absente)")
+    parser.add_argument("maps", nargs="+", type=str, help="Cartes brutes à ajouter (compteurs d'un segment --coverage-shm)")
+    parser.add_argument("--classified", action="store_true", help="Les cartes sont déjà classées (écrites par --coverage) : fusion sans nouveau classement")
+    args = parser.parse_args()
+
+    total = None
+    if os.path.exists(args.output):
+        with open(args.output, "rb") as f:
+            total = bytearray(f.read())
+    for path in args.maps:
+        with open(path, "rb") as f:
+            bitmap = f.read()
+        if total is None:
+            total = bytearray(len(bitmap))
+        print(f"{path}: {merge(total, bitmap, args.classified)} nouvelles positions")
+    with open(args.output, "wb") as f:
+        f.write(total)
+    print(f"{args.output}: {sum(1 for byte in total if byte)} positions couvertes sur {len(total)}")
+
+if __name__ == "__main__":
+    main()
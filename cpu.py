@@ -1,7 +1,20 @@
+CSR_MISA = 0x301  # Extensions supportées (écritures ignorées)
+CSR_MHARTID = 0xF14  # Identifiant du hart (lecture seule)
+MISA = (1 << 30) | (1 << 12) | (1 << 8)  # RV32 (MXL = 1), extensions I et M
+
 class RISCV_CPU:
-    def __init__(self):
+    def __init__(self, hartid=0):
         self.regs = [0] * 32  # 32 registres de 32 bits
         self.pc = 0  # Compteur de programme
+        self.hartid = hartid
+        self.csrs = {CSR_MISA: MISA, CSR_MHARTID: hartid}  # Registres de contrôle et d'état
+
+    def has_extension(self, letter):
+        """Vrai si misa indique l'extension letter ("M", "C", ...)."""
+        return bool(self.csrs.get(CSR_MISA, 0) >> (ord(letter) - ord("A")) & 1)
+
+    def enable_extension(self, letter):
+        self.csrs[CSR_MISA] = self.csrs.get(CSR_MISA, 0) | (1 << (ord(letter) - ord("A")))
 
     def set_pc(self, address):
         self.pc = address
@@ -0,0 +1,112 @@
+from memory import PAGE_SHIFT
+from emulator import Hook, exec_load, exec_store
+
+WATCH_KINDS = ("write", "read", "access")
+
+class Debugger(Hook):
+    """
+    Points d'arrêt et de surveillance du mode pas à pas.
+    Les points d'arrêt sont des PC rangés dans un ensemble : le hook ne fait
+    qu'un test d'appartenance par instruction. Les points de surveillance
+    sont indexés par page de 4 Ko ; un LOAD/STORE ne vérifie les intervalles
+    surveillés que si sa page en contient un.
+    """
+    def __init__(self):
+        self.breakpoints = set()
+        self.watchpoints = {}  # adresse -> (fin exclue, type)
+        self.watch_pages = {}  # page -> liste des adresses de début surveillées dans la page
+        self.resume_pc = None  # PC d'arrêt : l'instruction y est exécutée à la reprise
+        self.stop = None  # Description du dernier arrêt
+
+    def armed(self):
+        return bool(self.breakpoints or self.watchpoints)
+
+    def add_breakpoint(self, address):
+        self.breakpoints.add(address)
+
+    def remove_breakpoint(self, address):
+        self.breakpoints.discard(address)
+
+    def add_watchpoint(self, address, length=4, kind="write"):
+        if kind not in WATCH_KINDS:
+            raise ValueError(f"Type de surveillance inconnu : {kind}")
+        self.remove_watchpoint(address)
+        self.watchpoints[address] = (address + length, kind)
+        for page in range(address >> PAGE_SHIFT, ((address + length - 1) >> PAGE_SHIFT) + 1):
+            self.watch_pages.setdefault(page, []).append(address)
+
+    def remove_watchpoint(self, address):
+        watch = self.watchpoints.pop(address, None)
+        if watch is None:
+            return
+        for page in range(address >> PAGE_SHIFT, ((watch[0] - 1) >> PAGE_SHIFT) + 1):
+            starts = self.watch_pages[page]
+            starts.remove(address)
+            if not starts:
+                del self.watch_pages[page]
+
+    def watched(self, address, size, is_write):
+        """Premier point de surveillance touché par l'accès [address, address + size), ou None."""
+        for page in {address >> PAGE_SHIFT, (address + size - 1) >> PAGE_SHIFT}:
+            for start in self.watch_pages.get(page, ()):
+                end, kind = self.watchpoints[start]
+                if start < address + size and address < end and (kind == "access" or (kind == "write") == is_write):
+                    return start
+        return None
+
+    def command(self, parts):
+        """Commandes du mode pas à pas ; retourne False si la commande n'est pas celle du débogueur."""
+        name = parts[0]
+        if name == "break" and len(parts) == 2:
+            self.add_breakpoint(int(parts[1], 16))
+        elif name == "delete" and len(parts) == 2:
+            self.remove_breakpoint(int(parts[1], 16))
+        elif name in ("watch", "rwatch", "awatch") and len(parts) in (2, 3):
+            kind = {"watch": "write", "rwatch": "read", "awatch": "access"}[name]
+            self.add_watchpoint(int(parts[1], 16), int(parts[2], 0) if len(parts) == 3 else 4, kind)
+        elif name == "unwatch" and len(parts) == 2:
+            self.remove_watchpoint(int(parts[1], 16))
+        elif name == "info":
+            for address in sorted(self.breakpoints):
+                print(f"Point d'arrêt : {address:#x}")
+            for address, (end, kind) in sorted(self.watchpoints.items()):
+                print(f"Surveillance ({kind}) : {address:#x}-{end - 1:#x}")
+        else:
+            return False
+        return True
+
+    def begin(self, cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks):
+        self.regs = cpu.regs
+        self.memory = memory
+        self.skip = self.resume_pc
+        self.resume_pc = None
+        self.hit = None
+
+    def before(self, pc, entry):
+        """Arrêt "BREAK" avant l'instruction sur un point d'arrêt ; repère l'accès à un intervalle surveillé."""
+        if pc in self.breakpoints and pc != self.skip:
+            self.stop = f"Point d'arrêt en {pc:#x}"
+            return "BREAK"
+        self.skip = None
+        handler = entry[1]
+        if self.watch_pages and (handler is exec_store or handler is exec_load):
+            operands = entry[2]
+            is_write = handler is exec_store
+            address = self.regs[operands[0] if is_write else operands[1]] + operands[2]
+            if address >> PAGE_SHIFT in self.watch_pages or (address + 3) >> PAGE_SHIFT in self.watch_pages:
+                hit = self.watched(address, 4, is_write)
+                if hit is not None:
+                    self.hit = (hit, address, is_write, self.memory.read(address, 4))
+        return None
+
+    def after(self, pc, entry, result):
+        """Arrêt "BREAK" après l'accès à un intervalle surveillé."""
+        if self.hit is None:
+            return None
+        hit, address, is_write, old = self.hit
+        self.hit = None
+        if is_write:
+            self.stop = f"Surveillance {hit:#x} : écriture en {address:#x} par {pc:#x}, {old:#x} -> {self.memory.read(address, 4):#x}"
+        else:
+            self.stop = f"Surveillance {hit:#x} : lecture en {address:#x} par {pc:#x}, valeur {old:#x}"
+        return "BREAK"
@@ -17,6 +17,20 @@ OPCODES = {
     "SYSTEM": 0b1110011,
 }
 
+# Type d'encodage associé à chaque opcode
+ENCODINGS = {
+    0b0000011: "I",
+    0b0100011: "S",
+    0b1100011: "S_B",
+    0b1100111: "I",
+    0b1101111: "U_J",
+    0b0110111: "U",
+    0b0010111: "U",
+    0b0010011: "I",
+    0b0110011: "R",
+    0b1110011: "I"
+}
+
 def generate_csv(cpu, memory):
     with open('output.csv', 'w', newline='') as csvfile:
         csvwriter = csv.writer(csvfile)
@@ -30,19 +44,7 @@ def generate_csv(cpu, memory):
             pc += 4
 
 def get_encoding(opcode):
-    encoding_map = {
-        0b0000011: "I",
-        0b0100011: "S",
-        0b1100011: "S_B",
-        0b1100111: "I",
-        0b1101111: "U_J",
-        0b0110111: "U",
-        0b0010111: "U",
-        0b0010011: "I",
-        0b0110011: "R",
-        0b1110011: "I"
-    }
-    return encoding_map.get(opcode, "Unknown")
+    return ENCODINGS.get(opcode, "Unknown")
 
 # Fonction pour décoder une instruction RV32I
 def decode_instruction(inst, mode=2):
@@ -139,10 +141,15 @@ def decode_op_imm(inst):
     imm = sign_extend((inst >> 20) & 0xFFF, 12)
     return f"OP_IMM x{rd}, x{rs1}, {imm}"
 
+# Mnémoniques de l'extension M (funct7 = 0b0000001), indexés par funct3
+M_MNEMONICS = ("MUL", "MULH", "MULHSU", "MULHU", "DIV", "DIVU", "REM", "REMU")
+
 def decode_op(inst):
     rd = (inst >> 7) & 0x1F
     rs1 = (inst >> 15) & 0x1F
     rs2 = (inst >> 20) & 0x1F
+    if (inst >> 25) & 0x7F == 0b0000001:
+        return f"{M_MNEMONICS[(inst >> 12) & 0x7]} x{rd}, x{rs1}, x{rs2}"
     return f"OP x{rd}, x{rs1}, x{rs2}"
 
 def decode_system(inst):
@@ -152,4 +159,133 @@ def sign_extend(value, bits):
     """Étend le bit de signe de la valeur donnée."""
     if (value & (1 << (bits - 1))) != 0:
         value -= (1 << bits)
-    return value
\ No newline at end of file
+    return value
+
+# Extension C : instructions de 16 bits (deux bits de poids faible différents de 0b11)
+def instruction_length(parcel):
+    """Longueur en octets de l'instruction dont le premier demi-mot est parcel."""
+    return 4 if parcel & 0b11 == 0b11 else 2
+
+def bits(value, high, low):
+    return (value >> low) & ((1 << (high - low + 1)) - 1)
+
+# Encodage des instructions de 32 bits : les champs sont passés dans leur
+# ordre dans l'instruction, du bit 31 au bit 0 (sauf encode_lui). Les
+# déplacements de encode_b et encode_j sont ceux de la spécification, sans
+# l'ajustement du PC propre à l'émulateur (voir benchmark.encode_beq).
+def encode_r(funct7, rs2, rs1, funct3, rd, opcode=OPCODES["OP"]):
+    return (funct7 << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+
+def encode_i(imm, rs1, funct3, rd, opcode=OPCODES["OP_IMM"]):
+    return ((imm & 0xFFF) << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+
+def encode_s(imm, rs2, rs1, funct3=0b010):
+    return (((imm >> 5) & 0x7F) << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | ((imm & 0x1F) << 7) | OPCODES["STORE"]
+
+def encode_b(imm, rs2, rs1, funct3):
+    return (bits(imm, 12, 12) << 31) | (bits(imm, 10, 5) << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | (bits(imm, 4, 1) << 8) | (bits(imm, 11, 11) << 7) | OPCODES["BRANCH"]
+
+def encode_j(imm, rd=0):
+    return (bits(imm, 20, 20) << 31) | (bits(imm, 10, 1) << 21) | (bits(imm, 11, 11) << 20) | (bits(imm, 19, 12) << 12) | (rd << 7) | OPCODES["JAL"]
+
+def encode_lui(rd, imm):
+    return ((imm & 0xFFFFF) << 12) | (rd << 7) | OPCODES["LUI"]
+
+def compressed_jump_offset(parcel):
+    """Déplacement de C.J/C.JAL : imm[11|4|9:8|10|6|7|3:1|5] dans les bits 12:2."""
+    imm = (bits(parcel, 12, 12) << 11) | (bits(parcel, 11, 11) << 4) | (bits(parcel, 10, 9) << 8) | (bits(parcel, 8, 8) << 10) \
+        | (bits(parcel, 7, 7) << 6) | (bits(parcel, 6, 6) << 7) | (bits(parcel, 5, 3) << 1) | (bits(parcel, 2, 2) << 5)
+    return sign_extend(imm, 12)
+
+def expand_compressed(parcel):
+    """
+    Instruction de 32 bits équivalente à l'instruction compressée parcel (RV32C
+    sans virgule flottante), ou None si parcel est illégale ou réservée.
+    """
+    quadrant = parcel & 0b11
+    funct3 = bits(parcel, 15, 13)
+    rd = bits(parcel, 11, 7)  # rd/rs1 des formats CR et CI
+    rs2 = bits(parcel, 6, 2)
+    rd_ = 8 + bits(parcel, 4, 2)  # rd'/rs2' des formats CIW, CL, CS, CA
+    rs1_ = 8 + bits(parcel, 9, 7)  # rs1'/rd' des formats CL, CS, CA, CB
+    imm6 = sign_extend((bits(parcel, 12, 12) << 5) | bits(parcel, 6, 2), 6)  # Format CI
+    if quadrant == 0b00:
+        offset = (bits(parcel, 12, 10) << 3) | (bits(parcel, 6, 6) << 2) | (bits(parcel, 5, 5) << 6)  # C.LW/C.SW
+        if funct3 == 0b000:  # C.ADDI4SPN
+            imm = (bits(parcel, 12, 11) << 4) | (bits(parcel, 10, 7) << 6) | (bits(parcel, 6, 6) << 2) | (bits(parcel, 5, 5) << 3)
+            return encode_i(imm, 2, 0b000, rd_) if imm else None
+        elif funct3 == 0b010:  # C.LW
+            return encode_i(offset, rs1_, 0b010, rd_, OPCODES["LOAD"])
+        elif funct3 == 0b110:  # C.SW
+            return encode_s(offset, rd_, rs1_)
+    elif quadrant == 0b01:
+        if funct3 == 0b000:  # C.ADDI (C.NOP si rd = 0)
+            return encode_i(imm6, rd, 0b000, rd)
+        elif funct3 == 0b001:  # C.JAL
+            return encode_j(compressed_jump_offset(parcel), 1)
+        elif funct3 == 0b010:  # C.LI
+            return encode_i(imm6, 0, 0b000, rd)
+        elif funct3 == 0b011 and rd == 2:  # C.ADDI16SP
+            imm = (bits(parcel, 12, 12) << 9) | (bits(parcel, 6, 6) << 4) | (bits(parcel, 5, 5) << 6) | (bits(parcel, 4, 3) << 7) | (bits(parcel, 2, 2) << 5)
+            return encode_i(sign_extend(imm, 10), 2, 0b000, 2) if imm else None
+        elif funct3 == 0b011:  # C.LUI
+            return encode_lui(rd, imm6) if imm6 else None
+        elif funct3 == 0b100:
+            funct2 = bits(parcel, 11, 10)
+            if funct2 == 0b00 or funct2 == 0b01:  # C.SRLI/C.SRAI (shamt[5] = 1 réservé en RV32)
+                if bits(parcel, 12, 12):
+                    return None
+                return encode_i(rs2 | (0x400 if funct2 else 0), rs1_, 0b101, rs1_)
+            elif funct2 == 0b10:  # C.ANDI
+                return encode_i(imm6, rs1_, 0b111, rs1_)
+            elif not bits(parcel, 12, 12):  # C.SUB/C.XOR/C.OR/C.AND
+                funct3, funct7 = ((0b000, 0b0100000), (0b100, 0), (0b110, 0), (0b111, 0))[bits(parcel, 6, 5)]
+                return encode_r(funct7, rd_, rs1_, funct3, rs1_)
+        elif funct3 == 0b101:  # C.J
+            return encode_j(compressed_jump_offset(parcel))
+        else:  # C.BEQZ/C.BNEZ
+            imm = (bits(parcel, 12, 12) << 8) | (bits(parcel, 11, 10) << 3) | (bits(parcel, 6, 5) << 6) | (bits(parcel, 4, 3) << 1) | (bits(parcel, 2, 2) << 5)
+            return encode_b(sign_extend(imm, 9), 0, rs1_, funct3 & 0b001)
+    elif quadrant == 0b10:
+        if funct3 == 0b000:  # C.SLLI
+            return None if bits(parcel, 12, 12) else encode_i(rs2, rd, 0b001, rd)
+        elif funct3 == 0b010 and rd:  # C.LWSP
+            offset = (bits(parcel, 12, 12) << 5) | (bits(parcel, 6, 4) << 2) | (bits(parcel, 3, 2) << 6)
+            return encode_i(offset, 2, 0b010, rd, OPCODES["LOAD"])
+        elif funct3 == 0b100:
+            if not bits(parcel, 12, 12):
+                if rs2:  # C.MV
+                    return encode_r(0, rs2, 0, 0b000, rd)
+                return encode_i(0, rd, 0b000, 0, OPCODES["JALR"]) if rd else None  # C.JR
+            elif rs2:  # C.ADD
+                return encode_r(0, rs2, rd, 0b000, rd)
+            elif rd:  # C.JALR
+                return encode_i(0, rd, 0b000, 1, OPCODES["JALR"])
+            return 0x00100073  # C.EBREAK
+        elif funct3 == 0b110:  # C.SWSP
+            offset = (bits(parcel, 12, 9) << 2) | (bits(parcel, 8, 7) << 6)
+            return encode_s(offset, rs2, 2)
+    return None
+
+# Format de chaque instruction compressée, indexé par (quadrant, funct3)
+COMPRESSED_ENCODINGS = {
+    (0b00, 0b000): "CIW", (0b00, 0b010): "CL", (0b00, 0b110): "CS",
+    (0b01, 0b000): "CI", (0b01, 0b001): "CJ", (0b01, 0b010): "CI", (0b01, 0b011): "CI",
+    (0b01, 0b100): "CB", (0b01, 0b101): "CJ", (0b01, 0b110): "CB", (0b01, 0b111): "CB",
+    (0b10, 0b000): "CI", (0b10, 0b010): "CI", (0b10, 0b100): "CR", (0b10, 0b110): "CSS",
+}
+
+def get_compressed_encoding(parcel):
+    if expand_compressed(parcel) is None:
+        return "Unknown"
+    encoding = COMPRESSED_ENCODINGS[(parcel & 0b11, bits(parcel, 15, 13))]
+    if encoding == "CB" and bits(parcel, 11, 10) == 0b11 and bits(parcel, 15, 13) == 0b100:
+        return "CA"  # C.SUB/C.XOR/C.OR/C.AND
+    return encoding
+
+def decode_compressed(parcel):
+    """Désassemble une instruction compressée sous la forme de son équivalent de 32 bits préfixé par C."""
+    inst = expand_compressed(parcel)
+    if inst is None:
+        return "Instruction inconnue"
+    return f"C.{decode_instruction(inst, mode=2)}"
@@ -0,0 +1,186 @@
+import mmap
+import os
+import sys
+from array import array
+from decoder import ENCODINGS, decode_instruction, decode_compressed, get_compressed_encoding
+
+try:
+    import numpy as np
+except ImportError:  # numpy est optionnel : repli sur le module array
+    np = None
+
+CHUNK_WORDS = 1 << 16  # Nombre de mots traités par passe
+MEMO_LIMIT = 1 << 20  # Nombre maximal de désassemblages gardés en cache
+
+# Encodage de chaque opcode (table indexée par les 7 bits de poids faible)
+ENCODING_TABLE = [ENCODINGS.get(opcode, "Unknown") for opcode in range(128)]
+
+if np is not None:
+    HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+    HEX_SHIFTS = np.arange(28, -4, -4, dtype=np.uint32)
+
+def iter_chunks(binary_file, chunk_words=CHUNK_WORDS):
+    """
+    Parcourt le fichier projeté en mémoire par blocs de mots de 32 bits.
+    Génère des couples (offset du premier mot, mots) ; les octets en fin de
+    fichier qui ne forment pas un mot complet sont ignorés.
+    """
+    count = os.path.getsize(binary_file) // 4
+    if count == 0:
+        return
+    if np is not None:
+        words = np.memmap(binary_file, dtype='<u4', mode='r', shape=(count,))
+        for start in range(0, count, chunk_words):
+            yield start * 4, words[start:start + chunk_words]
+        return
+    with open(binary_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for start in range(0, count, chunk_words):
+            chunk = array('I', mm[start * 4:min(start + chunk_words, count) * 4])
+            if sys.byteorder == 'big':
+                chunk.byteswap()
+            yield start * 4, chunk
+
+def disassembly_table(values, memo):
+    """Désassemble chaque valeur de mot une seule fois (memo : valeur -> texte)."""
+    if len(memo) > MEMO_LIMIT:
+        memo.clear()
+    texts = []
+    for value in values:
+        text = memo.get(value)
+        if text is None:
+            text = memo[value] = decode_instruction(value, mode=2)
+        texts.append(text)
+    return texts
+
+def hex_columns(values):
+    """(n,) entiers 32 bits -> (n, 8) caractères hexadécimaux ASCII."""
+    return HEX_DIGITS[(values.astype(np.uint32)[:, None] >> HEX_SHIFTS) & 0xF]
+
+def join_rows(prefix, tails, index):
+    """
+    Assemble des lignes de longueur variable sans boucle Python par ligne :
+    ligne i = prefix[i] (largeur fixe) + tails[index[i]].
+    """
+    count, width = prefix.shape
+    encoded = [tail.encode() for tail in tails]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    tail_starts = np.zeros(len(encoded), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=tail_starts[1:])
+    tail_lengths = lengths[index]
+    starts = np.zeros(count, dtype=np.int64)
+    np.cumsum(width + tail_lengths[:-1], out=starts[1:])
+    out = np.empty(int(starts[-1] + width + tail_lengths[-1]), dtype=np.uint8)
+    out[starts[:, None] + np.arange(width)] = prefix
+    columns = np.arange(lengths.max())
+    mask = columns < tail_lengths[:, None]
+    out[(starts[:, None] + width + columns)[mask]] = blob[(tail_starts[index][:, None] + columns)[mask]]
+    return out.tobytes().decode()
+
+def separator(count, text):
+    return np.broadcast_to(np.frombuffer(text.encode(), dtype=np.uint8), (count, len(text)))
+
+def csv_chunk(offset, words):
+    count = len(words)
+    if np is not None and offset + 4 * count <= 0xFFFFFFFF:
+        offsets = np.arange(offset, offset + 4 * count, 4, dtype=np.uint32)
+        opcodes = words & 0x7F
+        prefix = np.concatenate([
+            hex_columns(offsets), separator(count, ","),
+            hex_columns(words), separator(count, ","),
+            hex_columns(opcodes), separator(count, ","),
+        ], axis=1)
+        return join_rows(prefix, [encoding + "\r\n" for encoding in ENCODING_TABLE], opcodes)
+    rows = []
+    for i, value in enumerate(words.tolist()):
+        rows += (offset + 4 * i, value, value & 0x7F, ENCODING_TABLE[value & 0x7F])
+    return ("%08x,%08x,%08x,%s\r\n" * count) % tuple(rows)
+
+def listing_chunk(offset, words, memo):
+    count = len(words)
+    if np is not None and offset + 4 * count <= 0xFFFFFFFF:
+        values, inverse = np.unique(words, return_inverse=True)
+        texts = disassembly_table(values.tolist(), memo)
+        offsets = np.arange(offset, offset + 4 * count, 4, dtype=np.uint32)
+        prefix = np.concatenate([hex_columns(offsets), separator(count, ": ")], axis=1)
+        return join_rows(prefix, [text + "\n" for text in texts], inverse.reshape(-1))
+    rows = []
+    for i, text in enumerate(disassembly_table(words.tolist(), memo)):
+        rows += (offset + 4 * i, text)
+    return ("%08x: %s\n" * count) % tuple(rows)
+
+def iter_disassembly(binary_file, with_csv=True, with_listing=True, chunk_words=CHUNK_WORDS):
+    """
+    Désassemble le fichier en une seule passe et génère, pour chaque bloc de
+    chunk_words instructions, un couple (lignes CSV, lignes du listing).
+    Une partie vaut None si elle n'est pas demandée.
+    """
+    memo = {}
+    for offset, words in iter_chunks(binary_file, chunk_words):
+        csv_text = csv_chunk(offset, words) if with_csv else None
+        listing_text = listing_chunk(offset, words, memo) if with_listing else None
+        yield csv_text, listing_text
+
+def describe_parcel(value):
+    """(opcode, encoding, texte) d'une instruction de 16 ou 32 bits ; l'opcode d'une instruction compressée est son quadrant."""
+    if value & 0b11 == 0b11:
+        return value & 0x7F, ENCODING_TABLE[value & 0x7F], decode_instruction(value, mode=2)
+    return value & 0b11, get_compressed_encoding(value), decode_compressed(value)
+
+def iter_compressed_disassembly(binary_file, with_csv=True, with_listing=True, chunk_words=CHUNK_WORDS):
+    """
+    Variante de iter_disassembly pour les binaires avec extension C : les
+    instructions (16 ou 32 bits selon les deux bits de poids faible de leur
+    premier demi-mot) sont délimitées une à une, le texte de chaque valeur
+    distincte n'est calculé qu'une fois. Une instruction incomplète en fin de
+    fichier est ignorée.
+    """
+    size = os.path.getsize(binary_file)
+    if size < 2:
+        return
+    memo = {}
+    with open(binary_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        offset = 0
+        while offset + 2 <= size:
+            csv_rows = []
+            listing_rows = []
+            for _ in range(chunk_words):
+                if offset + 2 > size:
+                    break
+                value = mm[offset] | (mm[offset + 1] << 8)
+                length = 2
+                if value & 0b11 == 0b11:
+                    if offset + 4 > size:
+                        offset = size
+                        break
+                    value |= (mm[offset + 2] | (mm[offset + 3] << 8)) << 16
+                    length = 4
+                described = memo.get(value)
+                if described is None:
+                    if len(memo) > MEMO_LIMIT:
+                        memo.clear()
+                    described = memo[value] = describe_parcel(value)
+                opcode, encoding, text = described
+                csv_rows += (offset, value, opcode, encoding)
+                listing_rows += (offset, text)
+                offset += length
+            count = len(listing_rows) // 2
+            yield (
+                ("%08x,%08x,%08x,%s\r\n" * count) % tuple(csv_rows) if with_csv else None,
+                ("%08x: %s\n" * count) % tuple(listing_rows) if with_listing else None,
+            )
+
+def disassemble(binary_file, csv_out=None, listing_out=None, chunk_words=CHUNK_WORDS, compressed=False):
+    """
+    Écrit le CSV (offset, valeur, opcode, encoding) dans csv_out et le listing
+    "offset: instruction" dans listing_out, à partir de la même passe.
+    compressed : délimiter les instructions de 16 bits de l'extension C.
+    """
+    if csv_out is not None:
+        csv_out.write("offset,valeur,opcode,encoding\r\n")
+    iterate = iter_compressed_disassembly if compressed else iter_disassembly
+    for csv_text, listing_text in iterate(binary_file, csv_out is not None, listing_out is not None, chunk_words):
+        if csv_text is not None:
+            csv_out.write(csv_text)
+        if listing_text is not None:
+            listing_out.write(listing_text)
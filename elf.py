@@ -0,0 +1,118 @@
+import bisect
+import mmap
+import struct
+
+ELF_MAGIC = b"\x7fELF"
+EM_RISCV = 243
+PT_LOAD = 1
+SHT_SYMTAB = 2
+STT_NOTYPE, STT_OBJECT, STT_FUNC, STT_SECTION, STT_FILE = range(5)
+SHN_UNDEF = 0
+SHN_ABS = 0xFFF1
+
+# Formats des structures selon la classe (1 : ELF32, 2 : ELF64), petit-boutiste
+HEADER_FORMATS = {1: "<HHIIIIIHHHHHH", 2: "<HHIQQQIHHHHHH"}
+PHDR_FORMATS = {1: "<IIIIIIII", 2: "<IIQQQQQQ"}
+SHDR_FORMATS = {1: "<IIIIIIIIII", 2: "<IIQQQQIIQQ"}
+SYM_FORMATS = {1: "<IIIBBH", 2: "<IBBHQQ"}
+
+def is_elf(path):
+    with open(path, "rb") as f:
+        return f.read(4) == ELF_MAGIC
+
+class SymbolIndex:
+    """
+    Symboles de code triés par adresse : lookup fait une recherche
+    dichotomique (bisect) pour retrouver la fonction contenant un PC.
+    Un symbole de taille nulle (étiquette d'assembleur) couvre tout ce qui
+    le suit jusqu'au symbole suivant.
+    """
+    def __init__(self, symbols=()):
+        by_address = {}
+        for address, size, name in sorted(symbols):
+            by_address.setdefault(address, (size, name))  # Un seul nom par adresse
+        self.addresses = sorted(by_address)
+        self.sizes = [by_address[address][0] for address in self.addresses]
+        self.names = [by_address[address][1] for address in self.addresses]
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def lookup(self, pc):
+        """(nom, décalage) du symbole contenant pc, ou None."""
+        i = bisect.bisect_right(self.addresses, pc) - 1
+        if i < 0:
+            return None
+        offset = pc - self.addresses[i]
+        size = self.sizes[i]
+        if size and offset >= size:
+            return None
+        return self.names[i], offset
+
+    def format(self, pc):
+        """fonction+0x1c, ou l'adresse en hexadécimal si aucun symbole ne contient pc."""
+        found = self.lookup(pc)
+        if found is None:
+            return f"{pc:08x}"
+        name, offset = found
+        return f"{name}+{offset:#x}" if offset else name
+
+class ElfFile:
+    """
+    Exécutable ELF RISC-V (ELF32, ou ELF64 dont le code se limite à RV32).
+    Le fichier est projeté en mémoire (mmap, copie à l'écriture) : seuls les
+    segments PT_LOAD sont associés à des pages de la mémoire émulée (voir
+    Memory.load_elf), les sections de débogage ne sont jamais lues.
+    """
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        image = self.image
+        if image[:4] != ELF_MAGIC:
+            raise ValueError(f"{path} n'est pas un fichier ELF")
+        self.elf_class = image[4]
+        if self.elf_class not in HEADER_FORMATS or image[5] != 1:
+            raise ValueError(f"{path} : classe ELF ou boutisme non pris en charge")
+        (e_type, e_machine, e_version, self.entry, e_phoff, e_shoff, e_flags, e_ehsize,
+         e_phentsize, e_phnum, e_shentsize, e_shnum, e_shstrndx) = struct.unpack_from(HEADER_FORMATS[self.elf_class], image, 16)
+        if e_machine != EM_RISCV:
+            raise ValueError(f"{path} n'est pas un exécutable RISC-V (machine {e_machine})")
+        self.segments = []  # (adresse, décalage dans le fichier, taille dans le fichier, taille en mémoire)
+        for i in range(e_phnum):
+            fields = struct.unpack_from(PHDR_FORMATS[self.elf_class], image, e_phoff + i * e_phentsize)
+            if self.elf_class == 1:
+                p_type, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_flags, p_align = fields
+            else:
+                p_type, p_flags, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_align = fields
+            if p_type == PT_LOAD and p_memsz:
+                self.segments.append((p_vaddr, p_offset, p_filesz, p_memsz))
+        self.sections = [struct.unpack_from(SHDR_FORMATS[self.elf_class], image, e_shoff + i * e_shentsize) for i in range(e_shnum)]
+        self._symbols = None
+
+    @property
+    def symbols(self):
+        """SymbolIndex des fonctions et étiquettes de .symtab, construit au premier usage."""
+        if self._symbols is None:
+            self._symbols = SymbolIndex(self.read_symbols())
+        return self._symbols
+
+    def read_symbols(self):
+        """Génère (adresse, taille, nom) des symboles de code définis."""
+        image = self.image
+        sym_format = SYM_FORMATS[self.elf_class]
+        for sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, sh_link, sh_info, sh_addralign, sh_entsize in self.sections:
+            if sh_type != SHT_SYMTAB or not sh_entsize:
+                continue
+            strtab_offset = self.sections[sh_link][4]
+            for entry in range(sh_offset, sh_offset + sh_size, sh_entsize):
+                fields = struct.unpack_from(sym_format, image, entry)
+                if self.elf_class == 1:
+                    st_name, st_value, st_size, st_info, st_other, st_shndx = fields
+                else:
+                    st_name, st_info, st_other, st_shndx, st_value, st_size = fields
+                if st_info & 0xF not in (STT_NOTYPE, STT_FUNC) or st_shndx in (SHN_UNDEF, SHN_ABS):
+                    continue
+                start = strtab_offset + st_name
+                name = image[start:image.find(b"\x00", start)].decode(errors="replace")
+                if name and not name.startswith("$"):  # $x, $d : symboles de repérage de l'assembleur
+                    yield st_value, st_size, name
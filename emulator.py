@@ -1,30 +1,26 @@
-from cpu import RISCV_CPU
-from memory import Memory
-from decoder import decode_instruction, sign_extend
+from itertools import repeat
+from cpu import RISCV_CPU, CSR_MISA
+from memory import Memory, PAGE_SHIFT
+from decoder import decode_instruction, decode_compressed, expand_compressed, sign_extend
 from peripherals import Peripherals
+from snapshot import save_snapshot, load_snapshot
 
-# Fonctions spécifiques pour chaque type d'instruction
-def execute_load(cpu, memory, inst):
+# Extraction des opérandes (pré-décodage) pour chaque type d'instruction
+def fields_load(inst):
     rd = (inst >> 7) & 0x1F
     rs1 = (inst >> 15) & 0x1F
     imm = sign_extend((inst >> 20) & 0xFFF, 12)
-    addr = cpu.get_reg(rs1) + imm
-    value = memory.read(addr, 4)  # Lecture de 4 octets (32 bits)
-    cpu.set_reg(rd, value)
-    return value
+    return rd, rs1, imm
 
-def execute_store(cpu, memory, inst):
+def fields_store(inst):
     imm_11_5 = (inst >> 25) & 0x7F
     imm_4_0 = (inst >> 7) & 0x1F
     rs1 = (inst >> 15) & 0x1F
     rs2 = (inst >> 20) & 0x1F
     imm = sign_extend((imm_11_5 << 5) | imm_4_0, 12)
-    addr = cpu.get_reg(rs1) + imm
-    value = cpu.get_reg(rs2)
-    memory.write(addr, value, 4)  # Écriture de 4 octets (32 bits)
-    return value
+    return rs1, rs2, imm
 
-def execute_branch(cpu, memory, inst):
+def fields_branch(inst):
     imm_12 = (inst >> 31) & 0x1
     imm_10_5 = (inst >> 25) & 0x3F
     imm_4_1 = (inst >> 8) & 0xF
@@ -34,22 +30,15 @@ def execute_branch(cpu, memory, inst):
     imm = (imm_12 << 12) | (imm_11 << 11) | (imm_10_5 << 5) | (imm_4_1 << 1)
     if imm & 0x800:
         imm |= 0xFFFFF000
-    if cpu.get_reg(rs1) == cpu.get_reg(rs2):
-        cpu.set_pc(cpu.get_pc() + imm)
-    else:
-        cpu.set_pc(cpu.get_pc() + 4)
-    return imm
+    return rs1, rs2, imm
 
-def execute_jalr(cpu, memory, inst):
+def fields_jalr(inst):
     rd = (inst >> 7) & 0x1F
     rs1 = (inst >> 15) & 0x1F
     imm = (inst >> 20) & 0xFFF
-    next_pc = cpu.get_pc() + 4
-    cpu.set_reg(rd, next_pc)
-    cpu.set_pc((cpu.get_reg(rs1) + imm) & 0xFFFFFFFE)
-    return next_pc
+    return rd, rs1, imm
 
-def execute_jal(cpu, memory, inst):
+def fields_jal(inst):
     rd = (inst >> 7) & 0x1F
     imm_20 = (inst >> 31) & 0x1
     imm_10_1 = (inst >> 21) & 0x3FF
@@ -58,28 +47,72 @@ def execute_jal(cpu, memory, inst):
     imm = (imm_20 << 20) | (imm_19_12 << 12) | (imm_11 << 11) | (imm_10_1 << 1)
     if imm & 0x100000:
         imm |= 0xFFF00000
-    next_pc = cpu.get_pc() + 4
+    return rd, imm
+
+def fields_u(inst):
+    rd = (inst >> 7) & 0x1F
+    imm = (inst >> 12) & 0xFFFFF
+    return rd, imm
+
+def fields_op_imm(inst):
+    rd = (inst >> 7) & 0x1F
+    rs1 = (inst >> 15) & 0x1F
+    imm = (inst >> 20) & 0x1F
+    funct3 = (inst >> 12) & 0x7
+    funct7 = (inst >> 25) & 0x7F
+    return rd, rs1, imm, funct3, funct7
+
+def fields_op(inst):
+    rd = (inst >> 7) & 0x1F
+    rs1 = (inst >> 15) & 0x1F
+    rs2 = (inst >> 20) & 0x1F
+    funct3 = (inst >> 12) & 0x7
+    funct7 = (inst >> 25) & 0x7F
+    return rd, rs1, rs2, funct3, funct7
+
+# Exécution à partir des opérandes pré-décodés
+def exec_load(cpu, memory, rd, rs1, imm):
+    addr = cpu.get_reg(rs1) + imm
+    value = memory.read(addr, 4)  # Lecture de 4 octets (32 bits)
+    cpu.set_reg(rd, value)
+    return value
+
+def exec_store(cpu, memory, rs1, rs2, imm):
+    addr = cpu.get_reg(rs1) + imm
+    value = cpu.get_reg(rs2)
+    memory.write(addr, value, 4)  # Écriture de 4 octets (32 bits)
+    return value
+
+# Les sauts reçoivent la longueur de l'instruction (2 pour une instruction
+# compressée) : adresse de retour et PC d'un BRANCH non pris.
+def exec_branch(cpu, memory, rs1, rs2, imm, size=4):
+    if cpu.get_reg(rs1) == cpu.get_reg(rs2):
+        cpu.set_pc(cpu.get_pc() + imm)
+    else:
+        cpu.set_pc(cpu.get_pc() + size)
+    return imm
+
+def exec_jalr(cpu, memory, rd, rs1, imm, size=4):
+    next_pc = cpu.get_pc() + size
+    cpu.set_reg(rd, next_pc)
+    cpu.set_pc((cpu.get_reg(rs1) + imm) & 0xFFFFFFFE)
+    return next_pc
+
+def exec_jal(cpu, memory, rd, imm, size=4):
+    next_pc = cpu.get_pc() + size
     cpu.set_reg(rd, next_pc)
     cpu.set_pc((cpu.get_pc() + imm) & 0xFFFFFFFE)
     return next_pc
 
-def execute_lui(cpu, memory, inst):
-    rd = (inst >> 7) & 0x1F
-    imm = (inst >> 12) & 0xFFFFF
+def exec_lui(cpu, memory, rd, imm):
     cpu.set_reg(rd, imm << 12)
     return imm << 12
 
-def execute_auipc(cpu, memory, inst):
-    rd = (inst >> 7) & 0x1F
-    imm = (inst >> 12) & 0xFFFFF
+def exec_auipc(cpu, memory, rd, imm):
     cpu.set_reg(rd, cpu.get_pc() + imm)
     return cpu.get_pc() + imm
 
-def execute_op_imm(cpu, memory, inst):
-    rd = (inst >> 7) & 0x1F
-    rs1 = (inst >> 15) & 0x1F
-    imm = (inst >> 20) & 0x1F
-    funct3 = (inst >> 12) & 0x7
+def exec_op_imm(cpu, memory, rd, rs1, imm, funct3, funct7):
     if funct3 == 0b000:  # ADDI
         result = cpu.get_reg(rs1) + imm
         cpu.set_reg(rd, result)
@@ -102,7 +135,6 @@ def execute_op_imm(cpu, memory, inst):
         result = cpu.get_reg(rs1) << imm
         cpu.set_reg(rd, result)
     elif funct3 == 0b101:  # SRLI/SRAI
-        funct7 = (inst >> 25) & 0x7F
         if funct7 == 0b0000000:  # SRLI
             result = cpu.get_reg(rs1) >> imm
             cpu.set_reg(rd, result)
@@ -111,13 +143,42 @@ def execute_op_imm(cpu, memory, inst):
             cpu.set_reg(rd, result)
     return result
 
-def execute_op(cpu, memory, inst):
-    rd = (inst >> 7) & 0x1F
-    rs1 = (inst >> 15) & 0x1F
-    rs2 = (inst >> 20) & 0x1F
-    funct3 = (inst >> 12) & 0x7
-    if funct3 == 0b000:  # ADD/SUB
-        funct7 = (inst >> 25) & 0x7F
+def muldiv(funct3, a, b):
+    """
+    Résultat (32 bits non signé) d'une instruction RV32M sur les valeurs de
+    registres a et b, réduites à 32 bits puis interprétées signées ou non.
+    Division par zéro et dépassement suivent la spécification (pas d'exception).
+    """
+    a &= 0xFFFFFFFF
+    b &= 0xFFFFFFFF
+    if funct3 == 0b000:  # MUL
+        return (a * b) & 0xFFFFFFFF
+    elif funct3 == 0b011:  # MULHU
+        return (a * b) >> 32
+    elif funct3 == 0b101:  # DIVU
+        return a // b if b else 0xFFFFFFFF
+    elif funct3 == 0b111:  # REMU
+        return a % b if b else a
+    sa = a - (1 << 32) if a & 0x80000000 else a
+    if funct3 == 0b010:  # MULHSU
+        return ((sa * b) >> 32) & 0xFFFFFFFF
+    sb = b - (1 << 32) if b & 0x80000000 else b
+    if funct3 == 0b001:  # MULH
+        return ((sa * sb) >> 32) & 0xFFFFFFFF
+    if b == 0:
+        return 0xFFFFFFFF if funct3 == 0b100 else a  # DIV / REM par zéro
+    quotient = abs(sa) // abs(sb)  # Division tronquée vers zéro
+    if (sa < 0) != (sb < 0):
+        quotient = -quotient
+    if funct3 == 0b100:  # DIV (-2^31 / -1 donne -2^31)
+        return quotient & 0xFFFFFFFF
+    return (sa - sb * quotient) & 0xFFFFFFFF  # REM
+
+def exec_op(cpu, memory, rd, rs1, rs2, funct3, funct7):
+    if funct7 == 0b0000001:  # Extension M
+        result = muldiv(funct3, cpu.get_reg(rs1), cpu.get_reg(rs2))
+        cpu.set_reg(rd, result)
+    elif funct3 == 0b000:  # ADD/SUB
         if funct7 == 0b0000000:  # ADD
             result = cpu.get_reg(rs1) + cpu.get_reg(rs2)
             cpu.set_reg(rd, result)
@@ -137,7 +198,6 @@ def execute_op(cpu, memory, inst):
         result = cpu.get_reg(rs1) ^ cpu.get_reg(rs2)
         cpu.set_reg(rd, result)
     elif funct3 == 0b101:  # SRL/SRA
-        funct7 = (inst >> 25) & 0x7F
         if funct7 == 0b0000000:  # SRL
             result = cpu.get_reg(rs1) >> cpu.get_reg(rs2)
             cpu.set_reg(rd, result)
@@ -152,6 +212,49 @@ def execute_op(cpu, memory, inst):
         cpu.set_reg(rd, result)
     return result
 
+# Table de dispatch : opcode -> (extraction des opérandes, exécution)
+DISPATCH = {
+    0b0000011: (fields_load, exec_load),      # LOAD
+    0b0100011: (fields_store, exec_store),    # STORE
+    0b1100011: (fields_branch, exec_branch),  # BRANCH
+    0b1100111: (fields_jalr, exec_jalr),      # JALR
+    0b1101111: (fields_jal, exec_jal),        # JAL
+    0b0110111: (fields_u, exec_lui),          # LUI
+    0b0010111: (fields_u, exec_auipc),        # AUIPC
+    0b0010011: (fields_op_imm, exec_op_imm),  # OP_IMM
+    0b0110011: (fields_op, exec_op),          # OP
+}
+
+SIZED_HANDLERS = (exec_branch, exec_jalr, exec_jal)  # Handlers dont le résultat dépend de la longueur de l'instruction
+
+# Fonctions spécifiques pour chaque type d'instruction
+def execute_load(cpu, memory, inst):
+    return exec_load(cpu, memory, *fields_load(inst))
+
+def execute_store(cpu, memory, inst):
+    return exec_store(cpu, memory, *fields_store(inst))
+
+def execute_branch(cpu, memory, inst):
+    return exec_branch(cpu, memory, *fields_branch(inst))
+
+def execute_jalr(cpu, memory, inst):
+    return exec_jalr(cpu, memory, *fields_jalr(inst))
+
+def execute_jal(cpu, memory, inst):
+    return exec_jal(cpu, memory, *fields_jal(inst))
+
+def execute_lui(cpu, memory, inst):
+    return exec_lui(cpu, memory, *fields_u(inst))
+
+def execute_auipc(cpu, memory, inst):
+    return exec_auipc(cpu, memory, *fields_u(inst))
+
+def execute_op_imm(cpu, memory, inst):
+    return exec_op_imm(cpu, memory, *fields_op_imm(inst))
+
+def execute_op(cpu, memory, inst):
+    return exec_op(cpu, memory, *fields_op(inst))
+
 def execute_system(cpu, memory, inst):
     funct3 = (inst >> 12) & 0x7
     if funct3 == 0b000:  # ECALL/EBREAK
@@ -165,100 +268,317 @@ def execute_system(cpu, memory, inst):
         print(f"Instruction SYSTEM inconnue: {inst:08x}")
     return None
 
+def execute_csr(cpu, memory, inst):
+    """CSRRW/CSRRS/CSRRC et leurs variantes immédiates ; les CSR 0xC00-0xFFF et misa sont en lecture seule."""
+    funct3 = (inst >> 12) & 0x7
+    rd = (inst >> 7) & 0x1F
+    source = (inst >> 15) & 0x1F
+    csr = (inst >> 20) & 0xFFF
+    value = source if funct3 & 0b100 else cpu.get_reg(source)
+    old = cpu.csrs.get(csr, 0)
+    if funct3 & 0b011 == 0b01:  # CSRRW
+        new = value
+    elif funct3 & 0b011 == 0b10:  # CSRRS
+        new = old | value
+    else:  # CSRRC
+        new = old & ~value & 0xFFFFFFFF
+    if (funct3 & 0b011 == 0b01 or source) and csr >> 10 != 0b11 and csr != CSR_MISA:
+        cpu.csrs[csr] = new
+    cpu.set_reg(rd, old)
+    return old
+
 def execute_nop(cpu, memory, inst):
     # NOP instruction (no-op)
     return None
 
 def execute_instruction(cpu, memory, inst, peripherals, enable_peripherals, enable_semihosting):
     opcode = inst & 0x7F  # Les 7 bits de poids faible
-    if opcode == 0b0000011:  # LOAD
-        return execute_load(cpu, memory, inst)
-    elif opcode == 0b0100011:  # STORE
-        return execute_store(cpu, memory, inst)
-    elif opcode == 0b1100011:  # BRANCH
-        return execute_branch(cpu, memory, inst)
-    elif opcode == 0b1100111:  # JALR
-        return execute_jalr(cpu, memory, inst)
-    elif opcode == 0b1101111:  # JAL
-        return execute_jal(cpu, memory, inst)
-    elif opcode == 0b0110111:  # LUI
-        return execute_lui(cpu, memory, inst)
-    elif opcode == 0b0010111:  # AUIPC
-        return execute_auipc(cpu, memory, inst)
-    elif opcode == 0b0010011:  # OP_IMM
-        return execute_op_imm(cpu, memory, inst)
-    elif opcode == 0b0110011:  # OP
-        return execute_op(cpu, memory, inst)
+    entry = DISPATCH.get(opcode)
+    if entry is not None:
+        fields, handler = entry
+        return handler(cpu, memory, *fields(inst))
     elif opcode == 0b1110011:  # SYSTEM
+        if (inst >> 12) & 0b011:  # Instructions CSR
+            return execute_csr(cpu, memory, inst)
+        peripherals.flush()  # Les messages de l'émulateur suivent la sortie du programme
         result = execute_system(cpu, memory, inst)
         if result == "EBREAK":
             return result
     elif opcode == 0b0000001:  # NOP
         return execute_nop(cpu, memory, inst)
     else:
+        peripherals.flush()
         print(f"Instruction inconnue: {inst:08x}")
         return None
 
-    # Gérer les accès mémoire aux périphériques
-    address = cpu.get_pc()
-    if enable_peripherals and peripherals.handle_memory_access(address, inst, is_write=True) is not None:
-        return
-    if enable_peripherals and peripherals.handle_memory_access(address, inst, is_write=False) is not None:
-        return
-
     # Gérer le semihosting
     if enable_semihosting and inst == 0x00100073:  # ebreak
         if cpu.get_reg(10) == 0x04:  # SYS_WRITEC
             peripherals.write_stdout(cpu.get_reg(11))
         elif cpu.get_reg(10) == 0x06:  # SYS_WRITE0
-            string = ""
-            addr = cpu.get_reg(11)
-            while memory.read(addr, 1) != 0:
-                string += chr(memory.read(addr, 1))
-                addr += 1
-            print(string, end='', flush=True)
-
-def emu_loop(cpu, memory, peripherals, step_by_step=False, enable_peripherals=True, enable_semihosting=True):
-    result_stack = []
-    while True:
-        try:
-            inst = memory.read(cpu.get_pc(), 4)
-            if step_by_step:
-                print(f"PC: {cpu.get_pc():#x}, Instruction: {decode_instruction(inst, mode=2)}")
-                command = input("Commande (step/continue/exit/x/COUNT ADDRESS/reset): ")
-                if command == "step":
-                    result = execute_instruction(cpu, memory, inst, peripherals, enable_peripherals, enable_semihosting)
-                    if result == "EBREAK":
-                        return result_stack
-                    result_stack.append(result)
-                    cpu.set_pc(cpu.get_pc() + 4)
-                elif command == "continue":
-                    step_by_step = False
-                elif command == "exit":
-                    break
-                else:
-                    handle_command(command, cpu, memory)
+            peripherals.write_string(memory.read_cstring(cpu.get_reg(11)).decode('latin-1'))
+
+class DecodeCache:
+    """
+    Cache des instructions pré-décodées, indexé par PC.
+    Chaque entrée est un tuple (inst, handler, opérandes, longueur) ; handler
+    vaut None pour les instructions traitées par le chemin générique (SYSTEM,
+    inconnues). Avec compressed, les instructions de 16 bits sont remplacées
+    une fois pour toutes par leur équivalent de 32 bits (inst) et ont une
+    longueur de 2 : le PC avance de la longueur de l'instruction.
+    Les écritures dans une page de code invalident les entrées de cette page.
+    """
+    def __init__(self, memory, compressed=False):
+        self.memory = memory
+        self.compressed = compressed
+        self.entries = {}
+        self.pages = {}  # page -> ensemble des PC décodés dans la page
+        memory.add_code_watcher(self)
+
+    def lookup(self, pc):
+        entry = self.entries.get(pc)
+        if entry is None:
+            entry = self.fill(pc)
+        return entry
+
+    def fill(self, pc):
+        size = 4
+        if self.compressed:
+            inst = self.memory.read(pc, 2)
+            if inst & 0b11 != 0b11:
+                size = 2
+                inst = expand_compressed(inst) or inst  # Instruction illégale : chemin générique
             else:
+                inst |= self.memory.read(pc + 2, 2) << 16
+        else:
+            inst = self.memory.read(pc, 4)
+        dispatch = DISPATCH.get(inst & 0x7F) if inst & 0b11 == 0b11 else None
+        if dispatch is not None:
+            fields, handler = dispatch
+            operands = fields(inst)
+            if size == 2 and handler in SIZED_HANDLERS:
+                operands += (2,)
+            entry = (inst, handler, operands, size)
+        else:
+            entry = (inst, None, (), size)
+        self.entries[pc] = entry
+        for page in {pc >> PAGE_SHIFT, (pc + size - 1) >> PAGE_SHIFT}:
+            self.pages.setdefault(page, set()).add(pc)
+            self.memory.code_pages.add(page)
+        return entry
+
+    def close(self):
+        self.memory.remove_code_watcher(self)
+
+    def invalidate_page(self, page):
+        for pc in self.pages.pop(page, ()):
+            self.entries.pop(pc, None)
+
+    def clear(self):
+        self.entries.clear()
+        self.pages.clear()
+
+CONTROL_FLOW = frozenset((exec_branch, exec_jal, exec_jalr))
+
+class Hook:
+    """
+    Observateur de la boucle de l'interpréteur (voir run_interpreter). Une
+    sous-classe ne redéfinit que les méthodes dont elle a besoin : la boucle
+    n'appelle que celles-là.
+    begin : début d'une exécution, avec le contexte de run_interpreter.
+    before(pc, entry) : avant l'instruction entry (entrée du DecodeCache) en pc ;
+    une valeur autre que None arrête l'exécution avant l'instruction.
+    after(pc, entry, result) : après l'instruction, cpu.pc étant le PC fixé
+    par le handler (la longueur n'est pas encore ajoutée) ; une valeur autre
+    que None arrête l'exécution après l'instruction.
+    transfer(pc, entry) : après un BRANCH/JAL/JALR, cpu.pc étant la cible.
+    finish : fin de l'exécution, y compris sur exception.
+    """
+    def begin(self, cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks):
+        pass
+
+    def before(self, pc, entry):
+        pass
+
+    def after(self, pc, entry, result):
+        pass
+
+    def transfer(self, pc, entry):
+        pass
+
+    def finish(self):
+        pass
+
+def overridden(hooks, name):
+    """Méthodes name des hooks qui la redéfinissent."""
+    return [getattr(hook, name) for hook in hooks if getattr(type(hook), name) is not getattr(Hook, name)]
+
+def run_interpreter(cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks, hooks=()):
+    """
+    Boucle de l'interpréteur, une instruction par élément de ticks ; retourne
+    "EBREAK" à l'arrêt sur EBREAK, ou la valeur d'arrêt d'un hook.
+    Sans hooks, la boucle rapide ne fait que décoder et exécuter.
+    """
+    if hooks:
+        return run_hooks(cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks, hooks)
+    append = result_stack.append
+    for _ in ticks:
+        inst, handler, operands, size = lookup(cpu.pc)
+        if handler is None:
+            result = execute_instruction(cpu, memory, inst, peripherals, enable_peripherals, enable_semihosting)
+            if result == "EBREAK":
+                return result
+        else:
+            result = handler(cpu, memory, *operands)
+        append(result)
+        cpu.pc += size
+    return None
+
+def run_hooks(cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks, hooks):
+    """Boucle instrumentée de run_interpreter : chaque hook est appelé aux points qu'il redéfinit."""
+    append = result_stack.append
+    befores = overridden(hooks, "before")
+    afters = overridden(hooks, "after")
+    transfers = overridden(hooks, "transfer")
+    started = []
+    try:
+        for hook in hooks:
+            hook.begin(cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks)
+            started.append(hook)
+        for _ in ticks:
+            pc = cpu.pc
+            entry = lookup(pc)
+            for before in befores:
+                stop = before(pc, entry)
+                if stop is not None:
+                    return stop
+            inst, handler, operands, size = entry
+            if handler is None:
                 result = execute_instruction(cpu, memory, inst, peripherals, enable_peripherals, enable_semihosting)
-                if result == "EBREAK":
+            else:
+                result = handler(cpu, memory, *operands)
+            stop = None
+            for after in afters:
+                value = after(pc, entry, result)
+                if value is not None:
+                    stop = value
+            if handler is None and result == "EBREAK":
+                return result
+            append(result)
+            cpu.pc += size
+            if stop is not None:
+                return stop
+            if transfers and handler in CONTROL_FLOW:
+                for transfer in transfers:
+                    transfer(pc, entry)
+        return None
+    finally:
+        for hook in started:
+            hook.finish()
+
+def emu_loop(cpu, memory, peripherals, step_by_step=False, enable_peripherals=True, enable_semihosting=True, translator=None, max_steps=None, halt_on_error=False, result_stack=None, hooks=(), snapshot=None, debugger=None):
+    """
+    Boucle d'exécution principale.
+    enable_peripherals : placer les registres des périphériques sur le bus de la mémoire.
+    max_steps : nombre maximal d'instructions exécutées hors mode pas à pas.
+    halt_on_error : propager les MemoryError au lieu de passer en mode pas à pas.
+    result_stack : liste ou collecteur (voir results.py) à compléter, conservé même si une erreur est propagée.
+    hooks : observateurs (voir Hook) alimentés ensemble par la boucle de
+    l'interpréteur : profiler.Profiler, outoforder.OoOModel, cache.CacheHierarchy,
+    predictor.BranchPredictor, tracer.TraceWriter, coverage_map.Coverage,
+    callgraph.CallGraph, idle.IdleLoops. Avec des hooks, translator n'est pas utilisé.
+    snapshot : instantané restauré par la commande reset du mode pas à pas.
+    debugger : debugger.Debugger ; tant qu'il a des points d'arrêt ou de surveillance,
+    il est ajouté aux hooks et l'exécution revient en mode pas à pas à chaque arrêt.
+    """
+    if result_stack is None:
+        result_stack = []
+    ticks = repeat(None) if max_steps is None else repeat(None, max_steps)
+    remaining = max_steps  # budget du traducteur, conservé d'une reprise à l'autre
+    cache = DecodeCache(memory, cpu.has_extension("C"))
+    lookup = cache.lookup
+    if enable_peripherals:
+        peripherals.attach(memory)
+    try:
+        while True:
+            try:
+                if step_by_step:
+                    peripherals.flush()
+                    entry = lookup(cpu.get_pc())
+                    text = decode_instruction(entry[0], mode=2) if entry[3] == 4 else decode_compressed(memory.read(cpu.get_pc(), 2))
+                    print(f"PC: {cpu.get_pc():#x}, Instruction: {text}")
+                    command = input("Commande (step/continue/exit/x/COUNT ADDRESS/reset/save FICHIER/break ADDR/delete ADDR/watch ADDR [LEN]/unwatch ADDR/info): ")
+                    if command == "step":
+                        # Une instruction, vue par les hooks comme en exécution continue
+                        if run_interpreter(cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, repeat(None, 1), hooks) == "EBREAK":
+                            return result_stack
+                    elif command == "continue":
+                        step_by_step = False
+                        if debugger is not None:
+                            debugger.resume_pc = cpu.get_pc()  # Ne pas s'arrêter à nouveau sur le point d'arrêt courant
+                    elif command == "exit":
+                        break
+                    elif command.strip():
+                        try:
+                            handle_command(command, cpu, memory, peripherals, snapshot, debugger)
+                        except (ValueError, IndexError):
+                            print(f"Commande invalide : {command}")
+                elif hooks or (debugger is not None and debugger.armed()):
+                    active = list(hooks)
+                    if debugger is not None and debugger.armed():
+                        active.insert(0, debugger)  # En premier : un point d'arrêt passe avant que les autres hooks voient l'instruction
+                    result = run_interpreter(cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks, active)
+                    if result != "BREAK":
+                        return result_stack
+                    peripherals.flush()
+                    print(debugger.stop)
+                    step_by_step = True
+                elif translator is not None:
+                    try:
+                        translator.run(cpu, peripherals, result_stack, enable_peripherals, enable_semihosting, remaining)
+                    finally:
+                        if remaining is not None:
+                            remaining -= translator.executed
+                    return result_stack
+                else:
+                    run_interpreter(cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks)
                     return result_stack
-                result_stack.append(result)
-                cpu.set_pc(cpu.get_pc() + 4)
-        except MemoryError as e:
-            print(f"Erreur : {e}")
-            step_by_step = True
+            except MemoryError as e:
+                if halt_on_error:
+                    raise
+                peripherals.flush()
+                print(f"Erreur : {e}")
+                step_by_step = True
+    finally:
+        cache.close()
+        peripherals.detach(memory)
+        peripherals.flush()
     return result_stack
 
-def handle_command(command, cpu, memory):
+def handle_command(command, cpu, memory, peripherals=None, snapshot=None, debugger=None):
     parts = command.split()
-    if parts[0] == "x":
-        count = int(parts[1].split('/')[0])
-        address = int(parts[1].split('/')[1], 16)
-        for i in range(count):
-            value = memory.read(address + i, 1)
-            print(f"{address + i:08x}: {value:02x}")
+    if parts[0] == "x" or parts[0].startswith("x/"):
+        # x COUNT/ADDRESS ou x/COUNT ADDRESS : affichage hexadécimal, 16 octets par ligne
+        count, address = parts[1].split('/') if parts[0] == "x" else (parts[0][2:], parts[1])
+        count = int(count)
+        address = int(address, 16)
+        if address < 0 or address + count > memory.size:
+            raise MemoryError("Adresse invalide")
+        data = memory.read_bytes(address, count)
+        for offset in range(0, count, 16):
+            line = data[offset:offset + 16]
+            text = "".join(chr(byte) if 32 <= byte < 127 else "." for byte in line)
+            print(f"{address + offset:08x}: {line.hex(' '):<47}  {text}")
     elif parts[0] == "reset":
-        cpu.set_pc(0x100)  # Reset address
+        if snapshot is not None:
+            load_snapshot(snapshot, cpu, memory, peripherals)  # Retour à l'instantané
+        else:
+            cpu.set_pc(0x100)  # Reset address
+    elif parts[0] == "save" and len(parts) == 2:
+        save_snapshot(parts[1], cpu, memory, peripherals)
+        print(f"Instantané enregistré dans {parts[1]}")
+    elif debugger is not None and debugger.command(parts):
+        pass
     elif parts[0] == "continue":
         return False
     elif parts[0] == "exit":
@@ -0,0 +1,229 @@
+import time
+from collections import deque
+from itertools import chain, islice, repeat
+from operator import length_hint
+from emulator import Hook, exec_branch, exec_jal, exec_jalr, exec_load, exec_op, exec_op_imm
+
+MAX_BODY = 16  # Instructions au plus dans le corps d'une boucle analysée
+CHUNK_ITERATIONS = 1 << 14  # Itérations sautées ajoutées à result_stack par lot
+
+# Instructions du corps d'une boucle
+ADDI, ADD, LOAD, CONST = range(4)
+
+class Loop:
+    """
+    Corps d'une boucle analysée : body est la liste des instructions d'une
+    itération, (ADDI, rd, rs1, imm), (ADD, rd, rs2, signe), (LOAD, rd, rs1, imm)
+    ou (CONST, résultat) pour les sauts ; condition est (position, rs1, rs2,
+    sortie_si_égaux) du seul BEQ de la boucle, ou None si elle ne se termine jamais.
+    """
+    def __init__(self, body, condition):
+        self.body = body
+        self.condition = condition
+        self.load = next((entry for entry in body if entry[0] == LOAD), None)
+
+class IdleLoops(Hook):
+    """
+    Détection des boucles d'attente et avance rapide.
+    À chaque saut arrière, la boucle qui commence à la cible est analysée une
+    fois (résultat gardé par adresse, oublié si le code est modifié) :
+    * boucle de temporisation : des ADDI, des ADD/SUB d'un registre invariant
+      et des sauts, avec au plus un BEQ de sortie. Chaque registre et chaque
+      résultat est une fonction affine du numéro d'itération : le nombre
+      d'itérations avant la sortie se calcule par une division et les
+      registres sont mis directement à leur valeur finale ;
+    * attente d'un périphérique : LW du registre stdin suivi d'un BEQ qui
+      reboucle tant que la valeur lue est nulle. L'émulateur dort jusqu'à
+      l'arrivée d'un octet au lieu d'exécuter la boucle.
+    Les résultats des itérations sautées sont ajoutés à result_stack comme si
+    elles avaient été exécutées et comptent dans max_steps : le temps virtuel
+    (nombre d'instructions exécutées) est celui de l'exécution complète. Une
+    boucle qui ne se termine jamais n'est avancée que jusqu'à max_steps.
+    """
+    def __init__(self):
+        self.loops = {}  # adresse de début -> Loop, ou None si la boucle ne se prête pas à l'avance rapide
+        self.fast_forwards = 0
+        self.skipped_iterations = 0
+        self.skipped_instructions = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.context = None  # (cpu, memory, lookup, peripherals, result_stack, enable_peripherals, ticks) pendant une exécution
+
+    def invalidate_page(self, page):
+        self.loops.clear()  # Code modifié : toutes les boucles seront analysées à nouveau
+
+    def begin(self, cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks):
+        self.context = (cpu, memory, lookup, peripherals, result_stack, enable_peripherals, ticks)
+        memory.add_code_watcher(self)
+
+    def transfer(self, pc, entry):
+        """Après un saut arrière, analyse la boucle qui commence à la cible et l'avance si possible."""
+        cpu, memory, lookup, peripherals, result_stack, enable_peripherals, ticks = self.context
+        head = cpu.pc
+        if head > pc or entry[1] is exec_jalr:
+            return
+        if head in self.loops:
+            loop = self.loops[head]
+        else:
+            loop = self.loops[head] = self.analyze(head, lookup)
+        if loop is not None:
+            self.fast_forward(loop, cpu, peripherals, result_stack, enable_peripherals, ticks)
+
+    def finish(self):
+        self.context[1].remove_code_watcher(self)
+        self.context = None
+
+    def analyze(self, head, lookup):
+        """Loop décrivant la boucle qui commence en head, ou None."""
+        found = walk(head, head, lookup, [], None)
+        if found is None:
+            return None
+        body, condition = found
+        counters = {entry[1] for entry in body if entry[0] in (ADDI, ADD) and entry[1]}
+        if any(entry[0] == ADD and entry[2] in counters for entry in body):
+            return None
+        loads = [entry for entry in body if entry[0] == LOAD]
+        if loads:
+            # Seule forme acceptée : LW rd, imm(rs1) puis un BEQ qui reboucle tant que rd vaut un registre invariant
+            rd, rs1 = loads[0][1], loads[0][2]
+            if len(loads) > 1 or counters or condition is None or condition[3] or rd not in condition[1:3] or rd == 0 or rs1 == rd:
+                return None
+        return Loop(body, condition)
+
+    def fast_forward(self, loop, cpu, peripherals, result_stack, enable_peripherals, ticks):
+        """Saute les itérations de loop qui ne font qu'avancer des compteurs, ou attend stdin ; cpu.pc est le début de la boucle."""
+        regs = cpu.regs
+        if loop.load is not None:
+            _, rd, rs1, imm = loop.load
+            other = loop.condition[2] if loop.condition[1] == rd else loop.condition[1]
+            if not enable_peripherals or regs[rs1] + imm != peripherals.stdin_addr or regs[other] != 0 or peripherals.stdin_bytes:
+                return
+            if not peripherals.stdin_closed:
+                peripherals.flush()
+                start = time.perf_counter()
+                peripherals.wait_stdin()
+                self.waits += 1
+                self.wait_time += time.perf_counter() - start
+                if peripherals.stdin_bytes:
+                    return  # L'itération suivante lit l'octet arrivé
+            # Entrée fermée : chaque LW lit 0 et la boucle ne se termine jamais
+
+        # Valeur de chaque résultat à l'itération 0 et registre dont la pente donne son évolution
+        offsets = {}  # registre -> variation depuis le début de l'itération
+        columns = []
+        condition = loop.condition
+        compared = None
+        for position, entry in enumerate(loop.body):
+            kind = entry[0]
+            if kind == ADDI:
+                _, rd, rs1, imm = entry
+                columns.append((regs[rs1] + offsets.get(rs1, 0) + imm, rs1))
+                if rd:
+                    offsets[rd] = offsets.get(rd, 0) + imm
+            elif kind == ADD:
+                _, rd, rs2, sign = entry
+                offsets[rd] = offsets.get(rd, 0) + sign * regs[rs2]
+                columns.append((regs[rd] + offsets[rd], rd))
+            elif kind == LOAD:
+                columns.append((0, None))
+            else:
+                columns.append((entry[1], None))
+            if condition is not None and position == condition[0]:
+                a, b = condition[1], condition[2]
+                compared = (regs[a] + offsets.get(a, 0), regs[b] + offsets.get(b, 0))
+
+        if condition is None or loop.load is not None:
+            iterations = None  # Retour inconditionnel ou attente sur une entrée fermée
+        else:
+            a0, b0 = compared
+            da, db = offsets.get(condition[1], 0), offsets.get(condition[2], 0)
+            if condition[3]:
+                iterations = first_equal(a0, da, b0, db)  # None : la sortie n'est jamais atteinte
+            elif a0 != b0 or da != db:
+                return  # Boucle tant que les registres sont égaux : elle se termine à la première ou à la deuxième itération
+            else:
+                iterations = None
+        length = len(loop.body)
+        remaining = length_hint(ticks, -1)
+        if remaining >= 0:
+            limit = remaining // length
+            iterations = limit if iterations is None else min(iterations, limit)
+        if not iterations:
+            return  # Boucle infinie sans limite d'instructions, ou rien à sauter
+
+        for start in range(0, iterations, CHUNK_ITERATIONS):
+            count = min(CHUNK_ITERATIONS, iterations - start)
+            values = []
+            for value, register in columns:
+                slope = offsets.get(register, 0) if register is not None else 0
+                values.append(range(value + start * slope, value + (start + count) * slope, slope) if slope else repeat(value, count))
+            result_stack.extend(chain.from_iterable(zip(*values)))
+        for register, offset in offsets.items():
+            regs[register] += iterations * offset
+        if loop.load is not None:
+            regs[loop.load[1]] = 0
+        if remaining >= 0:
+            deque(islice(ticks, iterations * length), maxlen=0)  # Les itérations sautées comptent dans max_steps
+        self.fast_forwards += 1
+        self.skipped_iterations += iterations
+        self.skipped_instructions += iterations * length
+
+    def report(self):
+        return {
+            "loops": sum(1 for loop in self.loops.values() if loop is not None),
+            "fast_forwards": self.fast_forwards,
+            "skipped_iterations": self.skipped_iterations,
+            "skipped_instructions": self.skipped_instructions,
+            "waits": self.waits,
+            "wait_time": self.wait_time,
+        }
+
+    def print_report(self):
+        report = self.report()
+        print("---BOUCLES-ATTENTE---")
+        print(f"Boucles reconnues : {report['loops']}, avances rapides : {report['fast_forwards']}")
+        print(f"Itérations sautées : {report['skipped_iterations']} ({report['skipped_instructions']} instructions comptées sans être exécutées)")
+        print(f"Attentes de l'entrée standard : {report['waits']} ({report['wait_time']:.3f} s)")
+
+def walk(pc, head, lookup, body, condition):
+    """
+    Suit une itération à partir de pc jusqu'au retour en head ; retourne
+    (body, condition) ou None. Au BEQ, la boucle continue par le chemin non
+    pris (sortie si égaux) ou, à défaut, par le chemin pris (sortie si différents).
+    """
+    while True:
+        if pc == head and body:
+            return body, condition
+        if len(body) >= MAX_BODY:
+            return None
+        inst, handler, operands, size = lookup(pc)
+        if handler is exec_op_imm and operands[3] == 0b000 and operands[0] in (0, operands[1]):  # ADDI rd, rd, imm
+            body.append((ADDI, operands[0], operands[1], operands[2]))
+            pc += size
+        elif handler is exec_op and operands[3] == 0b000 and operands[4] in (0b0000000, 0b0100000) and operands[0] == operands[1] != 0:  # ADD/SUB rd, rd, rs2
+            body.append((ADD, operands[0], operands[2], -1 if operands[4] else 1))
+            pc += size
+        elif handler is exec_load:
+            body.append((LOAD, operands[0], operands[1], operands[2]))
+            pc += size
+        elif handler is exec_jal and operands[0] == 0:
+            body.append((CONST, pc + size))
+            pc = ((pc + operands[1]) & 0xFFFFFFFE) + size  # Même calcul qu'exec_jal
+        elif handler is exec_branch and condition is None:
+            rs1, rs2, imm = operands[:3]
+            body.append((CONST, imm))
+            taken, not_taken = pc + imm + size, pc + 2 * size  # Comme exec_branch et la boucle d'exécution
+            position = len(body) - 1
+            return walk(not_taken, head, lookup, list(body), (position, rs1, rs2, True)) or walk(taken, head, lookup, body, (position, rs1, rs2, False))
+        else:
+            return None
+
+def first_equal(a0, da, b0, db):
+    """Plus petit k >= 0 tel que a0 + k * da == b0 + k * db, ou None s'il n'existe pas."""
+    diff = b0 - a0
+    step = da - db
+    if diff == 0:
+        return 0
+    if step == 0 or diff % step or diff // step < 0:
+        return None
+    return diff // step
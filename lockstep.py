@@ -0,0 +1,378 @@
+import argparse
+import json
+import time
+from collections import Counter
+from cpu import RISCV_CPU
+from memory import Memory, PAGE_SHIFT, PAGE_SIZE, DEFAULT_RESET_ADDR
+from peripherals import Peripherals
+from snapshot import load_snapshot
+from emulator import (
+    DISPATCH, execute_instruction,
+    exec_load, exec_store, exec_branch, exec_jalr, exec_jal, exec_lui, exec_auipc, exec_op_imm, exec_op,
+)
+
+try:
+    import numpy as np
+except ImportError:  # numpy n'est nécessaire qu'à l'exécution vectorisée
+    np = None
+
+EBREAK = 0x00100073
+MASK_32 = 0xFFFFFFFF
+CONTROL_FLOW = (exec_branch, exec_jalr)  # Sauts dont la cible dépend des registres : les instances peuvent diverger
+
+def muldiv(funct3, x, y):
+    """Version vectorielle de emulator.muldiv sur des tableaux uint32."""
+    if funct3 == 0b000:  # MUL
+        return ((x.astype(np.uint64) * y) & np.uint64(MASK_32)).astype(np.uint32)
+    elif funct3 == 0b011:  # MULHU
+        return ((x.astype(np.uint64) * y) >> np.uint64(32)).astype(np.uint32)
+    zero = y == 0
+    if funct3 == 0b101:  # DIVU
+        return np.where(zero, np.uint32(MASK_32), x // np.where(zero, np.uint32(1), y))
+    elif funct3 == 0b111:  # REMU
+        return np.where(zero, x, x % np.where(zero, np.uint32(1), y))
+    sx = x.view(np.int32).astype(np.int64)
+    if funct3 == 0b010:  # MULHSU
+        return (((sx * y.astype(np.int64)) >> 32) & MASK_32).astype(np.uint32)
+    sy = y.view(np.int32).astype(np.int64)
+    if funct3 == 0b001:  # MULH
+        return (((sx * sy) >> 32) & MASK_32).astype(np.uint32)
+    sy = np.where(zero, 1, sy)
+    quotient = np.abs(sx) // np.abs(sy) * np.where((sx < 0) != (sy < 0), -1, 1)
+    if funct3 == 0b100:  # DIV
+        return np.where(zero, np.uint32(MASK_32), (quotient & MASK_32).astype(np.uint32))
+    return np.where(zero, x, ((sx - sy * quotient) & MASK_32).astype(np.uint32))  # REM
+
+class Lockstep:
+    """
+    N instances d'une même machine exécutées en parallèle, état rangé en
+    structure de tableaux numpy : registres (N, 32) uint32, PC (N,) int64 et
+    un plan mémoire (N, taille) par instance.
+    À chaque pas, les instances actives qui ont le plus petit PC forment un
+    groupe et exécutent ensemble l'instruction à ce PC par une opération
+    vectorielle ; après un saut qui diverge, les instances parties en avant
+    attendent que les autres les rejoignent. Les cas rares (CSR, instructions
+    inconnues, accès non alignés ou hors mémoire) passent instance par
+    instance par emulator.execute_instruction, sur une Memory dont les pages
+    sont des vues du plan de l'instance.
+    Les registres sont des entiers 32 bits : les résultats qui dépassent
+    32 bits (ou négatifs) dans l'interpréteur sont ici tronqués modulo 2^32.
+    """
+    def __init__(self, memory, cpu, instances):
+        if np is None:
+            raise ImportError("L'exécution vectorisée nécessite numpy (pip install numpy)")
+        if cpu.has_extension("C"):
+            raise ValueError("L'exécution vectorisée ne prend pas en charge l'extension C")
+        self.instances = instances
+        self.size = memory.size
+        pages = -(-memory.size // PAGE_SIZE)
+        self.planes = np.zeros((instances, pages << PAGE_SHIFT), dtype=np.uint8)
+        for page, views in memory.pages.items():
+            if page < pages:
+                self.planes[:, page << PAGE_SHIFT:(page + 1) << PAGE_SHIFT] = np.frombuffer(views[0], dtype=np.uint8)
+        self.words = self.planes.view('<u4')
+        self.regs = np.zeros((instances, 32), dtype=np.uint32)
+        self.regs[:] = [value & MASK_32 for value in cpu.regs]
+        self.pc = np.full(instances, cpu.pc, dtype=np.int64)
+        self.steps = np.zeros(instances, dtype=np.int64)
+        self.running = np.ones(instances, dtype=bool)
+        self.status = [None] * instances  # None tant que l'instance s'exécute, puis "EBREAK", "limit" ou l'erreur
+        self.decoded = {}  # instruction -> (handler vectoriel, opérandes, saut dépendant des registres)
+        self.machines = {}  # instance -> (cpu, memory) du chemin scalaire
+        self.peripherals = Peripherals()
+        self.vector_steps = 0
+        self.scalar_steps = 0
+        self.handlers = {
+            exec_load: self.load, exec_store: self.store, exec_branch: self.branch,
+            exec_jalr: self.jalr, exec_jal: self.jal, exec_lui: self.lui, exec_auipc: self.auipc,
+            exec_op_imm: self.op_imm, exec_op: self.op,
+        }
+
+    def write_inputs(self, address, data):
+        """Écrit data[i] (tableau (N, longueur) d'octets) à address dans le plan de chaque instance i."""
+        data = np.asarray(data, dtype=np.uint8).reshape(self.instances, -1)
+        if address < 0 or address + data.shape[1] > self.size:
+            raise MemoryError("Adresse invalide")
+        self.planes[:, address:address + data.shape[1]] = data
+
+    def set_register(self, index, values):
+        if index:
+            self.regs[:, index] = np.asarray(values, dtype=np.int64) & MASK_32
+
+    def machine(self, i):
+        """Machine scalaire de l'instance i : sa Memory partage les octets du plan (sans copie)."""
+        machine = self.machines.get(i)
+        if machine is None:
+            memory = Memory(self.size)
+            row = memoryview(self.planes[i])
+            memory.restore_pages((page, row[page << PAGE_SHIFT:(page + 1) << PAGE_SHIFT]) for page in range(len(row) >> PAGE_SHIFT))
+            machine = self.machines[i] = (RISCV_CPU(), memory)
+        return machine
+
+    def halt(self, idx, reason):
+        self.running[idx] = False
+        for i in np.atleast_1d(idx).tolist():
+            self.status[i] = reason
+
+    def scalar(self, idx, inst=None):
+        """Exécute une instruction pour chaque instance de idx avec l'interpréteur."""
+        for i in idx.tolist():
+            cpu, memory = self.machine(i)
+            cpu.regs[:] = self.regs[i].tolist()
+            cpu.pc = int(self.pc[i])
+            self.scalar_steps += 1
+            try:
+                word = memory.read(cpu.pc, 4) if inst is None else inst
+                if word == EBREAK:
+                    self.halt(i, "EBREAK")
+                    continue
+                execute_instruction(cpu, memory, word, self.peripherals, False, False)
+            except Exception as e:
+                self.halt(i, f"{type(e).__name__}: {e}")
+                continue
+            self.regs[i] = [value & MASK_32 for value in cpu.regs]
+            self.pc[i] = cpu.pc + 4
+
+    def in_bounds(self, idx, address):
+        """Sépare les accès alignés dans la mémoire (vectoriels) des autres (chemin scalaire)."""
+        ok = (address >= 0) & (address + 4 <= self.size) & ((address & 3) == 0)
+        if ok.all():
+            return idx, address, None
+        return idx[ok], address[ok], idx[~ok]
+
+    def load(self, idx, inst, rd, rs1, imm):
+        idx, address, slow = self.in_bounds(idx, self.regs[idx, rs1].astype(np.int64) + imm)
+        if rd:
+            self.regs[idx, rd] = self.words[idx, address >> 2]
+        self.pc[idx] += 4
+        return slow
+
+    def store(self, idx, inst, rs1, rs2, imm):
+        idx, address, slow = self.in_bounds(idx, self.regs[idx, rs1].astype(np.int64) + imm)
+        self.words[idx, address >> 2] = self.regs[idx, rs2]
+        self.pc[idx] += 4
+        return slow
+
+    def branch(self, idx, inst, rs1, rs2, imm):
+        taken = self.regs[idx, rs1] == self.regs[idx, rs2]
+        self.pc[idx] += np.where(taken, imm, 4) + 4
+
+    def jalr(self, idx, inst, rd, rs1, imm):
+        next_pc = self.pc[idx] + 4
+        if rd:
+            self.regs[idx, rd] = next_pc & MASK_32  # Écrit avant la lecture de rs1, comme exec_jalr
+        self.pc[idx] = ((self.regs[idx, rs1].astype(np.int64) + imm) & 0xFFFFFFFE) + 4
+
+    def jal(self, idx, inst, rd, imm):
+        next_pc = self.pc[idx] + 4
+        if rd:
+            self.regs[idx, rd] = next_pc & MASK_32
+        self.pc[idx] = ((self.pc[idx] + imm) & 0xFFFFFFFE) + 4
+
+    def lui(self, idx, inst, rd, imm):
+        if rd:
+            self.regs[idx, rd] = imm << 12
+        self.pc[idx] += 4
+
+    def auipc(self, idx, inst, rd, imm):
+        if rd:
+            self.regs[idx, rd] = (self.pc[idx] + imm) & MASK_32
+        self.pc[idx] += 4
+
+    def op_imm(self, idx, inst, rd, rs1, imm, funct3, funct7):
+        x = self.regs[idx, rs1]
+        if funct3 == 0b000:  # ADDI
+            result = x + np.uint32(imm)
+        elif funct3 in (0b010, 0b011):  # SLTI/SLTIU
+            result = (x < imm).astype(np.uint32)
+        elif funct3 == 0b100:  # XORI
+            result = x ^ np.uint32(imm)
+        elif funct3 == 0b110:  # ORI
+            result = x | np.uint32(imm)
+        elif funct3 == 0b111:  # ANDI
+            result = x & np.uint32(imm)
+        elif funct3 == 0b001:  # SLLI
+            result = x << np.uint32(imm)
+        elif funct3 == 0b101 and funct7 == 0b0000000:  # SRLI
+            result = x >> np.uint32(imm)
+        elif funct3 == 0b101 and funct7 == 0b0100000:  # SRAI, même formule que exec_op_imm
+            x = x.astype(np.uint64)
+            result = ((x >> np.uint64(imm)) | ((x & np.uint64(1 << (32 - imm))) >> np.uint64(32 - imm))).astype(np.uint32)
+        else:
+            return idx
+        if rd:
+            self.regs[idx, rd] = result
+        self.pc[idx] += 4
+
+    def op(self, idx, inst, rd, rs1, rs2, funct3, funct7):
+        x = self.regs[idx, rs1]
+        y = self.regs[idx, rs2]
+        slow = None
+        if funct7 == 0b0000001:  # Extension M
+            result = muldiv(funct3, x, y)
+        elif funct3 == 0b000 and funct7 == 0b0000000:  # ADD
+            result = x + y
+        elif funct3 == 0b000 and funct7 == 0b0100000:  # SUB
+            result = x - y
+        elif funct3 == 0b001:  # SLL
+            result = (x.astype(np.uint64) << np.minimum(y, 32).astype(np.uint64)).astype(np.uint32)
+        elif funct3 in (0b010, 0b011):  # SLT/SLTU
+            result = (x < y).astype(np.uint32)
+        elif funct3 == 0b100:  # XOR
+            result = x ^ y
+        elif funct3 == 0b101 and funct7 == 0b0000000:  # SRL
+            result = (x.astype(np.uint64) >> np.minimum(y, 32).astype(np.uint64)).astype(np.uint32)
+        elif funct3 == 0b101 and funct7 == 0b0100000:  # SRA, même formule que exec_op
+            ok = y <= 32  # Au-delà, exec_op lève une erreur (décalage négatif)
+            if not ok.all():
+                slow = idx[~ok]
+                idx, x, y = idx[ok], x[ok], y[ok]
+            x = x.astype(np.uint64)
+            y = y.astype(np.uint64)
+            result = ((x >> y) | ((x & (np.uint64(1) << (np.uint64(32) - y))) >> (np.uint64(32) - y))).astype(np.uint32)
+        elif funct3 == 0b110:  # OR
+            result = x | y
+        elif funct3 == 0b111:  # AND
+            result = x & y
+        else:
+            return idx
+        if rd:
+            self.regs[idx, rd] = result
+        self.pc[idx] += 4
+        return slow
+
+    def decode(self, inst):
+        entry = self.decoded.get(inst)
+        if entry is None:
+            dispatch = DISPATCH.get(inst & 0x7F)
+            if dispatch is None or inst == EBREAK:
+                entry = (None, (), True)
+            else:
+                fields, handler = dispatch
+                entry = (self.handlers[handler], fields(inst), handler in CONTROL_FLOW)
+            self.decoded[inst] = entry
+        return entry
+
+    def execute(self, idx, inst):
+        """Exécute inst pour les instances idx (toutes au même PC) ; retourne True si elles peuvent diverger."""
+        handler, operands, control = self.decode(inst)
+        if handler is None:
+            if inst == EBREAK:
+                self.steps[idx] += 1
+                self.halt(idx, "EBREAK")
+            else:
+                self.scalar(idx, inst)
+                self.steps[idx] += 1
+            return True
+        slow = handler(idx, inst, *operands)
+        if slow is not None and len(slow):
+            self.scalar(slow, inst)
+        self.vector_steps += 1
+        self.steps[idx] += 1
+        return slow is not None or control
+
+    def run(self, max_steps=None):
+        """Exécute toutes les instances jusqu'à leur arrêt (EBREAK, erreur ou max_steps instructions)."""
+        words = self.words
+        idx = None
+        while True:
+            if idx is None:
+                active = np.flatnonzero(self.running)
+                if not len(active):
+                    break
+                pcs = self.pc[active]
+                pc = int(pcs.min())
+                idx = active[pcs == pc]
+                converged = len(idx) == len(active)
+            if pc & 3 or pc < 0 or pc + 4 > self.size:
+                self.scalar(idx)  # Lecture de l'instruction par Memory : erreur ou accès non aligné
+                self.steps[idx] += 1
+                diverged = True
+            else:
+                insts = words[idx, pc >> 2]
+                first = int(insts[0])
+                if (insts == first).all():
+                    diverged = self.execute(idx, first)
+                else:
+                    # Code modifié différemment selon les instances : un groupe par instruction
+                    for inst in np.unique(insts).tolist():
+                        self.execute(idx[insts == inst], inst)
+                    diverged = True
+            if max_steps is not None:
+                limit = idx[self.running[idx] & (self.steps[idx] >= max_steps)]
+                if len(limit):
+                    self.halt(limit, "limit")
+                    diverged = True
+            if diverged or not converged:
+                idx = None
+            else:
+                pc = int(self.pc[idx[0]])  # Le groupe reste entier : même PC pour toutes les instances
+        return self.status
+
+    def report(self):
+        return {
+            "instances": self.instances,
+            "instructions": int(self.steps.sum()),
+            "vector_steps": self.vector_steps,
+            "scalar_steps": self.scalar_steps,
+            "status": dict(Counter(self.status)),
+            "per_instance": [
+                {"status": status, "steps": int(steps), "pc": int(pc), "regs": regs}
+                for status, steps, pc, regs in zip(self.status, self.steps.tolist(), self.pc.tolist(), self.regs.tolist())
+            ],
+        }
+
+def parse_sweep(text):
+    """REG=DEBUT[:PAS] : registre xREG de l'instance i initialisé à DEBUT + i * PAS."""
+    register, _, values = text.partition("=")
+    start, _, step = values.partition(":")
+    return int(register.lstrip("x")), int(start, 0), int(step, 0) if step else 1
+
+def main():
+    parser = argparse.ArgumentParser(description="Exécution vectorisée de N instances d'un binaire RISC-V")
+    parser.add_argument("binary_file", type=str, help="Fichier binaire contenant les instructions RISC-V")
+    parser.add_argument("--instances", type=int, default=1024, help="Nombre d'instances (défaut : 1024)")
+    parser.add_argument("--reset-addr", type=lambda x: int(x,0), default=None, help="Adresse de reset (défaut : point d'entrée d'un exécutable ELF, 0x100 pour un binaire brut)")
+    parser.add_argument("--mem-size", type=lambda x: int(x,0), default=64*1024, help="Taille de la mémoire de chaque instance en octets (défaut : 64KB)")
+    parser.add_argument("--snapshot", type=str, default=None, help="Démarrer toutes les instances depuis un instantané")
+    parser.add_argument("--max-steps", type=int, default=None, help="Nombre maximal d'instructions par instance")
+    parser.add_argument("--sweep", type=parse_sweep, action="append", default=[], metavar="REG=DEBUT[:PAS]", help="Initialiser xREG à DEBUT + i * PAS dans l'instance i (répétable)")
+    parser.add_argument("--inputs", type=str, default=None, metavar="FICHIER", help="Entrées : le fichier est découpé en N enregistrements de même taille, l'enregistrement i est écrit à --input-addr dans l'instance i")
+    parser.add_argument("--input-addr", type=lambda x: int(x,0), default=0x1000, help="Adresse des entrées (défaut : 0x1000)")
+    parser.add_argument("--report", type=str, default=None, metavar="FICHIER", help="Écrire l'état final de chaque instance au format JSON")
+    args = parser.parse_args()
+    if np is None:
+        parser.error("lockstep.py nécessite numpy (pip install numpy)")
+
+    cpu = RISCV_CPU()
+    memory = Memory(args.mem_size)
+    if args.snapshot:
+        load_snapshot(args.snapshot, cpu, memory, Peripherals())
+    else:
+        elf = memory.load_program(args.binary_file)
+        if args.reset_addr is None:
+            args.reset_addr = elf.entry if elf is not None else DEFAULT_RESET_ADDR
+        cpu.set_pc(args.reset_addr)
+    engine = Lockstep(memory, cpu, args.instances)
+    for register, start, step in args.sweep:
+        engine.set_register(register, start + step * np.arange(args.instances, dtype=np.int64))
+    if args.inputs:
+        data = np.fromfile(args.inputs, dtype=np.uint8)
+        if len(data) % args.instances:
+            parser.error(f"La taille de {args.inputs} n'est pas un multiple de {args.instances}")
+        engine.write_inputs(args.input_addr, data.reshape(args.instances, -1))
+
+    start = time.perf_counter()
+    engine.run(args.max_steps)
+    elapsed = time.perf_counter() - start
+    report = engine.report()
+    print(f"{report['instances']} instances, {report['instructions']} instructions en {elapsed:.3f} s ({report['instructions'] / elapsed / 1e6 if elapsed else 0.0:.2f} MIPS)")
+    print(f"Pas vectoriels : {report['vector_steps']} ({report['instructions'] / max(report['vector_steps'], 1):.1f} instances par pas), instructions scalaires : {report['scalar_steps']}")
+    for status, count in sorted(report["status"].items(), key=lambda item: -item[1]):
+        print(f"  {status}: {count}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
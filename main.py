@@ -1,11 +1,23 @@
 import argparse
-import csv
-from emulator import emu_loop, decode_instruction
+import sys
+from emulator import emu_loop
 from cpu import RISCV_CPU
-from memory import Memory
-from peripherals import Peripherals
-from decoder import get_encoding
-from outoforder import setup_ooo, reorder_instructions, reorder_results
+from memory import Memory, DEFAULT_RESET_ADDR
+from peripherals import Peripherals, FLUSH_POLICIES
+from disassembler import disassemble
+from outoforder import OoOConfig, OoOModel
+from translator import BlockTranslator
+from profiler import Profiler
+from cache import CacheHierarchy
+from predictor import BranchPredictor, PREDICTORS
+from results import make_result_sink, StreamResults
+from snapshot import save_snapshot, load_snapshot
+from tracer import TraceWriter, COMPRESSIONS
+from debugger import Debugger
+from coverage_map import Coverage, DEFAULT_MAP_SIZE
+from callgraph import CallGraph
+from idle import IdleLoops
+from smp import Hart, run_smp, gil_enabled, SMP_MODES, DEFAULT_QUANTUM
 
 def read_livrable_prop():
     try:
@@ -18,73 +30,228 @@ def read_livrable_prop():
     except (FileNotFoundError, ValueError):
         return 4  # Default value if invalid value
 
+def parse_watch(text):
+    address, _, length = text.partition(":")
+    return int(address, 0), int(length, 0) if length else 4
+
 def main():
     default_livrable = read_livrable_prop()
 
     parser = argparse.ArgumentParser(description="Emulateur RISC-V")
     parser.add_argument("binary_file", type=str, help="Fichier binaire contenant les instructions RISC-V")
-    parser.add_argument("--reset-addr", type=lambda x: int(x,0), default=0x100, help="Adresse de reset (défaut : 0x100)")
+    parser.add_argument("--reset-addr", type=lambda x: int(x,0), default=None, help="Adresse de reset (défaut : point d'entrée d'un exécutable ELF, 0x100 pour un binaire brut)")
     parser.add_argument("--mem-size", type=lambda x: int(x,0), default=512*1024, help="Taille de la mémoire en octets (défaut : 512KB)")
     parser.add_argument("--step", action="store_true", help="Activer le mode pas à pas")
+    parser.add_argument("--compressed", action="store_true", help="Activer l'extension C (instructions de 16 bits) pour l'exécution et le désassemblage")
     parser.add_argument("--livrable", type=int, choices=[1, 2, 3, 4], default=default_livrable, help="Numéro du livrable à tester (défaut : valeur dans livrable.prop)")
-    parser.add_argument("--ooo", action="store_true", help="Activer l'Out-of-Order Processing")
+    parser.add_argument("--break", dest="breakpoints", action="append", default=[], type=lambda x: int(x,0), metavar="ADRESSE", help="Point d'arrêt : passer en mode pas à pas avant l'instruction à cette adresse (répétable)")
+    parser.add_argument("--watch", dest="watchpoints", action="append", default=[], type=parse_watch, metavar="ADRESSE[:LONGUEUR]", help="Point de surveillance : passer en mode pas à pas après une écriture dans cette zone (répétable, 4 octets par défaut)")
+    parser.add_argument("--ooo", action="store_true", help="Estimer le temps d'exécution sur un cœur out-of-order (IPC, causes de blocage, occupation du ROB)")
+    parser.add_argument("--ooo-config", type=str, default=None, metavar="FICHIER", help="Configuration JSON du cœur out-of-order (largeur, tailles, unités, latences)")
+    parser.add_argument("--issue-width", type=int, default=None, help="Largeur du cœur out-of-order (défaut : 4)")
+    parser.add_argument("--rob-size", type=int, default=None, help="Nombre d'entrées du ROB (défaut : 64)")
+    parser.add_argument("--ooo-report", type=str, default=None, metavar="FICHIER", help="Écrire le rapport du modèle out-of-order au format JSON")
+    parser.add_argument("--cache", action="store_true", help="Simuler les caches L1I/L1D/L2 et afficher taux d'échec et temps moyen d'accès")
+    parser.add_argument("--cache-config", type=str, default=None, metavar="FICHIER", help="Configuration JSON des caches (implique --cache)")
+    parser.add_argument("--cache-report", type=str, default=None, metavar="FICHIER", help="Écrire le rapport des caches au format JSON")
+    parser.add_argument("--predictor", choices=PREDICTORS, default=None, help="Simuler la prédiction des sauts (utilisée aussi par --ooo)")
+    parser.add_argument("--predictor-entries", type=int, default=4096, help="Entrées des tables de prédiction (défaut : 4096)")
+    parser.add_argument("--history-bits", type=int, default=12, help="Bits d'historique global de gshare/tournament (défaut : 12)")
+    parser.add_argument("--btb-entries", type=int, default=512, help="Entrées du BTB (défaut : 512)")
+    parser.add_argument("--ras-depth", type=int, default=16, help="Profondeur de la pile d'adresses de retour (défaut : 16)")
+    parser.add_argument("--predictor-report", type=str, default=None, metavar="FICHIER", help="Écrire le rapport de prédiction au format JSON")
+    parser.add_argument("--harts", type=int, default=1, help="Nombre de harts partageant la mémoire (défaut : 1)")
+    parser.add_argument("--smp-mode", choices=SMP_MODES, default="round-robin", help="Ordonnancement des harts : tour de rôle déterministe, threads ou processus (défaut : round-robin)")
+    parser.add_argument("--quantum", type=int, default=DEFAULT_QUANTUM, help=f"Instructions par tour en mode round-robin (défaut : {DEFAULT_QUANTUM})")
+    parser.add_argument("--trace", type=str, default=None, metavar="FICHIER", help="Enregistrer une trace binaire de l'exécution (PC, instruction, écritures des registres et de la mémoire)")
+    parser.add_argument("--trace-compression", choices=COMPRESSIONS, default="none", help="Compression des blocs de la trace (défaut : none)")
+    parser.add_argument("--coverage", type=str, default=None, metavar="FICHIER", help="Écrire la carte de couverture des arêtes (ajoutée à la carte existante si le fichier existe)")
+    parser.add_argument("--coverage-shm", type=str, default=None, metavar="NOM", help="Carte de couverture dans le segment de mémoire partagée NOM (créé s'il n'existe pas)")
+    parser.add_argument("--coverage-size", type=int, default=DEFAULT_MAP_SIZE, help=f"Taille de la carte de couverture, puissance de 2 (défaut : {DEFAULT_MAP_SIZE})")
+    parser.add_argument("--coverage-report", type=str, default=None, metavar="FICHIER", help="Écrire les arêtes couvertes par fonction et par PC au format JSON")
+    parser.add_argument("--translate", action="store_true", help="Exécuter le code par blocs de base traduits en Python")
+    parser.add_argument("--results", choices=["all", "last", "stream", "none"], default="all", help="Collecte des résultats : tous, les N derniers, écriture au fil de l'eau ou aucune (défaut : all)")
+    parser.add_argument("--results-size", type=int, default=1000, help="Nombre de résultats conservés (last) ou taille des lots écrits (stream) (défaut : 1000)")
+    parser.add_argument("--results-file", type=str, default=None, help="Fichier de sortie des résultats en mode stream (défaut : sortie standard)")
+    parser.add_argument("--compact-results", action="store_true", help="Stocker les résultats entiers dans un tableau compact")
+    parser.add_argument("--snapshot", type=str, default=None, help="Démarrer depuis un instantané au lieu du binaire (restauré aussi par la commande reset)")
+    parser.add_argument("--save-snapshot", type=str, default=None, help="Enregistrer un instantané de la machine à la fin de l'exécution")
+    parser.add_argument("--max-steps", type=int, default=None, help="Nombre maximal d'instructions exécutées")
+    parser.add_argument("--flush", choices=FLUSH_POLICIES, default="line", help="Vidage des sorties des périphériques : à chaque ligne, tampon plein ou fin de bloc traduit (défaut : line)")
+    parser.add_argument("--io-buffer-size", type=int, default=4096, help="Taille du tampon des sorties des périphériques (défaut : 4096)")
+    parser.add_argument("--profile", nargs="?", const="profile.json", default=None, metavar="FICHIER", help="Profiler l'exécution et écrire le rapport JSON (défaut : profile.json)")
+    parser.add_argument("--callgraph", nargs="?", const="callgraph.folded", default=None, metavar="FICHIER", help="Suivre les appels et retours et écrire les piles repliées pour flamegraph (défaut : callgraph.folded)")
+    parser.add_argument("--callgraph-report", type=str, default=None, metavar="FICHIER", help="Écrire les compteurs inclusifs/exclusifs par fonction et par chemin d'appels au format JSON")
+    parser.add_argument("--skip-idle", action="store_true", help="Sauter les boucles de temporisation (calcul direct de leur état final) et dormir pendant l'attente de l'entrée standard")
     args = parser.parse_args()
+    if args.coverage_size <= 0 or args.coverage_size & (args.coverage_size - 1):
+        parser.error("--coverage-size doit être une puissance de 2")
+    if args.results_file and args.results != "stream":
+        parser.error("--results-file n'est utilisé qu'avec --results stream")
+    # Observateurs : hooks de la boucle de l'interpréteur, utilisables ensemble
+    observers = ("ooo", "cache", "cache_config", "predictor", "profile", "trace", "coverage", "coverage_shm", "coverage_report", "callgraph", "callgraph_report")
+    if args.translate:
+        for option in observers + ("skip_idle",):
+            if getattr(args, option):
+                parser.error(f"--{option.replace('_', '-')} n'est pas disponible avec --translate (blocs traduits sans hooks)")
+        if args.breakpoints or args.watchpoints:
+            parser.error("--break/--watch n'est pas disponible avec --translate (blocs traduits sans hooks)")
+    if args.skip_idle:
+        for option in observers:
+            if getattr(args, option):
+                parser.error(f"--{option.replace('_', '-')} n'est pas disponible avec --skip-idle (les itérations sautées ne sont pas observées)")
+        if args.breakpoints or args.watchpoints:
+            parser.error("--break/--watch n'est pas disponible avec --skip-idle (les itérations sautées ne sont pas observées)")
+    if args.harts > 1:
+        for option in ("step", "ooo", "cache", "cache_config", "predictor", "profile", "translate", "snapshot", "save_snapshot", "trace", "coverage", "coverage_shm", "coverage_report", "callgraph", "callgraph_report", "skip_idle"):
+            if getattr(args, option):
+                parser.error(f"--{option.replace('_', '-')} n'est pas disponible avec plusieurs harts")
+        if args.results == "stream":
+            parser.error("--results stream n'est pas disponible avec plusieurs harts")
+        if args.breakpoints or args.watchpoints:
+            parser.error("--break/--watch n'est pas disponible avec plusieurs harts")
 
     if args.livrable == 1:
-        livrable_1(args.binary_file)
+        livrable_1(args.binary_file, args.compressed)
     elif args.livrable == 2:
-        livrable_2(args.binary_file)
+        livrable_2(args.binary_file, args.compressed)
     else:
         cpu = RISCV_CPU()
         memory = Memory(args.mem_size)
-        peripherals = Peripherals()
-        memory.load_program(args.binary_file)
-        cpu.set_pc(args.reset_addr)
-
-        if args.ooo and (args.livrable == 3 or args.livrable == 4):
-            setup_ooo(cpu, memory, peripherals)
-            reorder_instructions(cpu, memory)
-
-        if args.livrable == 3: # livrable 3
-            result_stack = emu_loop(cpu, memory, peripherals, step_by_step=args.step, enable_peripherals=False, enable_semihosting=False)
-            if args.ooo:
-                result_stack = reorder_results(cpu, memory, result_stack)
-            print_results(result_stack)
-        elif args.livrable == 4: # livrable 4
-            result_stack = emu_loop(cpu, memory, peripherals, step_by_step=args.step, enable_peripherals=True, enable_semihosting=True)
-            if args.ooo:
-                result_stack = reorder_results(cpu, memory, result_stack)
-            print_results(result_stack)
+        peripherals = Peripherals(args.flush, args.io_buffer_size)
+        elf = None
+        if args.snapshot:
+            load_snapshot(args.snapshot, cpu, memory, peripherals)
+        else:
+            elf = memory.load_program(args.binary_file)
+            if args.reset_addr is None:
+                args.reset_addr = elf.entry if elf is not None else DEFAULT_RESET_ADDR
+            cpu.set_pc(args.reset_addr)
+        if args.compressed:
+            cpu.enable_extension("C")
+
+        if args.harts > 1:
+            run_harts(args, memory, peripherals)
+            return
+
+        translator = BlockTranslator(memory, cpu.has_extension("C")) if args.translate else None
+        symbols = elf.symbols if elf is not None else None
+        profiler = Profiler(symbols=symbols) if args.profile else None
+        predictor = None
+        if args.predictor:
+            predictor = BranchPredictor(args.predictor, args.predictor_entries, args.history_bits, args.btb_entries, args.ras_depth)
+        timing = None
+        if args.ooo:
+            overrides = {"issue_width": args.issue_width, "rob_size": args.rob_size}
+            config = OoOConfig.load(args.ooo_config, **overrides) if args.ooo_config else OoOConfig(**{key: value for key, value in overrides.items() if value is not None})
+            timing = OoOModel(config, predictor)
+        caches = None
+        if args.cache or args.cache_config:
+            caches = CacheHierarchy.load(args.cache_config) if args.cache_config else CacheHierarchy()
+        tracer = None
+        if args.trace:
+            tracer = TraceWriter(args.trace, args.trace_compression)
+            tracer.start(cpu, memory, peripherals)
+        coverage = None
+        if args.coverage or args.coverage_shm or args.coverage_report:
+            coverage = Coverage(args.coverage_size, args.coverage_shm, track_edges=args.coverage_report is not None, symbols=symbols)
+        callgraph = None
+        if args.callgraph or args.callgraph_report:
+            callgraph = CallGraph(cpu.get_pc(), symbols)
+        idle = IdleLoops() if args.skip_idle else None
+        debugger = Debugger()
+        for address in args.breakpoints:
+            debugger.add_breakpoint(address)
+        for address, length in args.watchpoints:
+            debugger.add_watchpoint(address, length)
+        results = make_result_sink(args.results, args.results_size, args.compact_results, args.results_file)
+        # Le prédicteur est alimenté par le modèle out-of-order quand il y en a un
+        hooks = [hook for hook in (profiler, timing, caches, predictor if timing is None else None, tracer, coverage, callgraph, idle) if hook is not None]
+
+        try:
+            if args.livrable == 3: # livrable 3
+                result_stack = emu_loop(cpu, memory, peripherals, step_by_step=args.step, enable_peripherals=False, enable_semihosting=False, translator=translator, hooks=hooks, debugger=debugger, result_stack=results, max_steps=args.max_steps, snapshot=args.snapshot)
+                print_results(result_stack)
+            elif args.livrable == 4: # livrable 4
+                result_stack = emu_loop(cpu, memory, peripherals, step_by_step=args.step, enable_peripherals=True, enable_semihosting=True, translator=translator, hooks=hooks, debugger=debugger, result_stack=results, max_steps=args.max_steps, snapshot=args.snapshot)
+                print_results(result_stack)
+        finally:
+            if translator is not None:
+                translator.close()
+            if isinstance(results, StreamResults):
+                results.close()  # Aussi après une erreur : résultats déjà produits et fichier fermé
+
+        if tracer is not None:
+            tracer.close(cpu)
+
+        if coverage is not None:
+            if args.coverage_report:
+                coverage.print_report(args.reset_addr)
+                coverage.write_json(args.coverage_report, args.reset_addr)
+            if args.coverage:
+                print(f"{args.coverage}: {coverage.write_map(args.coverage)} nouvelles positions couvertes")
+            coverage.close()
+
+        if callgraph is not None:
+            callgraph.print_report()
+            if args.callgraph:
+                callgraph.write_folded(args.callgraph)
+            if args.callgraph_report:
+                callgraph.write_json(args.callgraph_report)
+
+        if idle is not None:
+            idle.print_report()
+
+        if args.save_snapshot:
+            save_snapshot(args.save_snapshot, cpu, memory, peripherals)
+
+        if profiler is not None:
+            profiler.print_report()
+            profiler.write_json(args.profile)
+
+        if caches is not None:
+            caches.print_report()
+            if args.cache_report:
+                caches.write_json(args.cache_report)
+
+        if predictor is not None:
+            predictor.print_report()
+            if args.predictor_report:
+                predictor.write_json(args.predictor_report)
+
+        if timing is not None:
+            timing.print_report()
+            if args.ooo_report:
+                timing.write_json(args.ooo_report)
+
+# exécution multi-hart (livrables 3 et 4)
+def run_harts(args, memory, peripherals):
+    enable_io = args.livrable == 4
+    if args.smp_mode == "threads" and gil_enabled():
+        print("Remarque : le GIL est actif, les threads des harts ne s'exécutent pas en parallèle", file=sys.stderr)
+    harts = [Hart(hartid, args.reset_addr, make_result_sink(args.results, args.results_size, args.compact_results)) for hartid in range(args.harts)]
+    if args.compressed:
+        for hart in harts:
+            hart.cpu.enable_extension("C")
+    run_smp(harts, memory, peripherals, args.smp_mode, args.quantum, args.max_steps, enable_peripherals=enable_io, enable_semihosting=enable_io)
+    for hart in harts:
+        print(f"---HART {hart.cpu.hartid}--- {hart.status}")
+        print_results(hart.results)
 
 # livrable 1
-def livrable_1(binary_file):
-    with open(binary_file, "rb") as f, open("output.csv", "w", newline='') as csvfile:
-        csvwriter = csv.writer(csvfile)
-        csvwriter.writerow(["offset", "valeur", "opcode", "encoding"])
-        offset = 0
-        while chunk := f.read(4):
-            if len(chunk) < 4:
-                break
-            inst = int.from_bytes(chunk, 'little')
-            opcode = inst & 0x7F
-            encoding = get_encoding(opcode)
-            csvwriter.writerow([f"{offset:08x}", f"{inst:08x}", f"{opcode:08x}", encoding])
-            offset += 4
+def livrable_1(binary_file, compressed=False):
+    with open("output.csv", "w", newline='') as csvfile:
+        disassemble(binary_file, csv_out=csvfile, compressed=compressed)
 
 # livrable 2
-def livrable_2(binary_file):
-    with open(binary_file, "rb") as f:
-        offset = 0
-        while chunk := f.read(4):
-            if len(chunk) < 4:
-                break
-            inst = int.from_bytes(chunk, 'little')
-            disassembled_inst = decode_instruction(inst, mode=2)
-            print(f"{offset:08x}: {disassembled_inst}")
-            offset += 4
+def livrable_2(binary_file, compressed=False):
+    disassemble(binary_file, listing_out=sys.stdout, compressed=compressed)
 
 # sortie d'affichage
 def print_results(result_stack):
+    if isinstance(result_stack, StreamResults):
+        result_stack.close()  # déjà écrits au fil de l'exécution
+        return
     print("---RESULT-STACK---")
     for result in result_stack:
         print(f": {result}")
@@ -1,18 +1,220 @@
+import mmap
+import sys
+from elf import ElfFile, is_elf
+
+PAGE_SHIFT = 12  # Pages de 4 Ko
+PAGE_SIZE = 1 << PAGE_SHIFT
+PAGE_MASK = PAGE_SIZE - 1
+DEFAULT_RESET_ADDR = 0x100  # Adresse de départ d'un binaire brut
+# Les vues 'H' et 'I' suivent l'ordre des octets de l'hôte : elles ne servent
+# aux accès de 2 et 4 octets que sur un hôte petit-boutiste. Ailleurs ces
+# tailles ne correspondent à aucun accès et tout passe par int.from_bytes.
+LITTLE_ENDIAN = sys.byteorder == "little"
+HALF_VIEW = 2 if LITTLE_ENDIAN else None
+WORD_VIEW = 4 if LITTLE_ENDIAN else None
+
 class Memory:
+    """
+    Mémoire paginée : les pages de 4 Ko sont allouées au premier accès en
+    écriture, une page jamais écrite se lit comme des zéros. Les accès alignés
+    passent par des vues memoryview ('I', 'H', 'B') sans copie (voir
+    LITTLE_ENDIAN pour les hôtes gros-boutistes).
+    Bus des périphériques : map_device associe une plage d'adresses à un
+    périphérique (méthodes load(address, size) et store(address, value, size)).
+    Les pages des périphériques ne sont jamais allouées en RAM : elles ne sont
+    cherchées que lorsque la page accédée est absente ou hors de la mémoire,
+    les accès à la RAM ne font aucune vérification supplémentaire.
+    """
     def __init__(self, size):
         self.size = size
-        self.mem = bytearray(size)
+        self.pages = {}  # page -> (vue 'B', vue 'H', vue 'I')
+        self.image = None  # projection mmap (copie à l'écriture) du programme
+        self.code_pages = set()  # pages contenant des instructions pré-décodées
+        self.code_watchers = []
+        self.devices = {}  # page -> liste des plages (début, fin exclue, périphérique)
+
+    def add_code_watcher(self, watcher):
+        self.code_watchers.append(watcher)
+
+    def remove_code_watcher(self, watcher):
+        self.code_watchers.remove(watcher)
+
+    def invalidate_code(self, address, size):
+        for page in {address >> PAGE_SHIFT, (address + size - 1) >> PAGE_SHIFT}:
+            if page in self.code_pages:
+                self.code_pages.discard(page)
+                for watcher in self.code_watchers:
+                    watcher.invalidate_page(page)
+
+    def invalidate_all_code(self):
+        for page in list(self.code_pages):
+            self.invalidate_code(page << PAGE_SHIFT, 1)
+
+    def map_page(self, page, buffer):
+        view = memoryview(buffer)
+        views = (view, view.cast('H'), view.cast('I'))
+        self.pages[page] = views
+        return views
+
+    def map_device(self, start, length, device):
+        """Associe [start, start + length) au périphérique ; ses pages cessent d'être de la RAM."""
+        for page in range(start >> PAGE_SHIFT, ((start + length - 1) >> PAGE_SHIFT) + 1):
+            self.pages.pop(page, None)
+            self.devices.setdefault(page, []).append((start, start + length, device))
+
+    def unmap_device(self, device):
+        for page in list(self.devices):
+            regions = [region for region in self.devices[page] if region[2] is not device]
+            if regions:
+                self.devices[page] = regions
+            else:
+                del self.devices[page]
+
+    def find_device(self, address, size):
+        for start, end, device in self.devices.get(address >> PAGE_SHIFT, ()):
+            if start <= address and address + size <= end:
+                return device
+        raise MemoryError("Adresse invalide")
+
+    def page(self, page):
+        views = self.pages.get(page)
+        if views is None:
+            if page in self.devices:
+                raise MemoryError("Accès RAM à une page de périphérique")
+            # setdefault : si plusieurs harts allouent la même page en même temps, une seule est conservée
+            view = memoryview(bytearray(PAGE_SIZE))
+            views = self.pages.setdefault(page, (view, view.cast('H'), view.cast('I')))
+        return views
 
     def load_program(self, binary_file):
+        """
+        Charge un binaire brut à l'adresse 0, ou les segments d'un exécutable
+        ELF à leurs adresses. Retourne l'ElfFile (point d'entrée, symboles)
+        ou None pour un binaire brut.
+        """
+        if is_elf(binary_file):
+            elf = ElfFile(binary_file)
+            self.load_elf(elf)
+            return elf
         with open(binary_file, "rb") as f:
-            self.mem[:len(f.read())] = f.read()
+            length = f.seek(0, 2)
+            if length == 0:
+                return
+            self.image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        image = memoryview(self.image)
+        full_pages = length >> PAGE_SHIFT
+        for page in range(full_pages):
+            self.map_page(page, image[page << PAGE_SHIFT:(page + 1) << PAGE_SHIFT])
+        if length & PAGE_MASK:
+            last = bytearray(PAGE_SIZE)
+            last[:length & PAGE_MASK] = image[full_pages << PAGE_SHIFT:]
+            self.map_page(full_pages, last)
+
+    def load_elf(self, elf):
+        """
+        Associe les segments PT_LOAD aux pages de la mémoire. Une page
+        entièrement couverte par le fichier est une vue de la projection mmap
+        (lue par le système au premier accès, copiée à la première écriture) ;
+        seules les pages partielles (début et fin de segment) sont copiées. Le
+        reste du segment (BSS) n'est pas alloué : il se lit comme des zéros et
+        ses pages sont créées à la première écriture.
+        """
+        self.image = elf.image
+        image = memoryview(elf.image)
+        for address, offset, file_size, mem_size in elf.segments:
+            if address + mem_size > self.size:
+                raise MemoryError(f"Le segment {address:#x}-{address + mem_size - 1:#x} dépasse la taille de la mémoire")
+            end = address + file_size
+            while address < end:
+                start = address & PAGE_MASK
+                chunk = min(end - address, PAGE_SIZE - start)
+                if chunk == PAGE_SIZE:
+                    self.map_page(address >> PAGE_SHIFT, image[offset:offset + PAGE_SIZE])
+                else:
+                    self.page(address >> PAGE_SHIFT)[0][start:start + chunk] = image[offset:offset + chunk]
+                address += chunk
+                offset += chunk
+
+    def restore_pages(self, pages, image=None):
+        """Remplace tout le contenu de la mémoire par pages (numéro de page -> tampon de 4 Ko)."""
+        self.pages = {}
+        self.image = image
+        for page, buffer in pages:
+            self.map_page(page, buffer)
+        self.invalidate_all_code()
 
     def read(self, address, size):
-        if address + size > self.size:
-            raise MemoryError("Adresse invalide")
-        return int.from_bytes(self.mem[address:address+size], 'little')
+        if address < 0 or address + size > self.size:
+            return self.find_device(address, size).load(address, size)
+        offset = address & PAGE_MASK
+        views = self.pages.get(address >> PAGE_SHIFT)
+        if views is None:
+            if address >> PAGE_SHIFT in self.devices:
+                return self.find_device(address, size).load(address, size)
+            if offset + size <= PAGE_SIZE:
+                return 0
+        elif size == WORD_VIEW and not offset & 3:
+            return views[2][offset >> 2]
+        elif size == 1:
+            return views[0][offset]
+        elif size == HALF_VIEW and not offset & 1:
+            return views[1][offset >> 1]
+        return int.from_bytes(self.read_bytes(address, size), 'little')
 
     def write(self, address, value, size):
-        if address + size > self.size:
-            raise MemoryError("Adresse invalide")
-        self.mem[address:address+size] = value.to_bytes(size, 'little')
+        if address < 0 or address + size > self.size:
+            return self.find_device(address, size).store(address, value, size)
+        offset = address & PAGE_MASK
+        views = self.pages.get(address >> PAGE_SHIFT)
+        if views is None:
+            if address >> PAGE_SHIFT in self.devices:
+                return self.find_device(address, size).store(address, value, size)
+            views = self.page(address >> PAGE_SHIFT)
+        try:
+            if size == WORD_VIEW and not offset & 3:
+                views[2][offset >> 2] = value
+            elif size == 1:
+                views[0][offset] = value
+            elif size == HALF_VIEW and not offset & 1:
+                views[1][offset >> 1] = value
+            else:
+                self.write_bytes(address, value.to_bytes(size, 'little'))
+        except ValueError:
+            raise OverflowError(f"Valeur hors limites pour {size} octets : {value}")
+        if self.code_pages:
+            self.invalidate_code(address, size)
+
+    def read_bytes(self, address, length):
+        """Copie length octets à partir de address (peut traverser plusieurs pages)."""
+        data = bytearray(length)
+        pos = 0
+        while pos < length:
+            offset = (address + pos) & PAGE_MASK
+            chunk = min(length - pos, PAGE_SIZE - offset)
+            views = self.pages.get((address + pos) >> PAGE_SHIFT)
+            if views is not None:
+                data[pos:pos + chunk] = views[0][offset:offset + chunk]
+            pos += chunk
+        return data
+
+    def read_cstring(self, address, chunk=256):
+        """Lit une chaîne terminée par un octet nul, par blocs de chunk octets."""
+        data = bytearray()
+        while True:
+            length = min(chunk, self.size - address)
+            if address < 0 or length <= 0:
+                raise MemoryError("Adresse invalide")
+            block = self.read_bytes(address, length)
+            end = block.find(0)
+            if end >= 0:
+                return bytes(data + block[:end])
+            data += block
+            address += length
+
+    def write_bytes(self, address, data):
+        pos = 0
+        while pos < len(data):
+            offset = (address + pos) & PAGE_MASK
+            chunk = min(len(data) - pos, PAGE_SIZE - offset)
+            self.page((address + pos) >> PAGE_SHIFT)[0][offset:offset + chunk] = data[pos:pos + chunk]
+            pos += chunk
@@ -1,76 +1,323 @@
-from cpu import RISCV_CPU
-from memory import Memory
-from peripherals import Peripherals
-from decoder import decode_instruction, sign_extend
+import json
+from collections import deque
+from heapq import heappush, heappop
+from array import array
+from emulator import Hook
 
-# Structure pour la mémoire commune de l'ordonnancement
-class ReorderBuffer:
-    def __init__(self):
-        self.buffer = []
+# Classes d'instructions et unité fonctionnelle qui les exécute
+UNITS = {"alu": "alu", "mul": "muldiv", "div": "muldiv", "branch": "branch", "load": "mem", "store": "mem", "system": "alu"}
+CONTROL_CLASSES = ("branch",)
+PRUNE_PERIOD = 4096  # Nettoyage des tables d'occupation des unités toutes les PRUNE_PERIOD instructions
 
-    def add_instruction(self, inst):
-        self.buffer.append(inst)
+class OoOConfig:
+    """
+    Configuration du cœur out-of-order modélisé.
+    issue_width : instructions chargées, renommées, lancées et retirées par cycle.
+    rob_size / rs_size / phys_regs : tailles du ROB, de la station de réservation
+    (unifiée) et du banc de registres physiques (32 sont occupés par l'état
+    architectural).
+    frontend_depth : cycles entre le chargement et le renommage.
+    mispredict_penalty : cycles entre la résolution d'un saut mal prédit et le
+    chargement de l'instruction correcte.
+    units : nombre d'unités fonctionnelles (toutes pipelinées) ; latencies :
+    latence en cycles de chaque classe d'instructions.
+    """
+    def __init__(self, issue_width=4, fetch_width=None, rob_size=64, rs_size=32, phys_regs=96, frontend_depth=3, mispredict_penalty=1, units=None, latencies=None):
+        self.issue_width = issue_width
+        self.fetch_width = fetch_width or issue_width
+        self.rob_size = rob_size
+        self.rs_size = rs_size
+        self.phys_regs = phys_regs
+        self.frontend_depth = frontend_depth
+        self.mispredict_penalty = mispredict_penalty
+        self.units = {"alu": 2, "muldiv": 1, "branch": 1, "mem": 1}
+        self.units.update(units or {})
+        self.latencies = {"alu": 1, "mul": 3, "div": 20, "branch": 1, "load": 3, "store": 1, "system": 1}
+        self.latencies.update(latencies or {})
+        if phys_regs <= 32:
+            raise ValueError("phys_regs doit être supérieur à 32")
 
-    def commit_instruction(self):
-        if self.buffer:
-            return self.buffer.pop(0)
-        return None
+    @classmethod
+    def load(cls, path, **overrides):
+        """Lit une configuration JSON ; les valeurs de overrides différentes de None priment."""
+        with open(path, "r") as f:
+            values = json.load(f)
+        values.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(**values)
 
-    def is_empty(self):
-        return len(self.buffer) == 0
+    def to_dict(self):
+        return dict(vars(self))
 
-def setup_ooo(cpu, memory, peripherals):
-    cpu.rob = ReorderBuffer()
+def describe(inst):
+    """
+    Caractéristiques d'une instruction pour le modèle de timing :
+    (inst, classe, rd, registres sources, registre de base, déplacement).
+    """
+    opcode = inst & 0x7F
+    rd = (inst >> 7) & 0x1F
+    rs1 = (inst >> 15) & 0x1F
+    rs2 = (inst >> 20) & 0x1F
+    if opcode == 0b0000011:  # LOAD
+        imm = (inst >> 20) & 0xFFF
+        imm = imm - 0x1000 if imm & 0x800 else imm
+        return inst, "load", rd, (rs1,), rs1, imm
+    elif opcode == 0b0100011:  # STORE
+        imm = (((inst >> 25) & 0x7F) << 5) | ((inst >> 7) & 0x1F)
+        imm = imm - 0x1000 if imm & 0x800 else imm
+        return inst, "store", 0, (rs1, rs2), rs1, imm
+    elif opcode == 0b1100011:  # BRANCH
+        return inst, "branch", 0, (rs1, rs2), 0, 0
+    elif opcode == 0b1101111:  # JAL
+        return inst, "branch", rd, (), 0, 0
+    elif opcode == 0b1100111:  # JALR
+        return inst, "branch", rd, (rs1,), 0, 0
+    elif opcode == 0b0110111 or opcode == 0b0010111:  # LUI/AUIPC
+        return inst, "alu", rd, (), 0, 0
+    elif opcode == 0b0010011:  # OP_IMM
+        return inst, "alu", rd, (rs1,), 0, 0
+    elif opcode == 0b0110011:  # OP
+        if (inst >> 25) & 0x7F == 0b0000001:  # Extension M
+            return inst, "div" if (inst >> 12) & 0b100 else "mul", rd, (rs1, rs2), 0, 0
+        return inst, "alu", rd, (rs1, rs2), 0, 0
+    return inst, "system", 0, (), 0, 0
 
-# Fonction pour réordonner les instructions avant l'exécution
-def reorder_instructions(cpu, memory):
+class OoOModel(Hook):
+    """
+    Modèle de timing d'un cœur out-of-order, hook de l'émulateur
+    fonctionnel : les résultats du programme ne changent pas, le
+    modèle calcule pour chaque instruction exécutée ses cycles de chargement,
+    renommage, lancement, fin d'exécution et retrait.
+    - chargement dans l'ordre, fetch_width par cycle, groupe interrompu par
+      un saut pris ; sans predictor, BRANCH prédits non pris et JALR prédits
+      vers leur dernière cible ;
+    - renommage dans l'ordre, limité par les places libres du ROB, de la
+      station de réservation et des registres physiques (un registre est
+      libéré au retrait de l'instruction suivante qui écrit le même registre
+      architectural) ;
+    - lancement dans le désordre dès que les opérandes sont prêts (seules
+      les dépendances vraies comptent après renommage), qu'une unité est
+      libre et, pour un LOAD, que le dernier STORE au même mot est terminé ;
+    - retrait dans l'ordre, issue_width par cycle.
+    """
+    def __init__(self, config=None, predictor=None):
+        self.config = config or OoOConfig()
+        self.predictor = predictor  # predictor.BranchPredictor, sinon prédiction statique
+        self.descriptors = {}  # PC -> describe(inst)
+        self.reset()
 
-    binary_file = memory.mem
-    instructions = []
-    for i in range(0, len(binary_file), 4):
-        inst = int.from_bytes(binary_file[i:i+4], 'little')
-        instructions.append(inst)
+    def reset(self):
+        config = self.config
+        self.fetch_cycle = 0
+        self.fetch_slots = 0
+        self.redirect_cycle = 0  # premier cycle de chargement après un saut mal prédit
+        self.dispatch_cycle = 0
+        self.dispatch_slots = 0
+        self.commit_cycle = 0
+        self.commit_slots = 0
+        self.rob = deque()  # cycles de retrait des instructions du ROB
+        self.rs = []  # tas des cycles de lancement des instructions en station
+        self.free_regs = [0] * (config.phys_regs - 32)  # tas des cycles de libération des registres physiques
+        self.reg_ready = [0] * 32  # cycle où la dernière valeur de chaque registre est disponible
+        self.store_ready = {}  # mot mémoire -> fin du dernier STORE
+        self.busy = {unit: {} for unit in config.units}  # unité -> {cycle: unités occupées}
+        self.issued = {}  # cycle -> instructions lancées
+        self.targets = {}  # PC d'un JALR -> dernière cible
+        self.instructions = 0
+        self.classes = {}
+        self.branches = 0
+        self.mispredicts = 0
+        self.dispatch_stalls = {"frontend": 0, "branch_mispredict": 0, "rob_full": 0, "rs_full": 0, "regs_full": 0}
+        self.issue_wait = {"data_dependency": 0, "memory_dependency": 0, "functional_unit": 0}
+        self.commit_stalls = {}  # classe de l'instruction en tête du ROB -> cycles de retrait perdus
+        self.rob_cycles = 0  # somme des durées de séjour dans le ROB
+        self.rob_max = 0
+        self.rob_histogram = array('Q', bytes(8 * (config.rob_size + 1)))  # occupation vue au renommage
 
-    # Réordonner les instructions
-    reordered_instructions = reorder_logic(instructions)
+    def step(self, pc, desc, address, next_pc, size=4):
+        """Ajoute au modèle une instruction de size octets exécutée en pc ; next_pc est le PC fixé par son handler."""
+        config = self.config
+        _, cls, rd, srcs, _, _ = desc
+        width = config.issue_width
+        self.instructions += 1
+        self.classes[cls] = self.classes.get(cls, 0) + 1
 
-    for i, inst in enumerate(reordered_instructions):
-        memory.write(i * 4, inst, 4)
+        # Chargement
+        fetch = self.fetch_cycle
+        if self.fetch_slots >= config.fetch_width:
+            fetch += 1
+        redirected = self.redirect_cycle > fetch
+        if redirected:
+            fetch = self.redirect_cycle
+        if fetch != self.fetch_cycle:
+            self.fetch_cycle = fetch
+            self.fetch_slots = 0
+        self.fetch_slots += 1
 
-    for inst in reordered_instructions:
-        cpu.rob.add_instruction(inst)
+        # Renommage
+        dispatch = self.dispatch_cycle
+        if self.dispatch_slots >= width:
+            dispatch += 1
+        ready = fetch + config.frontend_depth
+        if ready > dispatch:
+            self.dispatch_stalls["branch_mispredict" if redirected else "frontend"] += ready - dispatch
+            dispatch = ready
+        rob = self.rob
+        while rob and rob[0] < dispatch:
+            rob.popleft()
+        if len(rob) >= config.rob_size:
+            free = rob.popleft() + 1
+            if free > dispatch:
+                self.dispatch_stalls["rob_full"] += free - dispatch
+                dispatch = free
+        rs = self.rs
+        while rs and rs[0] <= dispatch:
+            heappop(rs)
+        if len(rs) >= config.rs_size:
+            free = heappop(rs)
+            if free > dispatch:
+                self.dispatch_stalls["rs_full"] += free - dispatch
+                dispatch = free
+        if rd:
+            free = heappop(self.free_regs)
+            if free > dispatch:
+                self.dispatch_stalls["regs_full"] += free - dispatch
+                dispatch = free
+        while rob and rob[0] < dispatch:
+            rob.popleft()
+        if dispatch != self.dispatch_cycle:
+            self.dispatch_cycle = dispatch
+            self.dispatch_slots = 0
+        self.dispatch_slots += 1
+        occupancy = len(rob)
+        self.rob_histogram[occupancy] += 1
+        if occupancy + 1 > self.rob_max:
+            self.rob_max = occupancy + 1
 
-def reorder_results(cpu, memory, result_stack):
+        # Lancement
+        earliest = dispatch + 1
+        issue = earliest
+        reg_ready = self.reg_ready
+        for src in srcs:
+            if src and reg_ready[src] > issue:
+                issue = reg_ready[src]
+        self.issue_wait["data_dependency"] += issue - earliest
+        if cls == "load":
+            stored = self.store_ready.get(address >> 2, 0)
+            if stored > issue:
+                self.issue_wait["memory_dependency"] += stored - issue
+                issue = stored
+        unit = UNITS[cls]
+        busy = self.busy[unit]
+        count = config.units[unit]
+        issued = self.issued
+        start = issue
+        while busy.get(issue, 0) >= count or issued.get(issue, 0) >= width:
+            issue += 1
+        self.issue_wait["functional_unit"] += issue - start
+        busy[issue] = busy.get(issue, 0) + 1
+        issued[issue] = issued.get(issue, 0) + 1
+        heappush(rs, issue)
+        complete = issue + config.latencies[cls]
+        if rd:
+            reg_ready[rd] = complete
+        if cls == "store":
+            self.store_ready[address >> 2] = complete
 
-    reordered_results = []
-    while not cpu.rob.is_empty():
-        inst = cpu.rob.commit_instruction()
-        result = result_stack.pop(0)
-        reordered_results.append(result)
+        # Prédiction des sauts
+        if cls in CONTROL_CLASSES:
+            self.branches += 1
+            taken = next_pc != pc + size or desc[0] & 0x7F != 0b1100011
+            if self.predictor is not None:
+                correct = self.predictor.observe(pc, desc[0], taken, next_pc, size)
+            elif desc[0] & 0x7F == 0b1100111:  # JALR : dernière cible connue
+                correct = self.targets.get(pc) == next_pc
+                self.targets[pc] = next_pc
+            else:  # JAL toujours correct, BRANCH prédit non pris
+                correct = desc[0] & 0x7F == 0b1101111 or not taken
+            if not correct:
+                self.mispredicts += 1
+                self.redirect_cycle = complete + config.mispredict_penalty
+            elif taken:
+                self.fetch_slots = config.fetch_width  # Fin du groupe de chargement
 
-    return reordered_results
+        # Retrait
+        commit = self.commit_cycle
+        if self.commit_slots >= width:
+            commit += 1
+        if complete + 1 > commit:
+            self.commit_stalls[cls] = self.commit_stalls.get(cls, 0) + complete + 1 - commit
+            commit = complete + 1
+        if commit != self.commit_cycle:
+            self.commit_cycle = commit
+            self.commit_slots = 0
+        self.commit_slots += 1
+        rob.append(commit)
+        if rd:
+            heappush(self.free_regs, commit)  # Libère l'ancien registre physique de rd
+        self.rob_cycles += commit - dispatch
 
-# Fonction pour réordonner les instructions en fonction de leur type et de leurs dépendances
-def reorder_logic(instructions):
+        if not self.instructions % PRUNE_PERIOD:
+            self.prune()
 
-    dependencies = {}
-    independent_instructions = []
+    def prune(self):
+        """Oublie les cycles antérieurs au renommage courant : aucun lancement ne peut plus y avoir lieu."""
+        dispatch = self.dispatch_cycle
+        for unit, busy in self.busy.items():
+            self.busy[unit] = {cycle: n for cycle, n in busy.items() if cycle > dispatch}
+        self.issued = {cycle: n for cycle, n in self.issued.items() if cycle > dispatch}
 
-    for i, inst in enumerate(instructions):
-        opcode = inst & 0x7F
-        if opcode in [0b0000011, 0b0100011, 0b1100011, 0b1100111, 0b1101111, 0b0110111, 0b0010111, 0b0010011, 0b0110011, 0b1110011]:
-            # Instructions dépendantes
-            dependencies[i] = []
-        else:
-            # Instructions indépendantes
-            independent_instructions.append(i)
+    def begin(self, cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks):
+        self.cpu = cpu
 
-    reordered_instructions = [instructions[i] for i in independent_instructions]
+    def before(self, pc, entry):
+        inst = entry[0]
+        desc = self.descriptors.get(pc)
+        if desc is None or desc[0] != inst:
+            desc = self.descriptors[pc] = describe(inst)
+        self.current = desc
+        self.address = self.cpu.regs[desc[4]] + desc[5]  # Adresse calculée avant que rd n'écrase la base
 
-    while dependencies:
-        for i, deps in list(dependencies.items()):
-            if all(dep in reordered_instructions for dep in deps):
-                reordered_instructions.append(instructions[i])
-                del dependencies[i]
+    def after(self, pc, entry, result):
+        self.step(pc, self.current, self.address, self.cpu.pc, entry[3])
 
-    return reordered_instructions
\ No newline at end of file
+    def report(self):
+        cycles = self.commit_cycle
+        return {
+            "config": self.config.to_dict(),
+            "instructions": self.instructions,
+            "cycles": cycles,
+            "ipc": self.instructions / cycles if cycles else 0.0,
+            "classes": self.classes,
+            "branches": self.branches,
+            "mispredicts": self.mispredicts,
+            "dispatch_stalls": self.dispatch_stalls,
+            "issue_wait": self.issue_wait,
+            "commit_stalls": self.commit_stalls,
+            "rob_occupancy": {
+                "mean": self.rob_cycles / cycles if cycles else 0.0,
+                "max": self.rob_max,
+                "histogram": list(self.rob_histogram),
+            },
+        }
+
+    def print_report(self):
+        report = self.report()
+        cycles = max(report["cycles"], 1)
+        print("---OOO---")
+        print(f"Instructions : {report['instructions']}, cycles : {report['cycles']}, IPC : {report['ipc']:.3f}")
+        print(f"Sauts : {report['branches']}, mal prédits : {report['mispredicts']}")
+        print("Cycles de renommage perdus :")
+        for cause, count in report["dispatch_stalls"].items():
+            print(f"  {cause:<20} {count:>12} {100 * count / cycles:6.2f}%")
+        print("Attente en station (instructions x cycles) :")
+        for cause, count in report["issue_wait"].items():
+            print(f"  {cause:<20} {count:>12}")
+        print("Cycles de retrait perdus, par classe de l'instruction en tête du ROB :")
+        for cls, count in sorted(report["commit_stalls"].items(), key=lambda item: item[1], reverse=True):
+            print(f"  {cls:<20} {count:>12} {100 * count / cycles:6.2f}%")
+        occupancy = report["rob_occupancy"]
+        print(f"Occupation du ROB : moyenne {occupancy['mean']:.2f}, maximum {occupancy['max']} / {self.config.rob_size}")
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
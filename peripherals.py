@@ -1,25 +1,130 @@
 import sys
+import threading
+from collections import deque
+
+FLUSH_POLICIES = ("line", "size", "block")
 
 class Peripherals:
-    def __init__(self):
+    """
+    Périphériques d'entrée/sortie.
+    Les octets écrits sur stdout/stderr sont mis en tampon et vidés selon
+    flush_policy : "line" (à chaque saut de ligne), "size" (quand le tampon
+    atteint buffer_size) ou "block" (à la fin de chaque bloc traduit avec
+    --translate). Dans tous les cas le tampon est vidé quand il est plein et à
+    la fin de l'exécution.
+    L'entrée standard est lue par un thread en arrière-plan, démarré à la
+    première lecture du programme, qui remplit une file d'octets : la lecture
+    ne bloque jamais et renvoie 0 si aucun octet n'est disponible.
+    wait_stdin permet d'attendre un octet sans exécuter le programme (voir idle.py).
+    attach place les registres d'entrée/sortie sur le bus de la mémoire : seuls
+    les LOAD/STORE à ces adresses atteignent load et store.
+    """
+    def __init__(self, flush_policy="line", buffer_size=4096):
         self.stdout_addr = 0x4000004
         self.stderr_addr = 0x4000008
         self.stdin_addr = 0x4000000
+        self.flush_policy = flush_policy
+        self.buffer_size = buffer_size
+        self.stdout_buffer = []
+        self.stderr_buffer = []
+        self.stdin_bytes = deque()
+        self.stdin_thread = None
+        self.stdin_event = threading.Event()  # Signalé à chaque arrivée d'octets et à la fermeture de l'entrée
+        self.stdin_closed = False
+
+    def get_state(self):
+        self.flush()
+        return {"stdout_addr": self.stdout_addr, "stderr_addr": self.stderr_addr, "stdin_addr": self.stdin_addr, "stdin_pending": list(self.stdin_bytes)}
+
+    def set_state(self, state):
+        self.stdout_addr = state["stdout_addr"]
+        self.stderr_addr = state["stderr_addr"]
+        self.stdin_addr = state["stdin_addr"]
+        self.stdin_bytes = deque(state.get("stdin_pending", ()))
+
+    def write(self, buffer, text):
+        buffer.append(text)
+        if (self.flush_policy == "line" and "\n" in text) or len(buffer) >= self.buffer_size:
+            self.flush()
 
     def write_stdout(self, value):
-        print(chr(value & 0xFF), end='', flush=True)
+        self.write(self.stdout_buffer, chr(value & 0xFF))
 
     def write_stderr(self, value):
-        print(chr(value & 0xFF), end='', flush=True, file=sys.stderr)
+        self.write(self.stderr_buffer, chr(value & 0xFF))
+
+    def write_string(self, text):
+        self.write(self.stdout_buffer, text)
+
+    def flush(self):
+        # Les flux sont résolus à chaque vidage pour suivre les redirections (batch.py)
+        if self.stdout_buffer:
+            sys.stdout.write("".join(self.stdout_buffer))
+            self.stdout_buffer.clear()
+            sys.stdout.flush()
+        if self.stderr_buffer:
+            sys.stderr.write("".join(self.stderr_buffer))
+            self.stderr_buffer.clear()
+            sys.stderr.flush()
+
+    def start_stdin_reader(self):
+        self.stdin_thread = threading.Thread(target=self.stdin_reader, args=(sys.stdin,), daemon=True)
+        self.stdin_thread.start()
+
+    def stdin_reader(self, stream):
+        stream = getattr(stream, "buffer", stream)
+        read = getattr(stream, "read1", stream.read)
+        while True:
+            try:
+                data = read(4096)
+            except (OSError, ValueError):
+                data = None
+            if not data:
+                self.stdin_closed = True
+                self.stdin_event.set()
+                return
+            if isinstance(data, str):
+                data = data.encode()
+            self.stdin_bytes.extend(data)
+            self.stdin_event.set()
+
+    def wait_stdin(self, timeout=None):
+        """Attend qu'un octet soit disponible ; retourne False si l'entrée est fermée (ou timeout écoulé) sans octet."""
+        if self.stdin_thread is None:
+            self.start_stdin_reader()
+        while not self.stdin_bytes:
+            if self.stdin_closed:
+                return False
+            self.stdin_event.clear()
+            if self.stdin_bytes or self.stdin_closed:
+                continue  # Arrivés entre le test et clear
+            if not self.stdin_event.wait(timeout):
+                return False
+        return True
 
     def read_stdin(self):
-        return ord(input("Entrée : ")[0])
+        if self.stdin_thread is None:
+            self.start_stdin_reader()
+        try:
+            return self.stdin_bytes.popleft()
+        except IndexError:
+            return 0  # Aucun octet disponible
+
+    def attach(self, memory):
+        """Place les registres stdin, stdout et stderr (4 octets chacun) sur le bus de memory."""
+        for address in (self.stdin_addr, self.stdout_addr, self.stderr_addr):
+            memory.map_device(address, 4, self)
+
+    def detach(self, memory):
+        memory.unmap_device(self)
 
-    def handle_memory_access(self, address, value, is_write):
-        if address == self.stdout_addr and is_write:
+    def load(self, address, size):
+        if address == self.stdin_addr:
+            return self.read_stdin()
+        return 0
+
+    def store(self, address, value, size):
+        if address == self.stdout_addr:
             self.write_stdout(value)
-        elif address == self.stderr_addr and is_write:
+        elif address == self.stderr_addr:
             self.write_stderr(value)
-        elif address == self.stdin_addr and not is_write:
-            return self.read_stdin()
-        return None
\ No newline at end of file
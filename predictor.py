@@ -0,0 +1,254 @@
+import json
+from array import array
+from emulator import Hook, exec_branch, exec_jal, exec_jalr
+
+PREDICTORS = ("static", "bimodal", "gshare", "tournament")
+STATIC_MODES = ("not-taken", "taken", "btfn")
+LINK_REGISTERS = (1, 5)  # ra et t0 : registres de lien des appels
+
+# Les compteurs de direction sont des compteurs saturants sur 2 bits stockés
+# dans des array('B') : 0-1 prédisent non pris, 2-3 pris.
+
+class StaticPredictor:
+    """Prédiction fixe : jamais pris, toujours pris, ou pris vers l'arrière (btfn)."""
+    def __init__(self, mode="btfn"):
+        if mode not in STATIC_MODES:
+            raise ValueError(f"Mode statique inconnu : {mode}")
+        self.mode = mode
+
+    def predict(self, pc, inst):
+        if self.mode == "btfn":
+            return bool(inst >> 31)  # Bit de signe du déplacement
+        return self.mode == "taken"
+
+    def update(self, pc, inst, taken):
+        pass
+
+class BimodalPredictor:
+    """Table de compteurs 2 bits indexée par le PC."""
+    def __init__(self, entries=4096):
+        if entries & (entries - 1):
+            raise ValueError("Le nombre d'entrées doit être une puissance de 2")
+        self.mask = entries - 1
+        self.counters = array('B', [1]) * entries
+
+    def predict(self, pc, inst):
+        return self.counters[(pc >> 2) & self.mask] >= 2
+
+    def update(self, pc, inst, taken):
+        index = (pc >> 2) & self.mask
+        counter = self.counters[index]
+        if taken:
+            if counter < 3:
+                self.counters[index] = counter + 1
+        elif counter > 0:
+            self.counters[index] = counter - 1
+
+class GSharePredictor:
+    """Compteurs 2 bits indexés par le PC combiné (xor) à l'historique global des branchements."""
+    def __init__(self, entries=4096, history_bits=12):
+        if entries & (entries - 1):
+            raise ValueError("Le nombre d'entrées doit être une puissance de 2")
+        self.mask = entries - 1
+        self.history_mask = (1 << history_bits) - 1
+        self.history = 0
+        self.counters = array('B', [1]) * entries
+
+    def index(self, pc):
+        return ((pc >> 2) ^ self.history) & self.mask
+
+    def predict(self, pc, inst):
+        return self.counters[self.index(pc)] >= 2
+
+    def update(self, pc, inst, taken):
+        index = self.index(pc)
+        counter = self.counters[index]
+        if taken:
+            if counter < 3:
+                self.counters[index] = counter + 1
+        elif counter > 0:
+            self.counters[index] = counter - 1
+        self.history = ((self.history << 1) | taken) & self.history_mask
+
+class TournamentPredictor:
+    """Choix par PC (compteurs 2 bits) entre un prédicteur bimodal et un gshare."""
+    def __init__(self, entries=4096, history_bits=12):
+        self.bimodal = BimodalPredictor(entries)
+        self.gshare = GSharePredictor(entries, history_bits)
+        self.mask = entries - 1
+        self.chooser = array('B', [1]) * entries  # 2-3 : gshare
+
+    def predict(self, pc, inst):
+        if self.chooser[(pc >> 2) & self.mask] >= 2:
+            return self.gshare.predict(pc, inst)
+        return self.bimodal.predict(pc, inst)
+
+    def update(self, pc, inst, taken):
+        local = self.bimodal.predict(pc, inst) == taken
+        global_ = self.gshare.predict(pc, inst) == taken
+        if local != global_:
+            index = (pc >> 2) & self.mask
+            counter = self.chooser[index]
+            if global_ and counter < 3:
+                self.chooser[index] = counter + 1
+            elif local and counter > 0:
+                self.chooser[index] = counter - 1
+        self.bimodal.update(pc, inst, taken)
+        self.gshare.update(pc, inst, taken)
+
+class BranchTargetBuffer:
+    """BTB à correspondance directe : PC du saut et dernière cible, dans deux array('q')."""
+    def __init__(self, entries=512):
+        if entries & (entries - 1):
+            raise ValueError("Le nombre d'entrées doit être une puissance de 2")
+        self.mask = entries - 1
+        self.tags = array('q', [-1]) * entries
+        self.targets = array('q', bytes(8 * entries))
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, pc):
+        index = (pc >> 2) & self.mask
+        if self.tags[index] == pc:
+            self.hits += 1
+            return self.targets[index]
+        self.misses += 1
+        return None
+
+    def update(self, pc, target):
+        index = (pc >> 2) & self.mask
+        self.tags[index] = pc
+        self.targets[index] = target
+
+class ReturnAddressStack:
+    """Pile circulaire d'adresses de retour ; en cas de débordement, la plus ancienne est écrasée."""
+    def __init__(self, depth=16):
+        self.depth = depth
+        self.stack = array('q', bytes(8 * depth))
+        self.top = 0
+        self.count = 0
+
+    def push(self, address):
+        self.stack[self.top] = address
+        self.top = (self.top + 1) % self.depth
+        self.count = min(self.count + 1, self.depth)
+
+    def pop(self):
+        if not self.count:
+            return None
+        self.top = (self.top - 1) % self.depth
+        self.count -= 1
+        return self.stack[self.top]
+
+def make_direction_predictor(name, entries=4096, history_bits=12, static_mode="btfn"):
+    if name == "static":
+        return StaticPredictor(static_mode)
+    elif name == "bimodal":
+        return BimodalPredictor(entries)
+    elif name == "gshare":
+        return GSharePredictor(entries, history_bits)
+    elif name == "tournament":
+        return TournamentPredictor(entries, history_bits)
+    raise ValueError(f"Prédicteur inconnu : {name}")
+
+class BranchPredictor(Hook):
+    """
+    Prédiction des sauts observés pendant l'exécution.
+    - BRANCH : direction donnée par le prédicteur choisi, cible par le BTB
+      quand le branchement est prédit pris ;
+    - JAL : cible par le BTB, l'appel (rd = ra/t0) empile l'adresse de retour ;
+    - JALR : retour (rd = x0, rs1 = ra/t0) prédit par la pile d'adresses de
+      retour, autres sauts indirects par le BTB.
+    Les cibles sont les PC fixés par les handlers de emulator.py.
+    """
+    def __init__(self, name="gshare", entries=4096, history_bits=12, btb_entries=512, ras_depth=16, static_mode="btfn"):
+        self.name = name
+        self.settings = {"entries": entries, "history_bits": history_bits, "btb_entries": btb_entries, "ras_depth": ras_depth, "static_mode": static_mode}
+        self.direction = make_direction_predictor(name, entries, history_bits, static_mode)
+        self.btb = BranchTargetBuffer(btb_entries)
+        self.ras = ReturnAddressStack(ras_depth)
+        self.kinds = {}  # type de saut -> [exécutions, erreurs]
+        self.per_pc = {}  # PC -> [exécutions, erreurs, pris]
+
+    def observe(self, pc, inst, taken, target, size=4):
+        """Prédit puis met à jour pour le saut exécuté en pc ; retourne True si la prédiction était correcte."""
+        opcode = inst & 0x7F
+        rd = (inst >> 7) & 0x1F
+        if opcode == 0b1100011:  # BRANCH
+            kind = "branch"
+            if self.direction.predict(pc, inst):
+                correct = taken and self.btb.lookup(pc) == target
+            else:
+                correct = not taken
+            self.direction.update(pc, inst, taken)
+            if taken:
+                self.btb.update(pc, target)
+        else:
+            rs1 = (inst >> 15) & 0x1F
+            if opcode == 0b1100111 and rd == 0 and rs1 in LINK_REGISTERS:
+                kind = "return"
+                correct = self.ras.pop() == target
+            else:
+                kind = "call" if rd in LINK_REGISTERS else ("jump" if opcode == 0b1101111 else "indirect")
+                correct = self.btb.lookup(pc) == target
+                self.btb.update(pc, target)
+            if rd in LINK_REGISTERS:
+                self.ras.push(pc + size)
+        stats = self.kinds.get(kind)
+        if stats is None:
+            stats = self.kinds[kind] = [0, 0]
+        stats[0] += 1
+        entry = self.per_pc.get(pc)
+        if entry is None:
+            entry = self.per_pc[pc] = [0, 0, 0]
+        entry[0] += 1
+        entry[2] += taken
+        if not correct:
+            stats[1] += 1
+            entry[1] += 1
+        return correct
+
+    def begin(self, cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks):
+        self.cpu = cpu
+
+    def after(self, pc, entry, result):
+        inst, handler, operands, size = entry
+        if handler is exec_branch:
+            regs = self.cpu.regs
+            self.observe(pc, inst, regs[operands[0]] == regs[operands[1]], self.cpu.pc, size)  # BRANCH n'écrit aucun registre
+        elif handler is exec_jal or handler is exec_jalr:
+            self.observe(pc, inst, True, self.cpu.pc, size)
+
+    def report(self, top=20):
+        executed = sum(stats[0] for stats in self.kinds.values())
+        mispredicts = sum(stats[1] for stats in self.kinds.values())
+        worst = sorted(self.per_pc.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return {
+            "predictor": self.name,
+            "settings": self.settings,
+            "branches": executed,
+            "mispredicts": mispredicts,
+            "mispredict_rate": mispredicts / executed if executed else 0.0,
+            "kinds": {kind: {"count": count, "mispredicts": missed, "mispredict_rate": missed / count} for kind, (count, missed) in self.kinds.items()},
+            "btb": {"hits": self.btb.hits, "misses": self.btb.misses},
+            "per_pc": [
+                {"pc": pc, "count": count, "taken": taken, "mispredicts": missed, "mispredict_rate": missed / count}
+                for pc, (count, missed, taken) in worst
+            ],
+        }
+
+    def print_report(self, top=10):
+        report = self.report(top)
+        print("---PREDICTION---")
+        print(f"Prédicteur {report['predictor']} : {report['branches']} sauts, {report['mispredicts']} mal prédits ({100 * report['mispredict_rate']:.2f}%)")
+        for kind, stats in report["kinds"].items():
+            print(f"  {kind:<10} {stats['count']:>12} {stats['mispredicts']:>12} {100 * stats['mispredict_rate']:6.2f}%")
+        print(f"BTB : {report['btb']['hits']} succès, {report['btb']['misses']} échecs")
+        print("PC les plus mal prédits :")
+        for entry in report["per_pc"]:
+            if entry["mispredicts"]:
+                print(f"  {entry['pc']:08x}: {entry['mispredicts']} / {entry['count']} ({100 * entry['mispredict_rate']:.2f}%), pris {entry['taken']}")
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(100), f, indent=2)
@@ -0,0 +1,176 @@
+import json
+import time
+from array import array
+from memory import PAGE_SHIFT, PAGE_SIZE, PAGE_MASK
+from decoder import OPCODES, decode_instruction
+from emulator import DISPATCH, Hook, exec_branch
+
+SAMPLE_PERIOD = 61  # Une instruction sur SAMPLE_PERIOD est chronométrée (nombre premier pour limiter le repliement avec les boucles courtes)
+
+OPCODE_NAMES = {opcode: name for name, opcode in OPCODES.items()}
+
+class Profiler(Hook):
+    """
+    Profilage des programmes émulés.
+    Compte les exécutions par PC dans des tableaux par page (un compteur par
+    demi-mot), les branchements pris / non pris, et chronomètre une instruction
+    sur sample_period pour estimer le temps passé dans chaque handler.
+    Les compteurs par opcode et par handler sont déduits des compteurs par PC
+    au moment du rapport. Si le programme modifie une instruction déjà
+    exécutée (nouvelle entrée du cache de décodage), les exécutions de
+    l'ancienne instruction sont mises de côté sous la clé (PC, instruction).
+    symbols : SymbolIndex (voir elf.py) pour nommer les PC fonction+décalage
+    et regrouper les compteurs par fonction.
+    """
+    def __init__(self, sample_period=SAMPLE_PERIOD, symbols=None):
+        self.sample_period = sample_period
+        self.symbols = symbols
+        self.pages = {}  # page -> array des compteurs d'exécution
+        self.taken = {}  # PC du branchement -> nombre de fois pris
+        self.not_taken = {}
+        self.sampled_ns = {}  # nom du handler -> (appels chronométrés, temps total en ns)
+        self.instructions = {}  # PC -> mot d'instruction
+        self.entries = {}  # PC -> dernière entrée du cache de décodage vue
+        self.replaced = {}  # (PC, ancienne instruction) -> exécutions avant la modification du code
+        self.sample = sample_period  # Instructions restantes avant la prochaine mesure
+
+    def counters(self, page):
+        counts = self.pages.get(page)
+        if counts is None:
+            counts = self.pages[page] = array('Q', bytes(8 * (PAGE_SIZE >> 1)))
+        return counts
+
+    def begin(self, cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks):
+        self.cpu = cpu
+        self.started_ns = 0
+
+    def before(self, pc, entry):
+        if self.entries.get(pc) is not entry:
+            self.record(pc, entry)
+        counts = self.pages.get(pc >> PAGE_SHIFT)
+        if counts is None:
+            counts = self.counters(pc >> PAGE_SHIFT)
+        counts[(pc & PAGE_MASK) >> 1] += 1
+        self.sample -= 1
+        if not self.sample:
+            self.started_ns = time.perf_counter_ns()
+
+    def after(self, pc, entry, result):
+        inst, handler, operands, size = entry
+        if handler is exec_branch:
+            if self.cpu.pc == pc + size:
+                self.not_taken[pc] = self.not_taken.get(pc, 0) + 1
+            else:
+                self.taken[pc] = self.taken.get(pc, 0) + 1
+        if self.started_ns:
+            self.record_time(handler, time.perf_counter_ns() - self.started_ns)
+            self.started_ns = 0
+            self.sample = self.sample_period
+
+    def record(self, pc, entry):
+        """Nouvelle entrée du cache de décodage en pc : première exécution, ou instruction modifiée."""
+        inst = entry[0]
+        old = self.instructions.get(pc)
+        if old is not None and old != inst:
+            counts = self.counters(pc >> PAGE_SHIFT)
+            slot = (pc & PAGE_MASK) >> 1
+            if counts[slot]:
+                key = (pc, old)
+                self.replaced[key] = self.replaced.get(key, 0) + counts[slot]
+                counts[slot] = 0
+        self.instructions[pc] = inst
+        self.entries[pc] = entry
+
+    def record_time(self, handler, elapsed):
+        name = handler.__name__ if handler is not None else "execute_instruction"
+        calls, total = self.sampled_ns.get(name, (0, 0))
+        self.sampled_ns[name] = (calls + 1, total + elapsed)
+
+    def pc_counts(self):
+        """Compteurs non nuls, sous la forme {(PC, instruction): nombre d'exécutions}."""
+        counts = dict(self.replaced)
+        for page, page_counts in self.pages.items():
+            for slot, count in enumerate(page_counts):
+                if count:
+                    pc = (page << PAGE_SHIFT) | (slot << 1)
+                    key = (pc, self.instructions[pc])
+                    counts[key] = counts.get(key, 0) + count
+        return counts
+
+    def symbol(self, pc):
+        return self.symbols.format(pc) if self.symbols is not None else f"{pc:08x}"
+
+    def report(self, top=20):
+        pc_counts = self.pc_counts()
+        total = sum(pc_counts.values())
+        by_opcode = {}
+        by_handler = {}
+        for (pc, inst), count in pc_counts.items():
+            name = OPCODE_NAMES.get(inst & 0x7F, "UNKNOWN")
+            by_opcode[name] = by_opcode.get(name, 0) + count
+            handler = handler_name(inst)
+            by_handler[handler] = by_handler.get(handler, 0) + count
+        handlers = {}
+        for name, count in by_handler.items():
+            calls, elapsed = self.sampled_ns.get(name, (0, 0))
+            mean_ns = elapsed / calls if calls else None
+            handlers[name] = {
+                "count": count,
+                "sampled_calls": calls,
+                "mean_ns": mean_ns,
+                "estimated_total_ms": mean_ns * count / 1e6 if mean_ns is not None else None,
+            }
+        hot = sorted(pc_counts.items(), key=lambda item: item[1], reverse=True)[:top]
+        by_function = {}
+        if self.symbols is not None:
+            for (pc, inst), count in pc_counts.items():
+                found = self.symbols.lookup(pc)
+                name = found[0] if found is not None else "?"
+                by_function[name] = by_function.get(name, 0) + count
+        return {
+            "instructions": total,
+            "sample_period": self.sample_period,
+            "hot_spots": [
+                {"pc": pc, "symbol": self.symbol(pc), "count": count, "percent": 100 * count / max(total, 1), "instruction": f"{inst:08x}", "disassembly": decode_instruction(inst, mode=2)}
+                for (pc, inst), count in hot
+            ],
+            "functions": dict(sorted(by_function.items(), key=lambda item: item[1], reverse=True)),
+            "opcodes": dict(sorted(by_opcode.items(), key=lambda item: item[1], reverse=True)),
+            "handlers": dict(sorted(handlers.items(), key=lambda item: item[1]["count"], reverse=True)),
+            "branches": [
+                {"pc": pc, "taken": self.taken.get(pc, 0), "not_taken": self.not_taken.get(pc, 0)}
+                for pc in sorted(set(self.taken) | set(self.not_taken))
+            ],
+        }
+
+    def print_report(self, top=20):
+        report = self.report(top)
+        total = max(report["instructions"], 1)
+        print("---PROFIL---")
+        print(f"Instructions exécutées : {report['instructions']}")
+        print("Points chauds :")
+        for spot in report["hot_spots"]:
+            print(f"  {spot['symbol'] + ':':<9} {spot['count']:>12} {spot['percent']:6.2f}%  {spot['disassembly']}")
+        if report["functions"]:
+            print("Par fonction :")
+            for name, count in report["functions"].items():
+                print(f"  {name:<20} {count:>12} {100 * count / total:6.2f}%")
+        print("Par opcode :")
+        for name, count in report["opcodes"].items():
+            print(f"  {name:<10} {count:>12} {100 * count / total:6.2f}%")
+        print("Par handler :")
+        for name, stats in report["handlers"].items():
+            mean = f"{stats['mean_ns']:.0f} ns" if stats["mean_ns"] is not None else "-"
+            print(f"  {name:<20} {stats['count']:>12}  moyenne {mean}")
+        print("Branchements (pris / non pris) :")
+        for branch in report["branches"]:
+            print(f"  {self.symbol(branch['pc'])}: {branch['taken']} / {branch['not_taken']}")
+
+    def write_json(self, path, top=100):
+        with open(path, "w") as f:
+            json.dump(self.report(top), f, indent=2)
+
+def handler_name(inst):
+    """Nom du handler exécutant l'instruction (voir emulator.DISPATCH)."""
+    entry = DISPATCH.get(inst & 0x7F)
+    return entry[1].__name__ if entry is not None else "execute_instruction"
@@ -0,0 +1,138 @@
+import sys
+from array import array
+from collections import deque
+
+# Collecteurs de résultats utilisables à la place de la liste result_stack
+# d'emu_loop : ils exposent append(), extend() et l'itération.
+
+class RingBuffer(deque):
+    """Ne conserve que les capacity derniers résultats."""
+    def __init__(self, capacity):
+        super().__init__(maxlen=capacity)
+
+class CompactResults:
+    """
+    Résultats entiers stockés dans un array('q') (8 octets par résultat).
+    Les valeurs non représentables (None, "EBREAK", entiers hors 64 bits)
+    sont rangées à part, indexées par leur position.
+    Avec capacity, seuls les capacity derniers résultats sont conservés.
+    """
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.values = array('q', bytes(8 * capacity)) if capacity else array('q')
+        self.others = {}  # position -> valeur non entière ou hors limites
+        self.count = 0  # nombre total de résultats reçus
+
+    def append(self, value):
+        if self.capacity:
+            slot = self.count % self.capacity
+            if self.others:
+                self.others.pop(slot, None)
+            try:
+                self.values[slot] = value
+            except (TypeError, OverflowError):
+                self.others[slot] = value
+        else:
+            try:
+                self.values.append(value)
+            except (TypeError, OverflowError):
+                self.others[len(self.values)] = value
+                self.values.append(0)
+        self.count += 1
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def __len__(self):
+        return min(self.count, self.capacity) if self.capacity else self.count
+
+    def __iter__(self):
+        if self.capacity and self.count > self.capacity:
+            start = self.count % self.capacity
+            slots = list(range(start, self.capacity)) + list(range(start))
+        else:
+            slots = range(len(self))
+        for slot in slots:
+            yield self.others[slot] if slot in self.others else self.values[slot]
+
+class StreamResults:
+    """
+    Écrit les résultats au fur et à mesure, par lots de batch_size lignes,
+    au format de main.print_results ; rien n'est conservé en mémoire.
+    L'en-tête n'est écrit qu'avec le premier lot : un programme qui produit
+    moins de batch_size résultats garde la sortie de print_results.
+    Avec path, les résultats sont écrits dans ce fichier, fermé par close.
+    """
+    def __init__(self, out=None, batch_size=4096, path=None):
+        self.owned = path is not None
+        if self.owned:
+            out = open(path, "w")
+        self.out = out if out is not None else sys.stdout
+        self.batch_size = batch_size
+        self.buffer = []
+        self.count = 0
+        self.started = False
+
+    def append(self, value):
+        self.buffer.append(value)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def extend(self, values):
+        self.buffer.extend(values)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.started:
+            self.out.write("---RESULT-STACK---\n")
+            self.started = True
+        if self.buffer:
+            self.out.write("".join(f": {value}\n" for value in self.buffer))
+            self.count += len(self.buffer)
+            self.buffer.clear()
+        self.out.flush()
+
+    def close(self):
+        """Écrit les derniers résultats ; peut être appelé plusieurs fois."""
+        if self.out is None:
+            return
+        self.flush()
+        if self.owned:
+            self.out.close()
+        self.out = None
+
+    def __len__(self):
+        return self.count + len(self.buffer)
+
+    def __iter__(self):
+        return iter(())
+
+class NullResults:
+    """Collecte désactivée : les résultats sont ignorés."""
+    def append(self, value):
+        pass
+
+    def extend(self, values):
+        pass
+
+    def __len__(self):
+        return 0
+
+    def __iter__(self):
+        return iter(())
+
+def make_result_sink(mode="all", size=1000, compact=False, path=None):
+    """
+    Construit le collecteur de résultats demandé sur la ligne de commande.
+    mode : "all" (tous), "last" (les size derniers), "stream" (écriture par
+    lots de size résultats dans path ou sur la sortie standard), "none".
+    """
+    if mode == "last":
+        return CompactResults(size) if compact else RingBuffer(size)
+    elif mode == "stream":
+        return StreamResults(batch_size=size, path=path)
+    elif mode == "none":
+        return NullResults()
+    return CompactResults() if compact else []
@@ -0,0 +1,332 @@
+import argparse
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import socketserver
+import stat
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from cpu import RISCV_CPU, CSR_MISA, CSR_MHARTID, MISA
+from memory import Memory
+from peripherals import Peripherals
+from batch import load_jobs, run_job, write_report, DEFAULT_MEM_SIZE
+
+DEFAULT_SOCKET = "/tmp/riscv-emulator.sock"
+RESULT_CHUNK = 4096  # Résultats par message "results"
+
+# Protocole : une requête JSON par ligne, sur une socket Unix.
+#   {"id": ..., "binary_file": "/chemin/prog.bin", "reset_addr": 256, "mem_size": 524288,
+#    "snapshot": null, "livrable": 3, "max_steps": null}
+#   {"command": "shutdown"}
+# reset_addr null ou absent : point d'entrée d'un exécutable ELF, 0x100 pour un binaire brut.
+# Plusieurs requêtes peuvent être envoyées sur la même connexion ; elles sont
+# exécutées en parallèle et chaque réponse est une suite de lignes JSON
+# portant l'id de la requête :
+#   {"id": ..., "event": "output", "data": "..."}          sortie du programme et de l'émulateur, au fil de l'exécution
+#   {"id": ..., "event": "results", "values": [...]}       pile de résultats, par lots de RESULT_CHUNK
+#   {"id": ..., "event": "done", "exit_reason": ..., "instructions": ..., "wall_time": ..., "pc": ...}
+#   {"id": ..., "event": "error", "message": "..."}        requête invalide
+
+machine = None  # Machine du processus de travail, réutilisée d'un job à l'autre
+channel = None  # File du serveur recevant la sortie des jobs (voir EmulatorServer.relay)
+PERIPHERALS_STATE = Peripherals().get_state()
+
+def reset_machine(mem_size):
+    """Remet à zéro (ou crée) la machine du processus courant."""
+    global machine
+    if machine is None:
+        machine = RISCV_CPU(), Memory(mem_size), Peripherals()
+    cpu, memory, peripherals = machine
+    cpu.regs[:] = [0] * 32
+    cpu.set_pc(0)
+    cpu.csrs = {CSR_MISA: MISA, CSR_MHARTID: cpu.hartid}
+    memory.size = mem_size
+    memory.restore_pages(())
+    peripherals.flush()
+    peripherals.set_state(PERIPHERALS_STATE)
+    return machine
+
+def init_worker(output_queue):
+    global channel
+    channel = output_queue
+
+class OutputStream(io.TextIOBase):
+    """stdout/stderr d'un job, transmis au serveur à chaque écriture."""
+    def __init__(self, key):
+        self.key = key
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if text:
+            channel.put((self.key, text))
+        return len(text)
+
+def worker_job(key, job, livrable, max_steps):
+    return run_job(job, livrable, max_steps, reset_machine(job["mem_size"]), OutputStream(key))
+
+def parse_request(request):
+    """Job, livrable et limite d'instructions d'une requête ; ValueError si elle est invalide."""
+    if not isinstance(request, dict) or not isinstance(request.get("binary_file"), str):
+        raise ValueError("binary_file manquant")
+    livrable = request.get("livrable", 3)
+    if livrable not in (3, 4):
+        raise ValueError(f"Livrable invalide : {livrable}")
+    max_steps = request.get("max_steps")
+    if max_steps is not None and not isinstance(max_steps, int):
+        raise ValueError(f"max_steps invalide : {max_steps}")
+    job = {
+        "binary_file": request["binary_file"],
+        "reset_addr": None if request.get("reset_addr") is None else int(request["reset_addr"]),
+        "mem_size": int(request.get("mem_size", DEFAULT_MEM_SIZE)),
+        "snapshot": request.get("snapshot"),
+    }
+    return job, livrable, max_steps
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """
+    Une connexion : les requêtes sont soumises au pool dès leur lecture. Les
+    messages à envoyer passent par la file outbox, vidée par un thread
+    d'écriture propre à la connexion : un client qui ne lit plus ne bloque que
+    ses propres réponses.
+    """
+    def setup(self):
+        super().setup()
+        self.outbox = queue.Queue()
+        self.writer = threading.Thread(target=self.write_messages, name="server-writer", daemon=True)
+        self.writer.start()
+
+    def send(self, message):
+        self.outbox.put(message)
+
+    def write(self, message):
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+
+    def write_messages(self):
+        """Thread d'écriture : messages (dict) et jobs terminés (id, future, événement)."""
+        connected = True
+        while True:
+            item = self.outbox.get()
+            if item is None:
+                return
+            try:
+                if connected:
+                    if isinstance(item, dict):
+                        self.write(item)
+                    else:
+                        self.write_result(*item[:2])
+                    if self.outbox.empty():
+                        self.wfile.flush()
+            except OSError:
+                connected = False  # Client déconnecté : les messages suivants sont abandonnés
+            finally:
+                if not isinstance(item, dict):
+                    item[2].set()
+
+    def write_result(self, request_id, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self.write({"id": request_id, "event": "error", "message": f"{type(e).__name__}: {e}"})
+            return
+        values = result["result_stack"]
+        for start in range(0, len(values), RESULT_CHUNK):
+            self.write({"id": request_id, "event": "results", "values": values[start:start + RESULT_CHUNK]})
+        self.write({
+            "id": request_id, "event": "done",
+            "exit_reason": result["exit_reason"], "instructions": result["instructions"],
+            "wall_time": result["wall_time"], "pc": result["pc"],
+        })
+
+    def handle(self):
+        pending = []
+        try:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    self.send({"id": None, "event": "error", "message": f"JSON invalide : {e}"})
+                    continue
+                request_id = request.get("id") if isinstance(request, dict) else None
+                if isinstance(request, dict) and request.get("command") == "shutdown":
+                    self.send({"id": request_id, "event": "shutdown"})
+                    threading.Thread(target=self.server.shutdown).start()
+                    break
+                try:
+                    job, livrable, max_steps = parse_request(request)
+                except (ValueError, TypeError) as e:
+                    self.send({"id": request_id, "event": "error", "message": str(e)})
+                    continue
+                sent = threading.Event()
+                key = next(self.server.keys)
+                self.server.jobs[key] = (self.outbox, request_id, sent)  # Avant submit : la sortie peut arriver aussitôt
+                future = self.server.pool.submit(worker_job, key, job, livrable, max_steps)
+                future.add_done_callback(partial(self.server.job_done, key))
+                pending.append(sent)
+        except ConnectionError:
+            pass  # Client déconnecté : les jobs déjà soumis se terminent sans être lus
+        for sent in pending:
+            sent.wait()  # Garder la connexion ouverte jusqu'à l'envoi de toutes les réponses
+        self.outbox.put(None)
+        self.writer.join()
+
+def remove_stale_socket(path):
+    """
+    Supprime la socket laissée par une exécution précédente. OSError si path
+    n'est pas une socket ou si un service y répond encore.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(f"{path} existe et n'est pas une socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)  # Plus aucun service n'écoute
+            return
+    raise OSError(f"Un service écoute déjà sur {path}")
+
+class EmulatorServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Les processus du pool envoient la sortie des jobs sur la file channel ; le
+    thread relay la répartit dans la file outbox de chaque connexion. La fin
+    d'un job passe par la même file, après toute sa sortie : la réponse
+    complète n'est envoyée qu'une fois toute la sortie transmise.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, workers=None):
+        remove_stale_socket(path)
+        super().__init__(path, JobHandler)
+        self.manager = multiprocessing.Manager()
+        self.channel = self.manager.Queue()
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(self.channel,))
+        self.jobs = {}  # clé -> (outbox, id de la requête, événement signalé après l'envoi)
+        self.finished = {}  # clé -> future des jobs terminés, en attente du thread relay
+        self.keys = itertools.count()
+        self.relay_thread = threading.Thread(target=self.relay, name="server-relay", daemon=True)
+        self.relay_thread.start()
+
+    def job_done(self, key, future):
+        """Appelé par le pool : n'écrit rien, signale seulement la fin du job au thread relay."""
+        self.finished[key] = future
+        self.channel.put((key, None))
+
+    def relay(self):
+        while True:
+            item = self.channel.get()
+            if item is None:
+                return
+            key, data = item
+            outbox, request_id, sent = self.jobs[key]
+            if data is not None:
+                outbox.put({"id": request_id, "event": "output", "data": data})
+            else:
+                del self.jobs[key]
+                outbox.put((request_id, self.finished.pop(key), sent))
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+        self.channel.put(None)
+        self.relay_thread.join()
+        self.manager.shutdown()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+def serve(path=DEFAULT_SOCKET, workers=None):
+    with EmulatorServer(path, workers) as server:
+        print(f"En écoute sur {path}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+def request_lines(path, requests):
+    """Envoie les requêtes sur une connexion et génère les messages reçus jusqu'à la fin des réponses."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall(b"".join(json.dumps(request).encode() + b"\n" for request in requests))
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile("rb") as stream:
+            for line in stream:
+                yield json.loads(line)
+
+def submit(path, jobs, livrable=3, max_steps=None):
+    """Exécute les jobs sur le serveur ; retourne les résultats dans l'ordre des jobs (format de batch.run_job)."""
+    results = [
+        {**job, "exit_reason": None, "instructions": 0, "wall_time": 0.0, "pc": None, "output": "", "result_stack": []}
+        for job in jobs
+    ]
+    requests = [
+        {"id": i, **{**job, "binary_file": os.path.abspath(job["binary_file"]), "snapshot": job["snapshot"] and os.path.abspath(job["snapshot"])}, "livrable": livrable, "max_steps": max_steps}
+        for i, job in enumerate(jobs)
+    ]
+    for message in request_lines(path, requests):
+        if message["id"] is None:
+            raise ValueError(message.get("message"))
+        result = results[message["id"]]
+        if message["event"] == "output":
+            result["output"] += message["data"]
+        elif message["event"] == "results":
+            result["result_stack"].extend(message["values"])
+        elif message["event"] == "done":
+            for key in ("exit_reason", "instructions", "wall_time", "pc"):
+                result[key] = message[key]
+        elif message["event"] == "error":
+            result["exit_reason"] = f"Erreur : {message['message']}"
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Service d'émulation RISC-V sur socket Unix")
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET, help=f"Chemin de la socket (défaut : {DEFAULT_SOCKET})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Démarrer le service")
+    serve_parser.add_argument("--workers", type=int, default=None, help="Nombre de processus d'émulation (défaut : nombre de cœurs)")
+    submit_parser = commands.add_parser("submit", help="Exécuter des binaires sur le service")
+    submit_parser.add_argument("source", type=str, help="Fichier .bin/.elf, répertoire de binaires ou manifeste (voir batch.py)")
+    submit_parser.add_argument("--reset-addr", type=lambda x: int(x,0), default=None, help="Adresse de reset par défaut (défaut : point d'entrée ELF, 0x100 pour un binaire brut)")
+    submit_parser.add_argument("--mem-size", type=lambda x: int(x,0), default=DEFAULT_MEM_SIZE, help="Taille de la mémoire par défaut en octets (défaut : 512KB)")
+    submit_parser.add_argument("--snapshot", type=str, default=None, help="Instantané de départ commun")
+    submit_parser.add_argument("--livrable", type=int, choices=[3, 4], default=3, help="Livrable émulé (défaut : 3)")
+    submit_parser.add_argument("--max-steps", type=int, default=None, help="Nombre maximal d'instructions par binaire")
+    submit_parser.add_argument("--report", type=str, default=None, help="Fichier de rapport .json ou .csv")
+    commands.add_parser("stop", help="Arrêter le service")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            remove_stale_socket(args.socket)
+        except OSError as e:
+            parser.error(str(e))
+        serve(args.socket, args.workers)
+    elif args.command == "stop":
+        for message in request_lines(args.socket, [{"command": "shutdown"}]):
+            print("Service arrêté" if message["event"] == "shutdown" else message)
+    else:
+        jobs = load_jobs(args.source, args.reset_addr, args.mem_size, args.snapshot)
+        results = submit(args.socket, jobs, args.livrable, args.max_steps)
+        if args.report:
+            write_report(results, args.report)
+        for r in results:
+            if len(results) == 1:
+                sys.stdout.write(r["output"])
+                print("---RESULT-STACK---")
+                for value in r["result_stack"]:
+                    print(f": {value}")
+            print(f"{r['binary_file']}: {r['exit_reason']}, {r['instructions']} instructions, {r['wall_time']:.3f} s")
+
+if __name__ == "__main__":
+    main()
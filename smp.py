@@ -0,0 +1,184 @@
+import queue
+import sys
+import threading
+import multiprocessing
+from itertools import repeat
+from multiprocessing import shared_memory
+from cpu import RISCV_CPU
+from memory import PAGE_SHIFT, PAGE_SIZE
+from emulator import DecodeCache, run_interpreter
+
+SMP_MODES = ("round-robin", "threads", "processes")
+DEFAULT_QUANTUM = 1000  # Instructions exécutées par un hart avant de passer au suivant (round-robin)
+ZERO_PAGE = bytes(PAGE_SIZE)
+POLL_INTERVAL = 0.5  # Secondes entre deux vérifications des processus des harts (mode processes)
+
+class Hart:
+    """Un cœur : registres, PC et mhartid propres, résultats et état d'arrêt."""
+    def __init__(self, hartid, reset_addr, result_stack):
+        self.cpu = RISCV_CPU(hartid)
+        self.cpu.set_pc(reset_addr)
+        self.results = result_stack
+        self.steps = 0
+        self.status = None  # None tant que le hart s'exécute, puis "EBREAK", "limit" ou l'erreur
+
+def gil_enabled():
+    """Faux sur un CPython sans GIL (free-threaded), où les threads des harts s'exécutent en parallèle."""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled() if is_gil_enabled is not None else True
+
+def run_slice(hart, memory, lookup, peripherals, count, enable_peripherals, enable_semihosting):
+    """Exécute au plus count instructions (None : jusqu'à l'arrêt) ; met à jour hart.status."""
+    ticks = repeat(None) if count is None else repeat(None, count)
+    try:
+        if run_interpreter(hart.cpu, memory, lookup, peripherals, hart.results, enable_peripherals, enable_semihosting, ticks) == "EBREAK":
+            hart.status = "EBREAK"
+        elif count is not None:
+            hart.steps += count
+    except MemoryError as e:
+        hart.status = f"MemoryError: {e}"
+
+def run_round_robin(harts, memory, peripherals, quantum=DEFAULT_QUANTUM, max_steps=None, enable_peripherals=True, enable_semihosting=True):
+    """Ordonnancement déterministe : chaque hart exécute quantum instructions à tour de rôle."""
+    caches = [DecodeCache(memory, hart.cpu.has_extension("C")) for hart in harts]
+    try:
+        running = list(zip(harts, caches))
+        while running:
+            for hart, cache in running:
+                count = quantum if max_steps is None else min(quantum, max_steps - hart.steps)
+                run_slice(hart, memory, cache.lookup, peripherals, count, enable_peripherals, enable_semihosting)
+                if hart.status is None and max_steps is not None and hart.steps >= max_steps:
+                    hart.status = "limit"
+            running = [(hart, cache) for hart, cache in running if hart.status is None]
+    finally:
+        for cache in caches:
+            cache.close()
+
+def run_threads(harts, memory, peripherals, max_steps=None, enable_peripherals=True, enable_semihosting=True):
+    """Exécution libre, un thread par hart (en parallèle seulement sans GIL)."""
+    def run(hart):
+        cache = DecodeCache(memory, hart.cpu.has_extension("C"))
+        try:
+            run_slice(hart, memory, cache.lookup, peripherals, max_steps, enable_peripherals, enable_semihosting)
+            if hart.status is None:
+                hart.status = "limit"
+        finally:
+            cache.close()
+    threads = [threading.Thread(target=run, args=(hart,), name=f"hart{hart.cpu.hartid}") for hart in harts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def share_memory(memory):
+    """
+    Déplace toutes les pages de RAM de memory dans un segment
+    multiprocessing.shared_memory et retourne ce segment : les processus créés
+    ensuite écrivent dans la même mémoire. Les pages des périphériques
+    (memory.devices) restent sur le bus et ne sont pas associées au segment.
+    """
+    pages = -(-memory.size // PAGE_SIZE)
+    segment = shared_memory.SharedMemory(create=True, size=pages << PAGE_SHIFT)
+    buffer = segment.buf
+    for page, views in memory.pages.items():
+        if page < pages:
+            buffer[page << PAGE_SHIFT:(page + 1) << PAGE_SHIFT] = views[0]
+    memory.restore_pages(((page, buffer[page << PAGE_SHIFT:(page + 1) << PAGE_SHIFT]) for page in range(pages) if page not in memory.devices), segment)
+    return segment
+
+def unshare_memory(memory, segment):
+    """Recopie les pages écrites hors du segment partagé puis le libère."""
+    pages = []
+    for page, views in memory.pages.items():
+        if views[0] != ZERO_PAGE:
+            pages.append((page, bytearray(views[0])))
+        for view in reversed(views):
+            view.release()
+    memory.restore_pages(pages)
+    segment.close()
+    segment.unlink()
+
+def hart_process(hart, memory, peripherals, max_steps, enable_peripherals, enable_semihosting, results):
+    try:
+        cache = DecodeCache(memory, hart.cpu.has_extension("C"))
+        run_slice(hart, memory, cache.lookup, peripherals, max_steps, enable_peripherals, enable_semihosting)
+        peripherals.flush()
+    except Exception as e:
+        hart.status = f"{type(e).__name__}: {e}"
+    finally:
+        results.put((hart.cpu.hartid, hart.cpu.regs, hart.cpu.pc, hart.cpu.csrs, hart.status or "limit", list(hart.results)))
+
+def collect(by_id, state):
+    """Recopie dans son hart l'état renvoyé par hart_process."""
+    hartid, regs, pc, csrs, status, results = state
+    hart = by_id[hartid]
+    hart.cpu.regs[:] = regs
+    hart.cpu.pc = pc
+    hart.cpu.csrs = csrs
+    hart.status = status
+    hart.results.extend(results)
+
+def run_processes(harts, memory, peripherals, max_steps=None, enable_peripherals=True, enable_semihosting=True):
+    """
+    Exécution libre, un processus par hart. La mémoire est placée dans un
+    segment partagé hérité par fork ; chaque processus a son propre cache de
+    décodage, les modifications du code par un autre hart ne l'invalident pas.
+    Un processus qui se termine sans rendre son état (signal, os._exit) laisse
+    son hart dans l'état initial, avec une erreur pour statut.
+    """
+    context = multiprocessing.get_context("fork")
+    peripherals.flush()
+    sys.stdout.flush()
+    segment = share_memory(memory)
+    try:
+        results = context.Queue()
+        processes = {
+            hart.cpu.hartid: context.Process(target=hart_process, args=(hart, memory, peripherals, max_steps, enable_peripherals, enable_semihosting, results), name=f"hart{hart.cpu.hartid}")
+            for hart in harts
+        }
+        for process in processes.values():
+            process.start()
+        by_id = {hart.cpu.hartid: hart for hart in harts}
+        running = set(processes)
+        while running:
+            try:
+                state = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # Un processus terminé a écrit son état avant de sortir : le relire avant de le déclarer perdu
+                exited = [hartid for hartid in running if processes[hartid].exitcode is not None]
+                while True:
+                    try:
+                        state = results.get_nowait()
+                    except queue.Empty:
+                        break
+                    collect(by_id, state)
+                    running.discard(state[0])
+                for hartid in exited:
+                    if hartid in running:
+                        by_id[hartid].status = f"Processus du hart arrêté sans résultat (code de sortie {processes[hartid].exitcode})"
+                        running.discard(hartid)
+                continue
+            collect(by_id, state)
+            running.discard(state[0])
+        for process in processes.values():
+            process.join()
+    finally:
+        unshare_memory(memory, segment)
+
+def run_smp(harts, memory, peripherals, mode="round-robin", quantum=DEFAULT_QUANTUM, max_steps=None, enable_peripherals=True, enable_semihosting=True):
+    """Exécute tous les harts sur la mémoire commune jusqu'à leur arrêt (EBREAK, erreur ou max_steps)."""
+    if enable_peripherals:
+        peripherals.attach(memory)
+    try:
+        if mode == "round-robin":
+            run_round_robin(harts, memory, peripherals, quantum, max_steps, enable_peripherals, enable_semihosting)
+        elif mode == "threads":
+            run_threads(harts, memory, peripherals, max_steps, enable_peripherals, enable_semihosting)
+        elif mode == "processes":
+            run_processes(harts, memory, peripherals, max_steps, enable_peripherals, enable_semihosting)
+        else:
+            raise ValueError(f"Mode SMP inconnu : {mode}")
+    finally:
+        peripherals.detach(memory)
+        peripherals.flush()
+    return harts
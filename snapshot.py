@@ -0,0 +1,58 @@
+import json
+import mmap
+import struct
+from memory import PAGE_SHIFT, PAGE_SIZE
+
+# Format d'un instantané :
+#   8 octets   : signature SNAPSHOT_MAGIC
+#   4 octets   : longueur de l'en-tête JSON (petit-boutiste)
+#   en-tête    : JSON {pc, regs, csrs, mem_size, peripherals, pages}
+#   bourrage   : jusqu'à la frontière de 4 Ko suivante
+#   pages      : contenu des pages listées dans l'en-tête, 4 Ko chacune
+# Les pages sont alignées sur 4 Ko pour pouvoir être projetées directement
+# (mmap, copie à l'écriture) lors de la restauration.
+SNAPSHOT_MAGIC = b"RVSNAP\x00\x01"
+
+def save_snapshot(path, cpu, memory, peripherals):
+    """Enregistre registres, PC, pages mémoire allouées et état des périphériques."""
+    pages = sorted(memory.pages)
+    header = json.dumps({
+        "pc": cpu.get_pc(),
+        "regs": cpu.regs,
+        "csrs": {str(csr): value for csr, value in cpu.csrs.items()},
+        "mem_size": memory.size,
+        "peripherals": peripherals.get_state(),
+        "pages": pages,
+    }).encode()
+    data_offset = -(-(len(SNAPSHOT_MAGIC) + 4 + len(header)) // PAGE_SIZE) * PAGE_SIZE
+    with open(path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(bytes(data_offset - f.tell()))
+        for page in pages:
+            f.write(memory.pages[page][0])
+
+def load_snapshot(path, cpu, memory, peripherals):
+    """
+    Restaure un instantané enregistré par save_snapshot. Les pages sont
+    projetées depuis le fichier sans copie : seules celles que le programme
+    modifie sont dupliquées en mémoire.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} n'est pas un instantané valide")
+        header_length, = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_length))
+        data_offset = -(-(len(SNAPSHOT_MAGIC) + 4 + header_length) // PAGE_SIZE) * PAGE_SIZE
+        image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    view = memoryview(image)
+    memory.size = header["mem_size"]
+    memory.restore_pages(
+        ((page, view[data_offset + (i << PAGE_SHIFT):data_offset + ((i + 1) << PAGE_SHIFT)]) for i, page in enumerate(header["pages"])),
+        image,
+    )
+    cpu.regs[:] = header["regs"]
+    cpu.csrs.update({int(csr): value for csr, value in header.get("csrs", {}).items()})
+    cpu.set_pc(header["pc"])
+    peripherals.set_state(header["peripherals"])
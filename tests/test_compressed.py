@@ -0,0 +1,97 @@
+import contextlib
+import io
+import struct
+import unittest
+from benchmark import RESET_ADDR, MEM_SIZE
+from cpu import RISCV_CPU
+from memory import Memory
+from peripherals import Peripherals
+from emulator import emu_loop
+from decoder import encode_i, expand_compressed, instruction_length
+from translator import BlockTranslator
+
+# Instruction compressée -> instruction de 32 bits produite par l'assembleur GNU
+EXPANSIONS = {
+    0x0800: 0x01010413,  # c.addi4spn s0, sp, 16 -> addi s0, sp, 16
+    0x41C8: 0x0045A503,  # c.lw a0, 4(a1)
+    0xC588: 0x00A5A423,  # c.sw a0, 8(a1)
+    0x0001: 0x00000013,  # c.nop
+    0x157D: 0xFFF50513,  # c.addi a0, -1
+    0x4515: 0x00500513,  # c.li a0, 5
+    0x6505: 0x00001537,  # c.lui a0, 1
+    0x717D: 0xFF010113,  # c.addi16sp sp, -16
+    0x8109: 0x00255513,  # c.srli a0, 2
+    0x8509: 0x40255513,  # c.srai a0, 2
+    0x890D: 0x00357513,  # c.andi a0, 3
+    0x8D0D: 0x40B50533,  # c.sub a0, a1
+    0x8D6D: 0x00B57533,  # c.and a0, a1
+    0xA001: 0x0000006F,  # c.j 0
+    0x2021: 0x008000EF,  # c.jal 8
+    0xC501: 0x00050463,  # c.beqz a0, 8
+    0xE501: 0x00051463,  # c.bnez a0, 8
+    0x050A: 0x00251513,  # c.slli a0, 2
+    0x4512: 0x00412503,  # c.lwsp a0, 4(sp)
+    0xC42A: 0x00A12423,  # c.swsp a0, 8(sp)
+    0x852E: 0x00B00533,  # c.mv a0, a1
+    0x952E: 0x00B50533,  # c.add a0, a1
+    0x8082: 0x00008067,  # c.jr ra
+    0x9502: 0x000500E7,  # c.jalr a0
+    0x9002: 0x00100073,  # c.ebreak
+}
+
+# Encodages illégaux ou réservés en RV32C
+ILLEGAL = (
+    0x0000,  # c.addi4spn avec un immédiat nul
+    0x6501,  # c.lui avec un immédiat nul
+    0x150A,  # c.slli avec shamt[5] = 1
+    0x4012,  # c.lwsp avec rd = x0
+    0x8002,  # c.jr avec rs1 = x0
+)
+
+class ExpandCompressedTest(unittest.TestCase):
+    def test_expansions(self):
+        for parcel, inst in EXPANSIONS.items():
+            with self.subTest(f"{parcel:#06x}"):
+                self.assertEqual(expand_compressed(parcel), inst)
+                self.assertEqual(instruction_length(parcel), 2)
+
+    def test_illegal(self):
+        for parcel in ILLEGAL:
+            with self.subTest(f"{parcel:#06x}"):
+                self.assertIsNone(expand_compressed(parcel))
+
+    def test_length(self):
+        self.assertEqual(instruction_length(0x0513), 4)
+        self.assertEqual(instruction_length(0x0001), 2)
+
+# Instructions de 16 et 32 bits mêlées ; l'ADDI de 32 bits n'est aligné que sur 2 octets
+PROGRAM = b"".join((
+    struct.pack("<3H", 0x4515, 0x459D, 0x952E),  # c.li a0, 5 ; c.li a1, 7 ; c.add a0, a1
+    struct.pack("<I", encode_i(3, 10, 0b000, 12)),  # addi a2, a0, 3
+    struct.pack("<2H", 0x86B2, 0x9002),  # c.mv a3, a2 ; c.ebreak
+))
+
+def run(translate):
+    cpu = RISCV_CPU()
+    cpu.enable_extension("C")
+    memory = Memory(MEM_SIZE)
+    memory.write_bytes(RESET_ADDR, PROGRAM)
+    cpu.set_pc(RESET_ADDR)
+    translator = BlockTranslator(memory, compressed=True) if translate else None
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = emu_loop(cpu, memory, Peripherals(), enable_peripherals=False, enable_semihosting=False, translator=translator, halt_on_error=True)
+    finally:
+        if translator is not None:
+            translator.close()
+    return list(results), cpu.pc, list(cpu.regs)
+
+class CompressedExecutionTest(unittest.TestCase):
+    def test_mixed_lengths(self):
+        results, pc, regs = run(False)
+        self.assertEqual(pc, RESET_ADDR + 12)
+        self.assertEqual(regs[10:14], [12, 7, 15, 15])
+        self.assertEqual(run(True), (results, pc, regs))
+
+if __name__ == "__main__":
+    unittest.main()
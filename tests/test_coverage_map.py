@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import coverage_map
+from coverage_map import Coverage, classify, merge
+
+class CoverageMapTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def run_map(self, counts, size=16):
+        coverage = Coverage(size)
+        for index, count in counts.items():
+            coverage.bitmap[index] = count
+        return coverage
+
+    def test_merge_classifies_raw_maps_once(self):
+        total = bytearray(4)
+        self.assertEqual(merge(total, bytes([1, 3, 4, 32])), 4)
+        self.assertEqual(bytes(total), classify(bytes([1, 3, 4, 32])))
+        self.assertEqual(merge(total, bytes([1, 3, 4, 32])), 0)
+
+    def test_written_map_merges_without_new_positions(self):
+        coverage = self.run_map({0: 3, 1: 4, 2: 16, 3: 32})
+        self.assertEqual(coverage.write_map(self.path("run.map")), 4)
+        self.assertEqual(coverage.write_map(self.path("run.map")), 0)
+        with open(self.path("run.map"), "rb") as f:
+            written = f.read()
+        self.assertEqual(written, classify(coverage.bitmap))
+        total = bytearray(written)
+        self.assertEqual(merge(total, written, classified=True), 0)
+        self.assertEqual(bytes(total), written)
+
+    def test_cli_merges_written_maps(self):
+        self.run_map({0: 3, 1: 4}).write_map(self.path("a.map"))
+        self.run_map({1: 4, 2: 32}).write_map(self.path("b.map"))
+        argv = ["coverage_map.py", "--classified", self.path("total.map"), self.path("a.map"), self.path("b.map")]
+        with mock.patch.object(sys, "argv", argv), mock.patch("builtins.print"):
+            coverage_map.main()
+        with open(self.path("total.map"), "rb") as f:
+            total = f.read()
+        expected = bytearray(classify(self.run_map({0: 3, 1: 4}).bitmap))
+        merge(expected, self.run_map({1: 4, 2: 32}).bitmap)
+        self.assertEqual(total, bytes(expected))
+
+if __name__ == "__main__":
+    unittest.main()
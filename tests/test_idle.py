@@ -0,0 +1,78 @@
+import contextlib
+import io
+import unittest
+from benchmark import RESET_ADDR, MEM_SIZE, EBREAK, NOP, assemble, beq, jal, kernel_branch
+from decoder import encode_i, encode_r, encode_lui
+from cpu import RISCV_CPU
+from memory import Memory
+from peripherals import Peripherals
+from emulator import emu_loop
+from idle import IdleLoops
+
+# Deux boucles de temporisation : un compteur qui monte jusqu'à x2, puis un
+# compteur qui descend de x5 en x5 avec un accumulateur x4 += x6
+DELAY = assemble([
+    encode_lui(2, 2),  # x2 = 8192
+    "up",
+    encode_i(1, 1, 0b000, 1),  # addi x1, x1, 1
+    beq(1, 2, "down_init"),
+    NOP,
+    jal("up"),
+    "down_init",
+    encode_i(4, 0, 0b000, 5),  # addi x5, x0, 4
+    encode_i(7, 0, 0b000, 6),  # addi x6, x0, 7
+    encode_r(0, 1, 0, 0b000, 3),  # add x3, x0, x1
+    "down",
+    encode_r(0b0100000, 5, 3, 0b000, 3),  # sub x3, x3, x5
+    encode_r(0, 6, 4, 0b000, 4),  # add x4, x4, x6
+    beq(3, 0, "exit"),
+    NOP,
+    jal("down"),
+    "exit",
+    encode_i(1, 4, 0b000, 7),  # addi x7, x4, 1
+    EBREAK,
+])
+
+# Boucle infinie (while (1);) : seulement bornée par max_steps
+SPIN = assemble([
+    encode_i(5, 0, 0b000, 1),  # addi x1, x0, 5
+    "spin",
+    jal("spin"),
+])
+
+def run(program, idle=None, max_steps=None):
+    cpu = RISCV_CPU()
+    memory = Memory(MEM_SIZE)
+    memory.write_bytes(RESET_ADDR, program)
+    cpu.set_pc(RESET_ADDR)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = emu_loop(cpu, memory, Peripherals(), enable_peripherals=False, enable_semihosting=False, hooks=[idle] if idle is not None else [], max_steps=max_steps, halt_on_error=True)
+    return list(results), cpu.pc, list(cpu.regs)
+
+class SkipIdleEquivalenceTest(unittest.TestCase):
+    def assert_equivalent(self, program, max_steps=None):
+        idle = IdleLoops()
+        self.assertEqual(run(program, idle, max_steps), run(program, None, max_steps))
+        return idle
+
+    def test_delay_loops(self):
+        idle = self.assert_equivalent(DELAY)
+        self.assertEqual(idle.fast_forwards, 2)
+        self.assertGreater(idle.skipped_instructions, 8192)
+
+    def test_max_steps_inside_a_delay_loop(self):
+        for max_steps in (3, 100, 20000, 30000):
+            with self.subTest(max_steps):
+                self.assert_equivalent(DELAY, max_steps)
+
+    def test_infinite_loop_stops_at_max_steps(self):
+        idle = self.assert_equivalent(SPIN, 10000)
+        self.assertEqual(idle.fast_forwards, 1)
+
+    def test_other_loops_are_executed(self):
+        program = kernel_branch(4096)
+        idle = self.assert_equivalent(program)
+        self.assertEqual(idle.fast_forwards, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import contextlib
+import io
+import unittest
+from benchmark import RESET_ADDR, MEM_SIZE, EBREAK, NOP, KERNELS, assemble, beq, jal, kernel_mem_size
+from decoder import encode_i, encode_r
+import benchmark
+from cpu import RISCV_CPU
+from memory import Memory
+from peripherals import Peripherals
+from emulator import emu_loop
+from lockstep import Lockstep, np
+
+MASK_32 = 0xFFFFFFFF
+
+# Décompte de x10 jusqu'à zéro ; x7 et x9 comptent les passages impairs et
+# pairs : les instances dont x10 diffère divergent à chaque tour
+COUNTDOWN = assemble([
+    encode_i(1, 0, 0b000, 11),  # addi x11, x0, 1
+    "loop",
+    beq(10, 0, "exit"),
+    NOP,
+    encode_i(1, 10, 0b111, 6),  # andi x6, x10, 1
+    beq(6, 0, "even"),
+    NOP,
+    encode_i(1, 7, 0b000, 7),  # addi x7, x7, 1
+    jal("next"),
+    "even",
+    encode_i(1, 9, 0b000, 9),  # addi x9, x9, 1
+    "next",
+    encode_r(0b0100000, 11, 10, 0b000, 10),  # sub x10, x10, x11
+    jal("loop"),
+    "exit",
+    EBREAK,
+])
+
+def machine(code, mem_size=MEM_SIZE, regs=()):
+    cpu = RISCV_CPU()
+    memory = Memory(mem_size)
+    memory.write_bytes(RESET_ADDR, code)
+    cpu.set_pc(RESET_ADDR)
+    for index, value in regs:
+        cpu.set_reg(index, value)
+    return cpu, memory
+
+def interpret(cpu, memory, max_steps=None):
+    """Référence : emu_loop comme le livrable 3 ; retourne le nombre d'instructions (EBREAK compris)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = emu_loop(cpu, memory, Peripherals(), enable_peripherals=False, enable_semihosting=False, max_steps=max_steps, halt_on_error=True)
+    return len(results) + (max_steps is None or len(results) < max_steps)
+
+@unittest.skipIf(np is None, "numpy n'est pas installé")
+class LockstepTest(unittest.TestCase):
+    def assert_instance(self, engine, i, cpu, memory, steps):
+        self.assertEqual(int(engine.steps[i]), steps)
+        self.assertEqual(int(engine.pc[i]), cpu.pc)
+        self.assertEqual(engine.regs[i].tolist(), [value & MASK_32 for value in cpu.regs])
+        self.assertEqual(engine.planes[i, :memory.size].tobytes(), memory.read_bytes(0, memory.size))
+
+    def test_kernels(self):
+        for name in KERNELS:
+            with self.subTest(name):
+                code = getattr(benchmark, f"kernel_{name}")(4096)
+                mem_size = kernel_mem_size(name, 4096)
+                engine = Lockstep(*machine(code, mem_size)[::-1], 3)
+                self.assertEqual(engine.run(), ["EBREAK"] * 3)
+                cpu, memory = machine(code, mem_size)
+                steps = interpret(cpu, memory)
+                for i in range(3):
+                    self.assert_instance(engine, i, cpu, memory, steps)
+
+    def test_divergent_branches(self):
+        # Comme --sweep 10=3:5 : x10 = 3 + 5 * i dans l'instance i
+        instances = 6
+        cpu, memory = machine(COUNTDOWN)
+        engine = Lockstep(memory, cpu, instances)
+        engine.set_register(10, 3 + 5 * np.arange(instances, dtype=np.int64))
+        self.assertEqual(engine.run(), ["EBREAK"] * instances)
+        for i in range(instances):
+            with self.subTest(instance=i):
+                cpu, memory = machine(COUNTDOWN, regs=[(10, 3 + 5 * i)])
+                self.assert_instance(engine, i, cpu, memory, interpret(cpu, memory))
+                self.assertEqual((cpu.regs[7], cpu.regs[9]), ((3 + 5 * i + 1) // 2, (3 + 5 * i) // 2))
+
+    def test_max_steps(self):
+        instances = 4
+        cpu, memory = machine(COUNTDOWN)
+        engine = Lockstep(memory, cpu, instances)
+        engine.set_register(10, [1, 2, 30, 40])
+        self.assertEqual(engine.run(max_steps=100), ["EBREAK", "EBREAK", "limit", "limit"])
+        for i, start in enumerate([1, 2, 30, 40]):
+            with self.subTest(instance=i):
+                cpu, memory = machine(COUNTDOWN, regs=[(10, start)])
+                self.assert_instance(engine, i, cpu, memory, interpret(cpu, memory, max_steps=100))
+
+if __name__ == "__main__":
+    unittest.main()
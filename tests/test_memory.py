@@ -0,0 +1,40 @@
+import unittest
+from unittest import mock
+import memory as memory_module
+from memory import Memory, PAGE_SIZE
+
+# (adresse, taille, valeur) : accès alignés, non alignés et à cheval sur deux pages
+ACCESSES = (
+    (0x100, 4, 0x12345678),
+    (0x104, 2, 0xBEEF),
+    (0x107, 1, 0xA5),
+    (0x10A, 2, 0x1357),
+    (0x10D, 4, 0xCAFEF00D),
+    (PAGE_SIZE - 2, 4, 0x89ABCDEF),
+)
+
+class ByteOrderTest(unittest.TestCase):
+    def check(self):
+        memory = Memory(4 * PAGE_SIZE)
+        for address, size, value in ACCESSES:
+            with self.subTest(address=hex(address), size=size):
+                memory.write(address, value, size)
+                self.assertEqual(memory.read(address, size), value)
+                self.assertEqual(bytes(memory.read_bytes(address, size)), value.to_bytes(size, "little"))
+        memory.write_bytes(0x200, bytes.fromhex("0102030405060708"))
+        self.assertEqual(memory.read(0x200, 4), 0x04030201)
+        self.assertEqual(memory.read(0x204, 2), 0x0605)
+        self.assertEqual(memory.read(0x206, 2), 0x0807)
+        with self.assertRaises(OverflowError):
+            memory.write(0x300, -1, 4)
+
+    def test_host_views(self):
+        self.check()
+
+    def test_big_endian_host(self):
+        # Comme sur un hôte gros-boutiste : aucun accès par les vues 'H' et 'I'
+        with mock.patch.object(memory_module, "HALF_VIEW", None), mock.patch.object(memory_module, "WORD_VIEW", None):
+            self.check()
+
+if __name__ == "__main__":
+    unittest.main()
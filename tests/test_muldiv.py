@@ -0,0 +1,75 @@
+import unittest
+from cpu import RISCV_CPU
+from decoder import M_MNEMONICS, decode_instruction, encode_r
+from emulator import exec_op, muldiv
+
+FUNCT3 = {name: funct3 for funct3, name in enumerate(M_MNEMONICS)}
+MIN = -(1 << 31)
+
+# (instruction, rs1, rs2, résultat sur 32 bits), opérandes signés
+CASES = (
+    ("MUL", -3, 7, 0xFFFFFFEB),
+    ("MUL", MIN, 2, 0),
+    ("MUL", 0x10000, 0x10000, 0),
+    ("MULH", -3, 7, 0xFFFFFFFF),
+    ("MULH", MIN, MIN, 0x40000000),
+    ("MULH", 0x7FFFFFFF, 0x7FFFFFFF, 0x3FFFFFFF),
+    ("MULH", MIN, 0x7FFFFFFF, 0xC0000000),
+    ("MULHSU", -1, -1, 0xFFFFFFFF),  # -1 * 0xFFFFFFFF
+    ("MULHSU", -2, 3, 0xFFFFFFFF),
+    ("MULHSU", 2, -1, 1),  # rs2 non signé : 2 * 0xFFFFFFFF
+    ("MULHSU", MIN, -1, 0x80000000),
+    ("MULHU", -1, -1, 0xFFFFFFFE),
+    ("MULHU", -3, 2, 1),
+    ("DIV", 7, -2, 0xFFFFFFFD),  # Tronquée vers zéro
+    ("DIV", -7, 2, 0xFFFFFFFD),
+    ("DIV", -7, -2, 3),
+    ("DIV", 5, 0, 0xFFFFFFFF),
+    ("DIV", MIN, -1, 0x80000000),  # Dépassement
+    ("DIVU", -7, 2, 0x7FFFFFFC),
+    ("DIVU", 5, 0, 0xFFFFFFFF),
+    ("DIVU", MIN, -1, 0),
+    ("REM", 7, -2, 1),  # Du signe du dividende
+    ("REM", -7, 2, 0xFFFFFFFF),
+    ("REM", -7, -2, 0xFFFFFFFF),
+    ("REM", -7, 0, 0xFFFFFFF9),
+    ("REM", MIN, -1, 0),
+    ("REMU", -7, 2, 1),
+    ("REMU", -7, 0, 0xFFFFFFF9),
+    ("REMU", 7, -2, 7),
+)
+
+class MulDivTest(unittest.TestCase):
+    def test_muldiv(self):
+        for name, a, b, expected in CASES:
+            with self.subTest(name=name, a=a, b=b):
+                self.assertEqual(muldiv(FUNCT3[name], a, b), expected)
+                # Les registres peuvent aussi contenir les valeurs réduites à 32 bits
+                self.assertEqual(muldiv(FUNCT3[name], a & 0xFFFFFFFF, b & 0xFFFFFFFF), expected)
+
+    def test_exec_op(self):
+        for name, a, b, expected in CASES:
+            with self.subTest(name=name, a=a, b=b):
+                cpu = RISCV_CPU()
+                cpu.set_reg(1, a)
+                cpu.set_reg(2, b)
+                exec_op(cpu, None, 3, 1, 2, FUNCT3[name], 0b0000001)
+                self.assertEqual(cpu.get_reg(3) & 0xFFFFFFFF, expected)
+                self.assertEqual((cpu.get_reg(1), cpu.get_reg(2)), (a, b))
+
+    def test_rd_x0(self):
+        cpu = RISCV_CPU()
+        cpu.set_reg(1, 6)
+        cpu.set_reg(2, 7)
+        exec_op(cpu, None, 0, 1, 2, FUNCT3["MUL"], 0b0000001)
+        self.assertEqual(cpu.get_reg(0), 0)
+
+    def test_mnemonics(self):
+        expected = ("MUL", "MULH", "MULHSU", "MULHU", "DIV", "DIVU", "REM", "REMU")
+        for funct3, name in enumerate(expected):
+            with self.subTest(name=name):
+                self.assertEqual(decode_instruction(encode_r(0b0000001, 2, 1, funct3, 3)), f"{name} x3, x1, x2")
+        self.assertEqual(decode_instruction(encode_r(0b0000000, 2, 1, 0b000, 3)), "OP x3, x1, x2")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from results import StreamResults
+
+class StreamResultsTest(unittest.TestCase):
+    def test_header_with_first_batch(self):
+        out = io.StringIO()
+        results = StreamResults(out, batch_size=2)
+        self.assertEqual(out.getvalue(), "")  # La sortie du programme peut précéder les résultats
+        results.append(1)
+        self.assertEqual(out.getvalue(), "")
+        results.append(2)
+        self.assertEqual(out.getvalue(), "---RESULT-STACK---\n: 1\n: 2\n")
+        results.extend([3])
+        results.close()
+        self.assertEqual(out.getvalue(), "---RESULT-STACK---\n: 1\n: 2\n: 3\n")
+        self.assertEqual(len(results), 3)
+
+    def test_header_without_results(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            StreamResults().close()
+        self.assertEqual(out.getvalue(), "---RESULT-STACK---\n")
+
+    def test_owned_file_closed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.txt")
+            results = StreamResults(batch_size=2, path=path)
+            results.extend([1, 2, 3])
+            stream = results.out
+            results.close()
+            self.assertTrue(stream.closed)
+            results.close()
+            with open(path) as f:
+                self.assertEqual(f.read(), "---RESULT-STACK---\n: 1\n: 2\n: 3\n")
+
+    def test_borrowed_stream_left_open(self):
+        out = io.StringIO()
+        results = StreamResults(out)
+        results.append(1)
+        results.close()
+        self.assertFalse(out.closed)
+        self.assertEqual(out.getvalue(), "---RESULT-STACK---\n: 1\n")
+
+if __name__ == "__main__":
+    unittest.main()
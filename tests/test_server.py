@@ -0,0 +1,93 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from benchmark import RESET_ADDR, NOP, assemble, jal
+from decoder import encode_lui, encode_i, encode_r, encode_s
+from batch import load_jobs, run_job
+from server import EmulatorServer, remove_stale_socket, request_lines, submit
+
+CRC = os.path.join(os.path.dirname(__file__), "crc.bin")
+
+# Écrit "A" sur stdout puis boucle indéfiniment
+SPIN = b"\0" * RESET_ADDR + assemble([
+    encode_lui(3, 0x4000),  # x3 = 0x4000000 (périphériques)
+    encode_i(13, 0, 0b000, 1),  # addi x1, x0, 13
+    encode_r(0, 1, 1, 0b000, 2),  # add x2, x1, x1
+    encode_r(0, 2, 2, 0b000, 2),  # add x2, x2, x2
+    encode_r(0, 2, 1, 0b000, 1),  # add x1, x1, x2 : 65
+    encode_s(4, 1, 3),  # sw x1, 4(x3) : stdout
+    "loop",
+    NOP,
+    jal("loop"),
+])
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "server.sock")
+        self.spin = os.path.join(directory.name, "spin.bin")
+        with open(self.spin, "wb") as f:
+            f.write(SPIN)
+        self.server = EmulatorServer(self.path, workers=2)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.shutdown)
+
+    def test_same_result_as_batch(self):
+        jobs = load_jobs(CRC, None, 512 * 1024)
+        expected = run_job(jobs[0], 4)
+        result = submit(self.path, jobs, 4)[0]
+        for key in ("exit_reason", "instructions", "pc", "output", "result_stack"):
+            self.assertEqual(result[key], expected[key])
+
+    def test_output_before_results(self):
+        messages = list(request_lines(self.path, [{"id": 1, "binary_file": self.spin, "livrable": 4, "max_steps": 1000}]))
+        self.assertEqual([message["event"] for message in messages], ["output", "results", "done"])
+        self.assertEqual(messages[0]["data"], "A")
+        self.assertEqual(messages[2]["exit_reason"], "limit")
+
+    def test_stalled_client(self):
+        # Un client qui ne lit pas une longue pile de résultats ne retarde pas les autres connexions
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stalled:
+            stalled.connect(self.path)
+            stalled.sendall(json.dumps({"id": 1, "binary_file": self.spin, "livrable": 4, "max_steps": 200000}).encode() + b"\n")
+            stalled.settimeout(30)
+            received = b""
+            while b'"results"' not in received:  # La pile est en cours d'envoi et ne sera plus lue
+                received += stalled.recv(4096)
+            result = submit(self.path, load_jobs(CRC, None, 512 * 1024), 4)[0]
+            self.assertEqual(result["exit_reason"], "EBREAK")
+
+    def test_refuses_running_server(self):
+        with self.assertRaises(OSError):
+            EmulatorServer(self.path, workers=1)
+        self.assertEqual(submit(self.path, load_jobs(CRC, None, 512 * 1024), 4)[0]["exit_reason"], "EBREAK")
+
+class SocketPathTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "server.sock")
+
+    def test_refuses_regular_file(self):
+        with open(self.path, "w") as f:
+            f.write("data")
+        with self.assertRaises(OSError):
+            remove_stale_socket(self.path)
+        self.assertTrue(os.path.isfile(self.path))
+
+    def test_removes_stale_socket(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.path)
+        stale.close()  # La socket reste sur le disque sans service à l'écoute
+        remove_stale_socket(self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import unittest
+from unittest import mock
+from benchmark import RESET_ADDR, MEM_SIZE, kernel_alu
+from memory import Memory, PAGE_SHIFT
+from peripherals import Peripherals
+import smp
+from smp import Hart, run_smp, share_memory, unshare_memory
+
+class ShareMemoryTest(unittest.TestCase):
+    def test_device_pages_stay_on_the_bus(self):
+        peripherals = Peripherals()
+        memory = Memory(peripherals.stdout_addr + 0x2000)  # La RAM recouvre les adresses des périphériques
+        peripherals.attach(memory)
+        memory.write(0x100, 0x12345678, 4)
+        segment = share_memory(memory)
+        try:
+            self.assertNotIn(peripherals.stdout_addr >> PAGE_SHIFT, memory.pages)
+            self.assertEqual(memory.read(0x100, 4), 0x12345678)
+            memory.write(peripherals.stdout_addr, ord("x"), 4)
+            self.assertEqual(peripherals.stdout_buffer, ["x"])
+        finally:
+            unshare_memory(memory, segment)
+            peripherals.detach(memory)
+        self.assertEqual(memory.read(0x100, 4), 0x12345678)
+
+class ProcessesTest(unittest.TestCase):
+    def run_harts(self, count):
+        memory = Memory(MEM_SIZE)
+        memory.write_bytes(RESET_ADDR, kernel_alu(4096))
+        harts = [Hart(hartid, RESET_ADDR, []) for hartid in range(count)]
+        run_smp(harts, memory, Peripherals(), "processes", enable_peripherals=False, enable_semihosting=False)
+        return harts
+
+    def test_results(self):
+        harts = self.run_harts(2)
+        self.assertEqual([hart.status for hart in harts], ["EBREAK", "EBREAK"])
+        self.assertEqual(len(harts[0].results), len(harts[1].results))
+        self.assertEqual(harts[0].cpu.regs, harts[1].cpu.regs)
+
+    def test_dead_hart(self):
+        hart_process = smp.hart_process
+        def dying_hart(hart, *args):
+            if hart.cpu.hartid == 1:
+                os._exit(3)  # Sans passer par le finally de hart_process
+            hart_process(hart, *args)
+        with mock.patch.object(smp, "hart_process", dying_hart), mock.patch.object(smp, "POLL_INTERVAL", 0.05):
+            harts = self.run_harts(2)
+        self.assertEqual(harts[0].status, "EBREAK")
+        self.assertIn("code de sortie 3", harts[1].status)
+        self.assertEqual(harts[1].results, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from benchmark import RESET_ADDR, DATA_ADDR, EBREAK, NOP, assemble, beq, jal
+from decoder import encode_i, encode_s, encode_lui
+from cpu import RISCV_CPU
+from memory import Memory, PAGE_SHIFT
+from peripherals import Peripherals
+from emulator import emu_loop
+from tracer import TraceWriter, TraceReader
+
+# Écrit les octets 1 à 8 sur stdout (MMIO) et dans un tableau en RAM
+PROGRAM = assemble([
+    encode_lui(3, 0x4000),  # x3 = 0x4000000 (périphériques)
+    encode_lui(4, DATA_ADDR >> 12),
+    encode_i(1, 0, 0b000, 1),  # addi x1, x0, 1
+    encode_i(9, 0, 0b000, 2),  # addi x2, x0, 9
+    "loop",
+    encode_s(4, 1, 3),  # sw x1, 4(x3) : stdout
+    encode_s(0, 1, 4),  # sw x1, 0(x4)
+    encode_i(4, 4, 0b000, 4),  # addi x4, x4, 4
+    encode_i(1, 1, 0b000, 1),  # addi x1, x1, 1
+    beq(1, 2, "exit"),
+    NOP,
+    jal("loop"),
+    "exit",
+    EBREAK,
+])
+
+def run(tracer=None, max_steps=None, mem_size=512 * 1024):
+    cpu = RISCV_CPU()
+    memory = Memory(mem_size)
+    memory.write_bytes(RESET_ADDR, PROGRAM)
+    cpu.set_pc(RESET_ADDR)
+    peripherals = Peripherals()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        if tracer is not None:
+            tracer.start(cpu, memory, peripherals)
+        emu_loop(cpu, memory, peripherals, hooks=[tracer] if tracer is not None else [], max_steps=max_steps, halt_on_error=True)
+        if tracer is not None:
+            tracer.close(cpu)
+    return cpu, memory, output.getvalue()
+
+class TraceReplayTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cpu, memory, output = run(TraceWriter(os.path.join(directory.name, "run.trace"), chunk_records=16))
+        self.assertEqual(output, "".join(map(chr, range(1, 9))) + "EBREAK détecté\n")
+        self.reader = TraceReader(os.path.join(directory.name, "run.trace"))
+        self.addCleanup(self.reader.close)
+
+    def assert_same_state(self, n):
+        expected_cpu, expected_memory, _ = run(max_steps=n)
+        cpu, memory, peripherals = self.reader.state_at(n)
+        self.assertEqual(cpu.pc, expected_cpu.pc)
+        self.assertEqual(cpu.regs, expected_cpu.regs)
+        self.assertEqual(memory.read_bytes(DATA_ADDR, 32), expected_memory.read_bytes(DATA_ADDR, 32))
+
+    def test_state_at_skips_peripheral_stores(self):
+        for n in (0, 5, 6, 17, 30, len(self.reader) - 1):
+            self.assert_same_state(n)
+
+    def test_final_state(self):
+        cpu, memory, output = run()
+        replayed_cpu, replayed_memory, _ = self.reader.state_at(len(self.reader))
+        self.assertEqual(replayed_cpu.regs, cpu.regs)
+        self.assertEqual(replayed_memory.read_bytes(DATA_ADDR, 32), memory.read_bytes(DATA_ADDR, 32))
+
+class LargeMemoryTraceTest(unittest.TestCase):
+    def test_peripheral_stores_not_replayed_into_ram(self):
+        # Les registres des périphériques sont dans l'espace de la RAM (0x4000008 < 128 Mo)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.trace")
+            cpu, memory, output = run(TraceWriter(path, chunk_records=16), mem_size=128 << 20)
+            reader = TraceReader(path)
+            try:
+                replayed_cpu, replayed_memory, _ = reader.state_at(len(reader))
+            finally:
+                reader.close()
+        self.assertNotIn(0x4000004 >> PAGE_SHIFT, memory.pages)
+        self.assertNotIn(0x4000004 >> PAGE_SHIFT, replayed_memory.pages)
+        self.assertEqual(replayed_memory.read(0x4000004, 4), 0)
+        self.assertEqual(replayed_memory.read_bytes(DATA_ADDR, 32), memory.read_bytes(DATA_ADDR, 32))
+        self.assertEqual(replayed_cpu.regs, cpu.regs)
+
+if __name__ == "__main__":
+    unittest.main()
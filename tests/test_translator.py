@@ -0,0 +1,63 @@
+import contextlib
+import io
+import os
+import unittest
+from benchmark import RESET_ADDR, MEM_SIZE, kernel_alu, kernel_loadstore, kernel_branch, kernel_muldiv, kernel_mem_size
+from cpu import RISCV_CPU
+from memory import Memory
+from peripherals import Peripherals
+from emulator import emu_loop
+from translator import BlockTranslator
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+
+def machine(name, iterations=4096):
+    cpu = RISCV_CPU()
+    if name.endswith(".bin"):
+        memory = Memory(MEM_SIZE)
+        memory.load_program(os.path.join(TESTS, name))
+    else:
+        kernel = globals()[f"kernel_{name}"]
+        memory = Memory(kernel_mem_size(name, iterations))
+        memory.write_bytes(RESET_ADDR, kernel(iterations))
+    cpu.set_pc(RESET_ADDR)
+    return cpu, memory
+
+def run(name, translate, max_steps=None):
+    """Exécution comme le livrable 3 : (résultats, PC, registres, mémoire)."""
+    cpu, memory = machine(name)
+    translator = BlockTranslator(memory) if translate else None
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            results = emu_loop(cpu, memory, Peripherals(), enable_peripherals=False, enable_semihosting=False, translator=translator, max_steps=max_steps, halt_on_error=True)
+    finally:
+        if translator is not None:
+            translator.close()
+    return list(results), cpu.pc, list(cpu.regs), memory.read_bytes(0, memory.size), output.getvalue()
+
+class TranslatorEquivalenceTest(unittest.TestCase):
+    def assert_equivalent(self, name, max_steps=None):
+        interpreted = run(name, False, max_steps)
+        translated = run(name, True, max_steps)
+        self.assertEqual(translated[0], interpreted[0])
+        self.assertEqual(translated[1:], interpreted[1:])
+
+    def test_kernels(self):
+        for name in ("alu", "loadstore", "branch", "muldiv"):
+            with self.subTest(name):
+                self.assert_equivalent(name)
+
+    def test_sample_binaries(self):
+        for name in ("crc.bin", "md5.bin"):
+            with self.subTest(name):
+                self.assert_equivalent(name, max_steps=20000)
+
+    def test_max_steps_is_exact(self):
+        for max_steps in (1, 7, 63, 64, 65, 1000):
+            with self.subTest(max_steps):
+                self.assert_equivalent("branch", max_steps)
+                self.assertEqual(len(run("branch", True, max_steps)[0]), max_steps)
+
+if __name__ == "__main__":
+    unittest.main()
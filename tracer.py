@@ -0,0 +1,361 @@
+import argparse
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import zlib
+from cpu import RISCV_CPU
+from memory import Memory, PAGE_SHIFT
+from peripherals import Peripherals
+from snapshot import save_snapshot, load_snapshot
+from emulator import Hook, exec_load, exec_store
+
+try:
+    import numpy as np
+except ImportError:  # numpy est optionnel : repli sur struct.iter_unpack
+    np = None
+
+try:
+    import zstandard
+except ImportError:  # zstd est optionnel
+    zstandard = None
+
+# Format d'une trace :
+#   8 octets   : signature TRACE_MAGIC
+#   4 octets   : longueur de l'en-tête JSON (petit-boutiste)
+#   en-tête    : JSON {version, record_size, chunk_records, compression, snapshot}
+#   blocs      : suites de chunk_records enregistrements, compressés séparément
+#   index      : JSON {records, chunks: [[premier, offset, taille, nombre, pc, regs], ...], end: {pc, regs}}
+#   8 octets   : offset de l'index
+#   8 octets   : signature INDEX_MAGIC
+# L'état initial (mémoire comprise) est un instantané snapshot.py enregistré
+# à côté de la trace ; chaque bloc porte les registres et le PC au moment de
+# sa première instruction.
+TRACE_MAGIC = b"RVTRACE\x01"
+INDEX_MAGIC = b"RVTINDEX"
+COMPRESSIONS = ("none", "zlib", "zstd")
+CHUNK_RECORDS = 1 << 16  # Enregistrements par bloc (2 Mo non compressés)
+
+# Un enregistrement par instruction exécutée, 32 octets :
+# pc, instruction, rd, drapeaux, taille de l'accès mémoire, adresse,
+# valeur écrite dans rd (64 bits en complément à deux), valeur écrite en mémoire
+RECORD = struct.Struct("<IIBBBxIQI4x")
+FLAG_REG = 1  # Écriture de rd
+FLAG_STORE = 2  # Écriture mémoire
+FLAG_LOAD = 4  # Lecture mémoire
+MASK_32 = 0xFFFFFFFF
+MASK_64 = 0xFFFFFFFFFFFFFFFF
+
+# Opcodes qui écrivent rd : LOAD, OP_IMM, AUIPC, OP, LUI, JALR, JAL
+RD_OPCODES = frozenset((0b0000011, 0b0010011, 0b0010111, 0b0110011, 0b0110111, 0b1100111, 0b1101111))
+NO_ACCESS = (0, 0, 0, 0)  # (drapeaux, taille, adresse, valeur écrite) d'une instruction sans accès mémoire
+
+if np is not None:
+    RECORD_DTYPE = np.dtype([
+        ("pc", "<u4"), ("inst", "<u4"), ("rd", "u1"), ("flags", "u1"), ("size", "u1"), ("pad", "u1"),
+        ("address", "<u4"), ("value", "<u8"), ("mem_value", "<u4"), ("pad2", "<u4"),
+    ])
+
+def signed_64(value):
+    return value - (1 << 64) if value >> 63 else value
+
+def compressor(compression):
+    if compression == "none":
+        return None
+    if compression == "zlib":
+        return lambda data: zlib.compress(data, 1)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("La compression zstd demande le module zstandard")
+        return zstandard.ZstdCompressor(level=1).compress
+    raise ValueError(f"Compression inconnue : {compression}")
+
+def decompressor(compression):
+    if compression == "none":
+        return bytes
+    if compression == "zlib":
+        return zlib.decompress
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("La décompression zstd demande le module zstandard")
+        return zstandard.ZstdDecompressor().decompress
+    raise ValueError(f"Compression inconnue : {compression}")
+
+class TraceWriter(Hook):
+    """
+    Hook enregistrant chaque instruction exécutée dans un fichier de trace.
+    Les enregistrements sont écrits dans un tampon de chunk_records entrées ;
+    chaque tampon plein est confié à un thread d'écriture qui le compresse
+    et l'écrit pendant que l'émulation continue.
+    """
+    def __init__(self, path, compression="none", chunk_records=CHUNK_RECORDS, queue_size=4):
+        self.path = path
+        self.compression = compression
+        self.compress = compressor(compression)
+        self.chunk_records = chunk_records
+        self.snapshot_path = path + ".snap"
+        self.file = None
+        self.chunks = []  # [premier enregistrement, offset, taille, nombre, pc, regs]
+        self.records = 0
+        self.buffer = bytearray(RECORD.size * chunk_records)
+        self.count = 0  # Enregistrements dans le tampon courant
+        self.checkpoint = None  # (pc, regs) au début du tampon courant
+        self.pending = queue.Queue(queue_size)
+        self.writer = None
+        self.error = None
+
+    def start(self, cpu, memory, peripherals):
+        """Enregistre l'état initial de la machine et démarre le thread d'écriture."""
+        save_snapshot(self.snapshot_path, cpu, memory, peripherals)
+        header = json.dumps({
+            "version": 1,
+            "record_size": RECORD.size,
+            "chunk_records": self.chunk_records,
+            "compression": self.compression,
+            "snapshot": os.path.basename(self.snapshot_path),
+        }).encode()
+        self.file = open(self.path, "wb")
+        self.file.write(TRACE_MAGIC)
+        self.file.write(struct.pack("<I", len(header)))
+        self.file.write(header)
+        self.writer = threading.Thread(target=self.write_chunks, name="trace-writer", daemon=True)
+        self.writer.start()
+
+    def write_chunks(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            first, data, count, pc, regs = item
+            try:
+                if self.compress is not None:
+                    data = self.compress(data)
+                offset = self.file.tell()
+                self.file.write(data)
+                self.chunks.append([first, offset, len(data), count, pc, regs])
+            except Exception as e:
+                self.error = e
+
+    def flush_chunk(self):
+        if not self.count:
+            return
+        if self.error is not None:
+            raise self.error
+        pc, regs = self.checkpoint
+        self.pending.put((self.records - self.count, bytes(self.buffer[:self.count * RECORD.size]), self.count, pc, regs))
+        self.count = 0
+
+    def close(self, cpu):
+        """Écrit le dernier bloc et l'index ; cpu donne l'état final."""
+        if self.file is None:
+            return
+        self.flush_chunk()
+        self.pending.put(None)
+        self.writer.join()
+        index = json.dumps({
+            "records": self.records,
+            "chunks": self.chunks,
+            "end": {"pc": cpu.pc, "regs": [value & MASK_64 for value in cpu.regs]},
+        }).encode()
+        offset = self.file.tell()
+        self.file.write(index)
+        self.file.write(struct.pack("<Q", offset))
+        self.file.write(INDEX_MAGIC)
+        self.file.close()
+        self.file = None
+        if self.error is not None:
+            raise self.error
+
+    def begin(self, cpu, memory, lookup, peripherals, result_stack, enable_peripherals, enable_semihosting, ticks):
+        self.regs = cpu.regs
+
+    def before(self, pc, entry):
+        inst, handler, operands, length = entry
+        regs = self.regs
+        if not self.count:
+            self.checkpoint = (pc, [value & MASK_64 for value in regs])
+        if handler is exec_store:
+            self.access = (FLAG_STORE, 4, regs[operands[0]] + operands[2], regs[operands[1]])
+        elif handler is exec_load:
+            self.access = (FLAG_LOAD, 4, regs[operands[1]] + operands[2], 0)
+        else:
+            self.access = NO_ACCESS
+
+    def after(self, pc, entry, result):
+        inst = entry[0]
+        flags, size, address, mem_value = self.access
+        opcode = inst & 0x7F
+        rd = (inst >> 7) & 0x1F
+        if rd and (opcode in RD_OPCODES or (opcode == 0b1110011 and (inst >> 12) & 0b011)):
+            flags |= FLAG_REG
+            value = self.regs[rd] & MASK_64
+        else:
+            rd = value = 0
+        RECORD.pack_into(self.buffer, self.count * RECORD.size, pc, inst, rd, flags, size, address & MASK_32, value, mem_value & MASK_32)
+        self.count += 1
+        self.records += 1
+        if self.count == self.chunk_records:
+            self.flush_chunk()
+
+class TraceReader:
+    """
+    Lecture d'une trace projetée en mémoire (mmap). L'index des blocs permet
+    d'atteindre l'instruction n en ne décodant que le bloc qui la contient.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        image = self.image
+        if image[:len(TRACE_MAGIC)] != TRACE_MAGIC or image[-len(INDEX_MAGIC):] != INDEX_MAGIC:
+            raise ValueError(f"{path} n'est pas une trace complète")
+        header_length, = struct.unpack_from("<I", image, len(TRACE_MAGIC))
+        start = len(TRACE_MAGIC) + 4
+        self.header = json.loads(image[start:start + header_length])
+        if self.header["record_size"] != RECORD.size:
+            raise ValueError(f"Taille d'enregistrement inattendue : {self.header['record_size']}")
+        index_offset, = struct.unpack_from("<Q", image, len(image) - len(INDEX_MAGIC) - 8)
+        index = json.loads(image[index_offset:len(image) - len(INDEX_MAGIC) - 8])
+        self.records = index["records"]
+        self.chunks = index["chunks"]
+        self.end = index["end"]
+        self.chunk_records = self.header["chunk_records"]
+        self.decompress = decompressor(self.header["compression"])
+        self.snapshot_path = os.path.join(os.path.dirname(os.path.abspath(path)), self.header["snapshot"])
+
+    def __len__(self):
+        return self.records
+
+    def close(self):
+        self.image.close()
+
+    def chunk_data(self, chunk):
+        first, offset, length, count, pc, regs = self.chunks[chunk]
+        if self.header["compression"] == "none":
+            return memoryview(self.image)[offset:offset + length]  # Sans copie
+        return self.decompress(self.image[offset:offset + length])
+
+    def chunk_records_array(self, chunk):
+        """Enregistrements d'un bloc : tableau structuré numpy, ou liste de tuples sans numpy."""
+        data = self.chunk_data(chunk)
+        if np is not None:
+            return np.frombuffer(data, dtype=RECORD_DTYPE)
+        return list(RECORD.iter_unpack(data))
+
+    def record(self, n):
+        """Enregistrement n : (pc, inst, rd, flags, size, address, value, mem_value)."""
+        if not 0 <= n < self.records:
+            raise IndexError(f"Instruction {n} hors de la trace ({self.records} instructions)")
+        chunk = n // self.chunk_records
+        data = self.chunk_data(chunk)
+        pc, inst, rd, flags, size, address, value, mem_value = RECORD.unpack_from(data, (n - self.chunks[chunk][0]) * RECORD.size)
+        return pc, inst, rd, flags, size, address, signed_64(value), mem_value
+
+    def registers_at(self, n):
+        """PC et registres avant l'exécution de l'instruction n (n = len : état final)."""
+        if not 0 <= n <= self.records:
+            raise IndexError(f"Instruction {n} hors de la trace ({self.records} instructions)")
+        if n == self.records:
+            return self.end["pc"], [signed_64(value) for value in self.end["regs"]]
+        chunk = n // self.chunk_records
+        first, offset, length, count, pc, regs = self.chunks[chunk]
+        regs = list(regs)
+        records = self.chunk_records_array(chunk)[:n - first]
+        if np is not None:
+            writes = records[(records["flags"] & FLAG_REG) != 0]
+            # Dernière écriture de chaque registre : premier rang dans l'ordre inverse
+            rds, last = np.unique(writes["rd"][::-1], return_index=True)
+            values = writes["value"][::-1][last]
+            for rd, value in zip(rds.tolist(), values.tolist()):
+                regs[rd] = value
+        else:
+            for record in records:
+                if record[3] & FLAG_REG:
+                    regs[record[2]] = record[6]
+        return self.record(n)[0], [signed_64(value) for value in regs]
+
+    def apply_stores(self, memory, n):
+        """
+        Rejoue dans memory les écritures en RAM des instructions 0 à n - 1.
+        Les écritures aux périphériques (hors de la RAM ou sur une page de
+        memory.devices) ont produit leur effet pendant l'exécution : elles ne
+        sont pas rejouées. Les périphériques doivent donc être attachés à
+        memory (voir state_at), sans quoi leurs adresses sont prises pour de la RAM.
+        """
+        limit = memory.size - 4  # Dernière adresse d'un mot entièrement en RAM
+        devices = memory.devices
+        for chunk, (first, offset, length, count, pc, regs) in enumerate(self.chunks):
+            if first >= n:
+                break
+            records = self.chunk_records_array(chunk)[:n - first]
+            if np is not None:
+                stores = records[(records["flags"] & FLAG_STORE) != 0]
+                stores = stores[stores["address"] <= limit]
+                for address, value in zip(stores["address"].tolist(), stores["mem_value"].tolist()):
+                    if address >> PAGE_SHIFT not in devices:
+                        memory.write(address, value, 4)
+            else:
+                for record in records:
+                    if record[3] & FLAG_STORE and record[5] <= limit and record[5] >> PAGE_SHIFT not in devices:
+                        memory.write(record[5], record[7], 4)
+
+    def state_at(self, n):
+        """Reconstruit la machine avant l'instruction n sans réexécuter le programme : (cpu, memory, peripherals)."""
+        cpu = RISCV_CPU()
+        memory = Memory(0)
+        peripherals = Peripherals()
+        load_snapshot(self.snapshot_path, cpu, memory, peripherals)
+        peripherals.attach(memory)
+        try:
+            self.apply_stores(memory, n)
+        finally:
+            peripherals.detach(memory)
+        pc, regs = self.registers_at(n)
+        cpu.regs[:] = regs
+        cpu.set_pc(pc)
+        return cpu, memory, peripherals
+
+def main():
+    parser = argparse.ArgumentParser(description="Relecture d'une trace d'exécution RISC-V")
+    parser.add_argument("trace", type=str, help="Fichier de trace enregistré avec --trace")
+    parser.add_argument("--at", type=int, default=None, help="Reconstruire l'état avant l'instruction N (défaut : état final)")
+    parser.add_argument("--list", type=str, default=None, metavar="DEBUT:FIN", help="Afficher les enregistrements DEBUT à FIN - 1")
+    parser.add_argument("--dump", type=str, default=None, metavar="ADRESSE:LONGUEUR", help="Afficher la mémoire reconstruite")
+    parser.add_argument("--save-snapshot", type=str, default=None, metavar="FICHIER", help="Enregistrer l'état reconstruit comme instantané (utilisable avec main.py --snapshot)")
+    args = parser.parse_args()
+
+    reader = TraceReader(args.trace)
+    print(f"{len(reader)} instructions, {len(reader.chunks)} blocs, compression {reader.header['compression']}")
+    if args.list:
+        start, end = (int(value, 0) for value in args.list.split(":"))
+        for n in range(max(start, 0), min(end, len(reader))):
+            pc, inst, rd, flags, size, address, value, mem_value = reader.record(n)
+            line = f"{n:>10} {pc:08x}: {inst:08x}"
+            if flags & FLAG_REG:
+                line += f"  x{rd} = {value:#x}"
+            if flags & FLAG_STORE:
+                line += f"  [{address:08x}] <- {mem_value:#010x}"
+            elif flags & FLAG_LOAD:
+                line += f"  [{address:08x}]"
+            print(line)
+    n = len(reader) if args.at is None else args.at
+    if args.at is not None or args.dump or args.save_snapshot:
+        cpu, memory, peripherals = reader.state_at(n)
+        print(f"---ETAT--- instruction {n}")
+        print(f"PC: {cpu.pc:#x}")
+        for i in range(0, 32, 4):
+            print("  ".join(f"x{j:<2}: {cpu.regs[j]:#010x}" for j in range(i, i + 4)))
+        if args.dump:
+            address, length = (int(value, 0) for value in args.dump.split(":"))
+            data = memory.read_bytes(address, length)
+            for offset in range(0, length, 16):
+                print(f"{address + offset:08x}: {data[offset:offset + 16].hex(' ')}")
+        if args.save_snapshot:
+            save_snapshot(args.save_snapshot, cpu, memory, peripherals)
+            print(f"Instantané enregistré dans {args.save_snapshot}")
+    reader.close()
+
+if __name__ == "__main__":
+    main()
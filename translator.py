@@ -0,0 +1,271 @@
+from memory import PAGE_SHIFT
+from emulator import DecodeCache, execute_instruction, muldiv, fields_load, fields_store, fields_branch, fields_jalr, fields_jal, fields_u, fields_op_imm, fields_op
+
+MAX_BLOCK_LEN = 64  # Nombre maximal d'instructions par bloc
+
+# Opcodes qui terminent un bloc de base
+BLOCK_END_OPCODES = (0b1100011, 0b1100111, 0b1101111)  # BRANCH, JALR, JAL
+
+def reg(index):
+    """Expression Python lisant un registre (x0 vaut toujours 0)."""
+    return "0" if index == 0 else f"R[{index}]"
+
+def op_imm_expr(rs1, imm, funct3, funct7):
+    x = reg(rs1)
+    if funct3 == 0b000:  # ADDI
+        return f"{x} + {imm}"
+    elif funct3 == 0b010 or funct3 == 0b011:  # SLTI/SLTIU
+        return f"1 if {x} < {imm} else 0"
+    elif funct3 == 0b100:  # XORI
+        return f"{x} ^ {imm}"
+    elif funct3 == 0b110:  # ORI
+        return f"{x} | {imm}"
+    elif funct3 == 0b111:  # ANDI
+        return f"{x} & {imm}"
+    elif funct3 == 0b001:  # SLLI
+        return f"{x} << {imm}"
+    elif funct3 == 0b101 and funct7 == 0b0000000:  # SRLI
+        return f"{x} >> {imm}"
+    elif funct3 == 0b101 and funct7 == 0b0100000:  # SRAI
+        return f"({x} >> {imm}) | (({x} & {1 << (32 - imm)}) >> {32 - imm})"
+    return None
+
+def op_expr(rs1, rs2, funct3, funct7):
+    x, y = reg(rs1), reg(rs2)
+    if funct7 == 0b0000001:  # Extension M
+        if funct3 == 0b000:  # MUL
+            return f"({x} * {y}) & 0xFFFFFFFF"
+        return f"muldiv({funct3}, {x}, {y})"
+    elif funct3 == 0b000 and funct7 == 0b0000000:  # ADD
+        return f"{x} + {y}"
+    elif funct3 == 0b000 and funct7 == 0b0100000:  # SUB
+        return f"{x} - {y}"
+    elif funct3 == 0b001:  # SLL
+        return f"{x} << {y}"
+    elif funct3 == 0b010 or funct3 == 0b011:  # SLT/SLTU
+        return f"1 if {x} < {y} else 0"
+    elif funct3 == 0b100:  # XOR
+        return f"{x} ^ {y}"
+    elif funct3 == 0b101 and funct7 == 0b0000000:  # SRL
+        return f"{x} >> {y}"
+    elif funct3 == 0b101 and funct7 == 0b0100000:  # SRA
+        return f"({x} >> {y}) | (({x} & (1 << (32 - {y}))) >> (32 - {y}))"
+    elif funct3 == 0b110:  # OR
+        return f"{x} | {y}"
+    elif funct3 == 0b111:  # AND
+        return f"{x} & {y}"
+    return None
+
+def translate_instruction(inst, pc, k, size=4):
+    """
+    Traduit une instruction de size octets (2 pour une instruction compressée,
+    inst étant alors son équivalent de 32 bits) en lignes de code Python.
+    Le résultat de l'instruction (valeur empilée par emu_loop) est rangé dans r{k}.
+    Retourne (lignes, accès mémoire, PC suivant) ; lignes vaut None si
+    l'instruction n'est pas traduisible. Pour une instruction de fin de bloc,
+    le PC suivant est une expression Python.
+    """
+    opcode = inst & 0x7F
+    r = f"r{k}"
+    if opcode == 0b0000011:  # LOAD
+        rd, rs1, imm = fields_load(inst)
+        lines = [f"{r} = read({reg(rs1)} + {imm}, 4)"]
+        if rd:
+            lines.append(f"R[{rd}] = {r}")
+        return lines, True, pc + size
+    elif opcode == 0b0100011:  # STORE
+        rs1, rs2, imm = fields_store(inst)
+        return [f"{r} = {reg(rs2)}", f"write({reg(rs1)} + {imm}, {r}, 4)"], True, pc + size
+    elif opcode == 0b1100011:  # BRANCH
+        rs1, rs2, imm = fields_branch(inst)
+        # emu_loop ajoute la longueur de l'instruction après le PC fixé par execute_branch
+        return [f"{r} = {imm}"], False, f"{pc + imm + size} if {reg(rs1)} == {reg(rs2)} else {pc + 2 * size}"
+    elif opcode == 0b1100111:  # JALR
+        rd, rs1, imm = fields_jalr(inst)
+        lines = [f"{r} = {pc + size}"]
+        if rd:
+            lines.append(f"R[{rd}] = {r}")
+        return lines, False, f"(({reg(rs1)} + {imm}) & 0xFFFFFFFE) + {size}"
+    elif opcode == 0b1101111:  # JAL
+        rd, imm = fields_jal(inst)
+        lines = [f"{r} = {pc + size}"]
+        if rd:
+            lines.append(f"R[{rd}] = {r}")
+        return lines, False, str(((pc + imm) & 0xFFFFFFFE) + size)
+    elif opcode == 0b0110111 or opcode == 0b0010111:  # LUI/AUIPC
+        rd, imm = fields_u(inst)
+        value = imm << 12 if opcode == 0b0110111 else pc + imm
+        lines = [f"{r} = {value}"]
+    elif opcode == 0b0010011:  # OP_IMM
+        rd, rs1, imm, funct3, funct7 = fields_op_imm(inst)
+        expr = op_imm_expr(rs1, imm, funct3, funct7)
+        if expr is None:
+            return None, False, pc + size
+        lines = [f"{r} = {expr}"]
+    elif opcode == 0b0110011:  # OP
+        rd, rs1, rs2, funct3, funct7 = fields_op(inst)
+        expr = op_expr(rs1, rs2, funct3, funct7)
+        if expr is None:
+            return None, False, pc + size
+        lines = [f"{r} = {expr}"]
+    else:
+        return None, False, pc + size
+    if rd:
+        lines.append(f"R[{rd}] = {r}")
+    return lines, False, pc + size
+
+class Block:
+    def __init__(self, start, end, length, fn, alive):
+        self.start = start
+        self.end = end  # adresse qui suit la dernière instruction du bloc
+        self.length = length  # nombre d'instructions du bloc
+        self.fn = fn
+        self.alive = alive
+        self.links = {}  # PC de sortie -> bloc successeur
+
+class BlockTranslator:
+    """
+    Traduit le code invité par blocs de base en fonctions Python compilées.
+    Un bloc s'arrête sur BRANCH/JAL/JALR ou avant la première instruction non
+    traduisible (SYSTEM, instruction inconnue), qui reste exécutée par
+    l'interpréteur. Chaque bloc met à jour les registres en bloc, empile les
+    résultats de toutes ses instructions en une fois et retourne le PC suivant
+    avec le nombre d'instructions exécutées.
+    """
+    def __init__(self, memory, compressed=False):
+        self.memory = memory
+        self.cache = DecodeCache(memory, compressed)  # Lecture (et expansion des instructions compressées) des instructions
+        self.blocks = {}  # PC -> Block, ou False si l'instruction doit être interprétée
+        self.pages = {}  # page -> ensemble des PC de début de bloc
+        memory.add_code_watcher(self)
+
+    def close(self):
+        self.cache.close()
+        self.memory.remove_code_watcher(self)
+
+    def invalidate_page(self, page):
+        for pc in self.pages.pop(page, ()):
+            block = self.blocks.pop(pc, None)
+            if block:
+                block.alive[0] = False
+
+    def lookup(self, pc):
+        block = self.blocks.get(pc)
+        if block is None:
+            block = self.translate(pc)
+            self.blocks[pc] = block
+            end = block.end if block else pc + 4
+            for page in range(pc >> PAGE_SHIFT, ((end - 1) >> PAGE_SHIFT) + 1):
+                self.pages.setdefault(page, set()).add(pc)
+                self.memory.code_pages.add(page)
+        return block
+
+    def translate(self, start):
+        body = []
+        faults = []  # (indice de l'instruction, PC) pour chaque accès mémoire
+        pc = start
+        k = 0
+        exit_pc = None
+        while k < MAX_BLOCK_LEN:
+            try:
+                inst, _, _, size = self.cache.lookup(pc)
+            except MemoryError:
+                break
+            lines, is_memory, next_pc = translate_instruction(inst, pc, k, size)
+            if lines is None:
+                break
+            if is_memory:
+                faults.append((k, pc))
+                body.append(f"at = {k}")
+            body.extend(lines)
+            k += 1
+            if (inst & 0x7F) == 0b0100011:  # STORE : le bloc a pu être modifié
+                body.append("if not alive[0]:")
+                body.append(f"    emit(({results(k)}))")
+                body.append(f"    return {pc + size}, {k}")
+            if (inst & 0x7F) in BLOCK_END_OPCODES:
+                exit_pc = next_pc
+                pc += size
+                break
+            pc = next_pc
+        if k == 0:
+            return False
+        if exit_pc is None:
+            exit_pc = str(pc)
+
+        src = [f"def block_{start:x}(cpu, R, emit, read=read, write=write, alive=alive):"]
+        if faults:
+            src.append("    at = 0")
+            src.append("    try:")
+            src.extend("        " + line for line in body)
+            src.append("    except MemoryError as e:")
+            for index, fault_pc in faults:
+                src.append(f"        if at == {index}:")
+                src.append(f"            emit(({results(index)}))")
+                src.append(f"            cpu.pc = {fault_pc}")
+                src.append(f"            e.executed = {index + 1}")
+            src.append("        raise")
+        else:
+            src.extend("    " + line for line in body)
+        src.append(f"    emit(({results(k)}))")
+        src.append(f"    return {exit_pc}, {k}")
+
+        alive = [True]
+        namespace = {"read": self.memory.read, "write": self.memory.write, "alive": alive, "muldiv": muldiv}
+        exec(compile("\n".join(src), f"<block {start:#x}>", "exec"), namespace)
+        return Block(start, pc, k, namespace[f"block_{start:x}"], alive)
+
+    def run(self, cpu, peripherals, result_stack, enable_peripherals, enable_semihosting, max_steps=None):
+        """
+        Exécute le programme bloc par bloc, au plus max_steps instructions (None :
+        sans limite) ; retourne "EBREAK" à l'arrêt, None quand la limite est
+        atteinte. Un bloc plus long que le budget restant est interprété
+        instruction par instruction pour s'arrêter exactement à la limite.
+        self.executed : nombre d'instructions exécutées par cet appel, à jour
+        même si une exception l'interrompt.
+        """
+        regs = cpu.regs
+        emit = result_stack.extend
+        lookup = self.lookup
+        block_flush = peripherals is not None and peripherals.flush_policy == "block"
+        limit = float("inf") if max_steps is None else max_steps
+        executed = 0
+        try:
+            block = lookup(cpu.pc)
+            while executed < limit:
+                if block and executed + block.length <= limit:
+                    pc, count = block.fn(cpu, regs, emit)
+                    executed += count
+                    cpu.pc = pc
+                    if block_flush:
+                        peripherals.flush()
+                    links = block.links
+                    successor = links.get(pc)
+                    if successor is None or not successor.alive[0]:
+                        successor = lookup(pc)
+                        if successor:
+                            links[pc] = successor
+                    block = successor
+                else:
+                    inst, handler, operands, size = self.cache.lookup(cpu.pc)
+                    executed += 1
+                    if handler is None:
+                        result = execute_instruction(cpu, self.memory, inst, peripherals, enable_peripherals, enable_semihosting)
+                        if result == "EBREAK":
+                            return result
+                    else:
+                        result = handler(cpu, self.memory, *operands)
+                    result_stack.append(result)
+                    cpu.pc += size
+                    # Près de la limite, pas de nouvelle traduction pour quelques instructions
+                    block = lookup(cpu.pc) if executed + MAX_BLOCK_LEN <= limit else self.blocks.get(cpu.pc)
+            return None
+        except MemoryError as e:
+            executed += getattr(e, "executed", 0)  # instructions du bloc jusqu'à la faute incluse
+            raise
+        finally:
+            self.executed = executed
+
+def results(count):
+    """Tuple Python des résultats r0..r{count-1}."""
+    return "".join(f"r{i}, " for i in range(count))